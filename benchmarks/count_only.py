@@ -0,0 +1,69 @@
+"""
+Compares `len(tokenizer.encode(text))` with the count-only `count_tokens` path.
+
+Usage: python -m benchmarks.count_only [--size-kb 128] [--repeat 20]
+
+Allocations are measured with `tracemalloc`, i.e. Python heap only.
+OpenAI models are skipped when their tiktoken encoding can't be loaded (offline).
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from totokenizers.factories import Totokenizer
+
+MODELS = ["anthropic/claude-2.1", "openai/gpt-4o", "openai/gpt-4", "mockai/always-chat"]
+WORDS = "the quick brown fox jumps over a lazy dog , . 2024 ünïcödé 東京 \n".split(" ")
+
+
+def synthetic_text(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        parts.append(word)
+        length += len(word) + 1
+    return " ".join(parts)
+
+
+def measure(func, repeat: int) -> tuple[float, int]:
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-kb", type=int, default=128)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    text = synthetic_text(args.size_kb * 1024)
+
+    print(f"{'model':28} {'path':16} {'ms':>9} {'peak KiB':>10}")
+    for model in MODELS:
+        try:
+            tokenizer = Totokenizer.from_model(model)
+        except Exception as e:
+            print(f"{model:28} skipped ({type(e).__name__})")
+            continue
+        paths = {
+            "len(encode)": lambda: len(tokenizer.encode(text)),
+            "count_tokens": lambda: tokenizer.count_tokens(text),
+        }
+        for name, func in paths.items():
+            elapsed, peak = measure(func, args.repeat)
+            print(f"{model:28} {name:16} {elapsed * 1e3:9.2f} {peak / 1024:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
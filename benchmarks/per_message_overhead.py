@@ -0,0 +1,112 @@
+"""
+Per-call overhead of the constant strings in the chat counting hot paths.
+
+Usage: python -m benchmarks.per_message_overhead [--repeat 20000]
+
+"before" re-encodes the constants on every call (roles, "\\n\\nassistant:",
+`tiktoken.encoding_for_model` for tools), as the tokenizers used to;
+"after" uses the tables they now build at init.
+OpenAI models are skipped when their tiktoken encoding can't be loaded (offline).
+"""
+
+import argparse
+import time
+
+import tiktoken
+
+from totokenizers.factories import Totokenizer
+
+MESSAGE = {"content": "Hi!", "role": "user"}
+TOOL_CALL = {
+    "content": None,
+    "role": "assistant",
+    "tool_calls": [
+        {"type": "function", "function": {"name": "now", "arguments": "{}"}},
+    ],
+}
+
+
+def per_call_ns(func, repeat: int) -> float:
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e9
+
+
+def openai_cases(tokenizer):
+    def message_before():
+        return (
+            tokenizer.tokens_per_message
+            + len(tokenizer.encode(MESSAGE["content"]))
+            + len(tokenizer.encode(MESSAGE["role"]))
+        )
+
+    def tools_before():
+        encoding = tiktoken.encoding_for_model(tokenizer.model)
+        num_tokens = 0
+        for tool in [TOOL_CALL]:
+            if content := tool.get("content"):
+                num_tokens += tokenizer.count_tokens(content)
+            elif tool_calls := tool.get("tool_calls"):
+                for call in tool_calls:
+                    num_tokens += tokenizer.func_init
+                    function = call["function"]
+                    line = f"{function['name']}:{function['arguments']}"
+                    num_tokens += len(encoding.encode(line))
+        return num_tokens + tokenizer.func_end
+
+    return {
+        "count_message_tokens": (
+            message_before,
+            lambda: tokenizer.count_message_tokens(MESSAGE),
+        ),
+        "count_tools_tokens": (
+            tools_before,
+            lambda: tokenizer.count_tools_tokens([TOOL_CALL]),
+        ),
+    }
+
+
+def anthropic_cases(tokenizer):
+    chat = [MESSAGE]
+    return {
+        "count_chatml_prompt_tokens": (
+            lambda: tokenizer.count_chatml_tokens(chat)
+            + tokenizer.count_tokens("\n\nassistant:")
+            + 1,
+            lambda: tokenizer.count_chatml_prompt_tokens(chat),
+        ),
+        "count_completion_tokens": (
+            lambda: tokenizer.count_tokens("\n\nassistant:")
+            + tokenizer.count_tokens("Hi!"),
+            lambda: tokenizer.count_completion_tokens("Hi!"),
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=20_000)
+    args = parser.parse_args()
+
+    print(f"{'model':24} {'method':28} {'before ns':>10} {'after ns':>10}")
+    for model, cases in [
+        ("openai/gpt-4o", openai_cases),
+        ("openai/gpt-4", openai_cases),
+        ("anthropic/claude-2.1", anthropic_cases),
+    ]:
+        try:
+            tokenizer = Totokenizer.from_model(model)
+        except Exception as e:
+            print(f"{model:24} skipped ({type(e).__name__})")
+            continue
+        for method, (before, after) in cases(tokenizer).items():
+            assert before() == after(), method
+            before_ns = per_call_ns(before, args.repeat)
+            after_ns = per_call_ns(after, args.repeat)
+            print(f"{model:24} {method:28} {before_ns:10.0f} {after_ns:10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Offline benchmark suite of every counting path, compared against a stored baseline.
+
+Usage: python -m benchmarks.suite [--output results.json] [--baseline benchmarks/baseline.json]
+    [--threshold 0.25] [--update-baseline] [--filter count_chatml] [--quick]
+
+Inputs are synthetic and seeded: text, chats of several sizes, function catalogs
+(nested objects, arrays, enums, defaults, shared `$ref`s) and tool-call threads.
+Tokenizers are mockai, the bundled Anthropic one, and OpenAI models whose tiktoken
+encoding is already cached locally; the network is blocked while loading them.
+
+Each case is timed in `--repeat` samples of enough calls to last `--min-time`
+seconds, and the fastest sample is kept (the least disturbed by other load).
+Cases more than `--threshold` slower than the baseline are reported as
+regressions, and the exit code is then 1. Baselines are machine dependent:
+regenerate them with `--update-baseline` on the reference machine.
+"""
+
+import argparse
+import contextlib
+import json
+import platform
+import random
+import socket
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Iterator
+
+import tiktoken
+import tokenizers
+
+from totokenizers.factories import Totokenizer
+from totokenizers.jsonschema_formatter import FunctionJSONSchema
+
+MODELS = ["mockai/always-func", "anthropic/claude-2.1", "openai/gpt-4o", "openai/gpt-4"]
+BASELINE = Path(__file__).with_name("baseline.json")
+WORDS = "the quick brown fox jumps over a lazy dog , . 2024 ünïcödé 東京 \n".split(" ")
+CHAT_SIZES = {"small": (4, 20), "medium": (16, 100), "large": (64, 400)}  # messages, words
+CATALOG_SIZES = [1, 8, 32]
+
+
+def synthetic_text(rng: random.Random, num_words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(num_words))
+
+
+def synthetic_chat(rng: random.Random, num_messages: int, num_words: int) -> list[dict]:
+    chat = [{"role": "system", "content": synthetic_text(rng, num_words)}]
+    for i in range(num_messages - 1):
+        role = "user" if i % 2 == 0 else "assistant"
+        chat.append({"role": role, "content": synthetic_text(rng, rng.randint(1, 2 * num_words))})
+    return chat
+
+
+def synthetic_function(rng: random.Random, index: int) -> dict:
+    properties = {
+        "query": {"type": "string", "description": synthetic_text(rng, 12)},
+        "limit": {"type": "integer", "description": "Maximum results.", "default": 10},
+        "threshold": {"type": "number", "description": "Minimum score.", "default": 0.5},
+        "mode": {"type": "string", "enum": ["fast", "exact", "fuzzy"]},
+        "tags": {"type": "array", "items": {"type": "string"}},
+        "filter": {"$ref": "#/definitions/Filter"},
+        "options": {
+            "type": "object",
+            "properties": {
+                "verbose": {"type": "string", "enum": ["yes", "no"]},
+                "ranges": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"start": {"type": "number"}, "end": {"type": "number"}},
+                    },
+                },
+            },
+        },
+    }
+    return {
+        "name": f"function_{index}",
+        "description": synthetic_text(rng, 24),
+        "parameters": {
+            "type": "object",
+            "properties": properties,
+            "required": ["query", "mode"],
+            "definitions": {
+                "Filter": {
+                    "type": "object",
+                    "properties": {"field": {"type": "string"}, "value": {"type": "string"}},
+                }
+            },
+        },
+    }
+
+
+def synthetic_shared_definitions_function(rng: random.Random, num_properties: int) -> dict:
+    """A function whose properties all refer to nested, shared definitions."""
+    address = {
+        "type": "object",
+        "properties": {
+            field: {"type": "string", "description": synthetic_text(rng, 6)}
+            for field in ("street", "number", "city", "region", "country", "postal_code")
+        },
+    }
+    person = {
+        "type": "object",
+        "properties": {
+            "name": {"type": "string"},
+            "home": {"$ref": "#/definitions/Address"},
+            "work": {"$ref": "#/definitions/Address"},
+            "tags": {"type": "array", "items": {"type": "string"}},
+        },
+    }
+    return {
+        "name": "register_people",
+        "description": synthetic_text(rng, 24),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                f"person_{i}": {"$ref": "#/definitions/Person"} for i in range(num_properties)
+            },
+            "definitions": {"Address": address, "Person": person},
+        },
+    }
+
+
+def synthetic_tool_thread(rng: random.Random, num_calls: int) -> list[dict]:
+    thread = []
+    for i in range(num_calls):
+        arguments = json.dumps({"query": synthetic_text(rng, 8), "limit": i})
+        thread.append(
+            {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {"type": "function", "function": {"name": f"function_{i}", "arguments": arguments}}
+                ],
+            }
+        )
+        thread.append({"role": "tool", "name": f"function_{i}", "content": synthetic_text(rng, 60)})
+    return thread
+
+
+def cases(tokenizer) -> Iterator[tuple[str, Callable[[], object]]]:
+    rng = random.Random(0)
+    for size in (1024, 64 * 1024):
+        text = synthetic_text(rng, size // 5)
+        yield f"count_tokens/{size // 1024}k", lambda text=text: tokenizer.count_tokens(text)
+    chats = {name: synthetic_chat(rng, *shape) for name, shape in CHAT_SIZES.items()}
+    for name, chat in chats.items():
+        yield f"count_chatml_tokens/{name}", lambda chat=chat: tokenizer.count_chatml_tokens(chat)
+    if not hasattr(tokenizer, "count_functions_tokens"):
+        return
+    catalogs = {n: [synthetic_function(rng, i) for i in range(n)] for n in CATALOG_SIZES}
+    for n, functions in catalogs.items():
+        yield (
+            f"count_functions_tokens/{n}",
+            lambda functions=functions: tokenizer.count_functions_tokens(functions),
+        )
+    yield (
+        "count_chatml_tokens/medium+functions/8",
+        lambda: tokenizer.count_chatml_tokens(chats["medium"], catalogs[8]),
+    )
+    if hasattr(tokenizer, "count_tools_tokens"):
+        for n in (1, 16):
+            thread = synthetic_tool_thread(rng, n)
+            yield f"count_tools_tokens/{n}", lambda thread=thread: tokenizer.count_tools_tokens(thread)
+
+
+def schema_cases() -> Iterator[tuple[str, Callable[[], object]]]:
+    rng = random.Random(1)
+    for n in CATALOG_SIZES:
+        schema = FunctionJSONSchema([synthetic_function(rng, i) for i in range(n)])
+        yield f"to_typescript/{n}", schema.to_typescript
+    schema = FunctionJSONSchema([synthetic_shared_definitions_function(rng, 32)])
+    yield "to_typescript/shared_definitions", schema.to_typescript
+
+
+def time_case(func: Callable[[], object], repeat: int, min_time: float) -> dict:
+    func()
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9)))
+    samples = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        samples.append((time.perf_counter() - start) / loops)
+    return {
+        "ns_per_call": round(min(samples) * 1e9, 1),
+        "median_ns": round(statistics.median(samples) * 1e9, 1),
+        "loops": loops,
+        "repeat": repeat,
+    }
+
+
+@contextlib.contextmanager
+def no_network():
+    """Fails connections fast, so only locally cached tiktoken encodings load."""
+
+    def connect(*args, **kwargs):
+        raise OSError("network disabled by benchmarks.suite")
+
+    original = socket.socket.connect
+    socket.socket.connect = connect
+    try:
+        yield
+    finally:
+        socket.socket.connect = original
+
+
+def load_tokenizer(model: str):
+    with no_network():
+        try:
+            return Totokenizer.from_model(model)
+        except Exception as e:
+            print(f"{model:24} skipped ({type(e).__name__})", file=sys.stderr)
+            return None
+
+
+def collect_cases(filter: str | None) -> dict[str, Callable[[], object]]:
+    all_cases = {f"FunctionJSONSchema/{name}": func for name, func in schema_cases()}
+    for model in MODELS:
+        tokenizer = load_tokenizer(model)
+        if tokenizer is not None:
+            all_cases.update((f"{model}/{name}", func) for name, func in cases(tokenizer))
+    return {name: func for name, func in all_cases.items() if not filter or filter in name}
+
+
+def run(all_cases: dict[str, Callable[[], object]], repeat: int, min_time: float) -> dict:
+    results = {}
+    for name, func in all_cases.items():
+        results[name] = time_case(func, repeat, min_time)
+        print(f"{name:60} {results[name]['ns_per_call'] / 1e3:12.2f} us", file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "tiktoken": tiktoken.__version__,
+            "tokenizers": tokenizers.__version__,
+        },
+        "results": results,
+    }
+
+
+def regressed(current: dict, baseline: dict, threshold: float) -> list[str]:
+    return [
+        name
+        for name, result in current["results"].items()
+        if name in baseline["results"]
+        and result["ns_per_call"] > (1 + threshold) * baseline["results"][name]["ns_per_call"]
+    ]
+
+
+def report(current: dict, baseline: dict, threshold: float):
+    print(f"{'case':60} {'baseline us':>12} {'current us':>12} {'ratio':>7}")
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:60} {'-':>12} {result['ns_per_call'] / 1e3:12.2f}")
+            continue
+        ratio = result["ns_per_call"] / base["ns_per_call"]
+        flag = "  REGRESSION" if ratio > 1 + threshold else ""
+        print(
+            f"{name:60} {base['ns_per_call'] / 1e3:12.2f} "
+            f"{result['ns_per_call'] / 1e3:12.2f} {ratio:7.2f}{flag}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", default=str(BASELINE))
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown")
+    parser.add_argument("--retries", type=int, default=2, help="re-timings of regressed cases")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--filter", help="only run cases containing this string")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.02, help="seconds per sample")
+    parser.add_argument("--quick", action="store_true", help="3 short samples per case")
+    args = parser.parse_args()
+    if args.quick:
+        args.repeat, args.min_time = 3, 0.005
+
+    all_cases = collect_cases(args.filter)
+    current = run(all_cases, args.repeat, args.min_time)
+    baseline_path = Path(args.baseline)
+    baseline = None
+    if baseline_path.exists() and not args.update_baseline:
+        baseline = json.loads(baseline_path.read_text())
+        # a noisy neighbour can slow down a sample, so confirm regressions
+        for _ in range(args.retries):
+            names = regressed(current, baseline, args.threshold)
+            if not names:
+                break
+            print(f"re-timing {len(names)} cases", file=sys.stderr)
+            retry = run({name: all_cases[name] for name in names}, args.repeat, args.min_time)
+            for name, result in retry["results"].items():
+                if result["ns_per_call"] < current["results"][name]["ns_per_call"]:
+                    current["results"][name] = result
+    if args.output:
+        Path(args.output).write_text(json.dumps(current, indent=2) + "\n")
+    if args.update_baseline:
+        if args.filter and baseline_path.exists():
+            # keep the baseline of the cases that were not run
+            results = json.loads(baseline_path.read_text())["results"]
+            current = {"meta": current["meta"], "results": {**results, **current["results"]}}
+        baseline_path.write_text(json.dumps(current, indent=2) + "\n")
+        print(f"baseline written to {baseline_path}", file=sys.stderr)
+        return
+    if baseline is None:
+        print(f"no baseline at {baseline_path}, run with --update-baseline", file=sys.stderr)
+        return
+    report(current, baseline, args.threshold)
+    missing = sorted(set(baseline["results"]) - set(all_cases))
+    if missing and not args.filter:
+        print(f"not run (model unavailable): {', '.join(missing)}")
+    regressions = regressed(current, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regressions above {args.threshold:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
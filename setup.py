@@ -53,5 +53,6 @@ setuptools.setup(
     install_requires=requirements,
     extras_require=extra_requirements,
     package_data={"": ["*.json"]},
+    entry_points={"console_scripts": ["totokenizers=totokenizers.cli:main"]},
     zip_safe=True,
 )
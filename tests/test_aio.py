@@ -0,0 +1,85 @@
+import asyncio
+import threading
+
+import pytest
+
+from totokenizers import aio
+from totokenizers.factories import Totokenizer
+
+
+@pytest.fixture
+def small_pool(monkeypatch: pytest.MonkeyPatch):
+    # restore the module's defaults afterwards
+    for name in ("_max_workers", "_inline_threshold", "_max_pending"):
+        monkeypatch.setattr(aio, name, getattr(aio, name))
+    monkeypatch.setattr(aio, "_executor", None)
+    aio.configure(max_workers=2, inline_threshold=64, max_pending=2)
+    yield
+    aio._executor.shutdown()
+    aio._semaphores.clear()
+
+
+@pytest.mark.parametrize("model_tag", ["anthropic/claude-2.1", "mockai/always-func"])
+def test_async_counts_match(model_tag: str, small_pool):
+    tokenizer = Totokenizer.from_model(model_tag)
+    texts = ["tiny", "word " * 1000, "ção " * 50, ""] * 5
+    chat = [{"role": "user", "content": text} for text in texts]
+
+    async def main():
+        counts = await asyncio.gather(*map(tokenizer.acount_tokens, texts))
+        assert counts == list(map(tokenizer.count_tokens, texts))
+        assert await tokenizer.acount_tokens_batch(texts) == tokenizer.count_tokens_batch(texts)
+        assert await tokenizer.acount_tokens_batch([]) == []
+        assert await tokenizer.acount_chatml_tokens(chat) == tokenizer.count_chatml_tokens(chat)
+
+    asyncio.run(main())
+    # semaphores are per event loop
+    asyncio.run(main())
+
+
+def test_large_inputs_leave_the_event_loop(small_pool):
+    threads = set()
+
+    class Recorder:
+        def count_tokens(self, text: str) -> int:
+            threads.add(threading.current_thread().name)
+            return len(text)
+
+    async def main():
+        assert await aio.acount_tokens(Recorder(), "small") == 5
+        assert threads == {threading.current_thread().name}
+        threads.clear()
+        assert await aio.acount_tokens(Recorder(), "x" * 100) == 100
+        assert all(name.startswith("totokenizers") for name in threads)
+
+    asyncio.run(main())
+
+
+def test_pending_jobs_are_bounded(small_pool):
+    # more threads than `max_pending`, so only the semaphore bounds the jobs running
+    aio.configure(max_workers=4)
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+    release = threading.Event()
+
+    class Slow:
+        def count_tokens(self, text: str) -> int:
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            release.wait(5)
+            with lock:
+                running -= 1
+            return len(text)
+
+    async def main():
+        tasks = [asyncio.create_task(aio.acount_tokens(Slow(), "x" * 100)) for _ in range(6)]
+        await asyncio.sleep(0.1)
+        assert sum(task.done() for task in tasks) == 0
+        release.set()
+        assert await asyncio.gather(*tasks) == [100] * 6
+
+    asyncio.run(main())
+    assert peak == 2
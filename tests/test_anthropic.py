@@ -23,3 +23,19 @@ def test_count_tokens(model_tag: str):
     tokenizer = Totokenizer.from_model(model_tag)
     message = "hello world"
     assert tokenizer.count_tokens(message) == 2
+
+
+def test_count_tokens_batch(model_tag: str):
+    tokenizer = Totokenizer.from_model(model_tag)
+    texts = ["hello world", "", "The quick brown fox jumps over the lazy dog."] * 5
+    expected = [tokenizer.count_tokens(text) for text in texts]
+    assert tokenizer.count_tokens_batch(texts) == expected
+    assert tokenizer.count_tokens_batch(texts, num_threads=1) == expected
+    assert tokenizer.encode_batch(texts[:3]) == [tokenizer.encode(t) for t in texts[:3]]
+
+
+def test_count_tokens_matches_encode(model_tag: str):
+    tokenizer = Totokenizer.from_model(model_tag)
+    texts = ["", "hello world", "ünïcödé 東京 🙂\n\n  spaced  ", "<EOT> special"]
+    for text in texts:
+        assert tokenizer.count_tokens(text) == len(tokenizer.encode(text))
@@ -0,0 +1,39 @@
+import pytest
+
+from totokenizers import arrays
+from totokenizers.factories import Totokenizer
+
+TEXTS = ["hello world", "", "ünïcödé 東京 🙂", "The quick brown fox."]
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "buffer"])
+def numpy_available(request, monkeypatch: pytest.MonkeyPatch):
+    if request.param:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(arrays, "_numpy", lambda: None)
+    return request.param
+
+
+@pytest.mark.parametrize("model_tag", ["anthropic/claude-2.1", "mockai/always-chat"])
+def test_encode_to_array(model_tag: str, numpy_available: bool):
+    tokenizer = Totokenizer.from_model(model_tag)
+    for text in TEXTS:
+        tokens = tokenizer.encode_to_array(text)
+        assert memoryview(tokens).itemsize == 4
+        assert list(tokens) == tokenizer.encode(text)
+
+
+@pytest.mark.parametrize("model_tag", ["anthropic/claude-2.1", "mockai/always-chat"])
+def test_encode_batch_ragged(model_tag: str, numpy_available: bool):
+    tokenizer = Totokenizer.from_model(model_tag)
+    tokens, offsets = tokenizer.encode_batch_ragged(TEXTS)
+    assert len(offsets) == len(TEXTS) + 1
+    for i, text in enumerate(TEXTS):
+        assert list(tokens[offsets[i] : offsets[i + 1]]) == tokenizer.encode(text)
+
+
+def test_ragged_from_arrays_empty(numpy_available: bool):
+    tokens, offsets = arrays.ragged_from_arrays([])
+    assert len(tokens) == 0
+    assert list(offsets) == [0]
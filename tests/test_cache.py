@@ -0,0 +1,80 @@
+import pytest
+
+from totokenizers.cache import FunctionsCache, TokenCountCache, functions_key, message_key
+from totokenizers.factories import Totokenizer
+from totokenizers.jsonschema_formatter import FunctionJSONSchema
+from totokenizers.schemas import Chat
+
+
+@pytest.fixture(scope="module")
+def chat() -> Chat:
+    return [
+        {"content": "You are a bot.", "role": "system"},
+        {"content": "hello bot", "name": "user", "role": "user"},
+        {"content": "I am Skynet.", "role": "assistant"},
+        {"content": "hello bot", "role": "user"},
+    ]
+
+
+@pytest.mark.parametrize("model_tag", ["anthropic/claude-2.1", "mockai/always-chat"])
+def test_cached_counts_match_uncached(model_tag: str, chat: Chat):
+    tokenizer = Totokenizer.from_model(model_tag, shared=False)
+    expected = [tokenizer.count_message_tokens(message) for message in chat]
+    tokenizer.message_cache = TokenCountCache()
+    for _ in range(3):
+        assert [tokenizer.count_message_tokens(m) for m in chat] == expected
+    stats = tokenizer.message_cache.stats()
+    assert (stats.misses, stats.hits, stats.entries) == (4, 8, 4)
+    assert Totokenizer.from_model(model_tag).message_cache is None
+
+
+def test_message_key_distinguishes_fields():
+    keys = {
+        message_key("ns", {"content": "a", "role": "user"}),
+        message_key("ns", {"content": "a", "role": "user", "name": ""}),
+        message_key("ns", {"content": "a", "role": "assistant"}),
+        message_key("other", {"content": "a", "role": "user"}),
+        message_key("ns", {"content": [{"type": "text", "text": "a"}], "role": "user"}),
+    }
+    assert len(keys) == 5
+    assert message_key("ns", {"role": "user", "content": "a"}) in keys
+
+
+def test_lru_bounds():
+    cache = TokenCountCache(max_entries=2)
+    for i in range(3):
+        cache.put(bytes([i]), i)
+    assert cache.get(bytes([0])) is None
+    assert cache.get(bytes([2])) == 2
+    assert cache.stats().evictions == 1
+
+    cache = TokenCountCache(max_bytes=1)
+    cache.put(b"key", 1)
+    assert len(cache) == 0
+
+
+def test_functions_cache(example_function_jsonschema: dict, example_function2_jsonschema: dict):
+    tokenizer = Totokenizer.from_model("mockai/always-func", shared=False)
+    functions = [example_function_jsonschema, example_function2_jsonschema]
+    expected = tokenizer.count_functions_tokens(functions)
+    tokenizer.functions_cache = FunctionsCache(max_entries=1)
+    assert tokenizer.count_functions_tokens(functions) == expected
+    assert tokenizer.count_functions_tokens(functions) == expected
+    assert tokenizer.functions_cache.stats().hits == 1
+    tokenizer.count_functions_tokens(functions[::-1])
+    assert tokenizer.functions_cache.stats().evictions == 1
+
+
+def test_functions_key_is_key_order_sensitive(example_function_jsonschema: dict):
+    reordered = {
+        **example_function_jsonschema,
+        "parameters": {
+            **example_function_jsonschema["parameters"],
+            "properties": dict(reversed(example_function_jsonschema["parameters"]["properties"].items())),
+        },
+    }
+    assert functions_key([reordered]) != functions_key([example_function_jsonschema])
+    cache = FunctionsCache()
+    typescript = FunctionJSONSchema([reordered]).to_typescript()
+    cache.typescript([example_function_jsonschema])
+    assert cache.typescript([reordered]) == typescript
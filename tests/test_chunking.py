@@ -0,0 +1,58 @@
+import json
+import random
+
+import pytest
+
+from totokenizers.factories import Totokenizer
+
+ALPHABET = list("ab c\n\t  .,!?'s0123456789éü東京🙂ﬁ") + ["'ll", "\n\n", " hello"]
+
+
+@pytest.mark.parametrize("model_tag", ["anthropic/claude-2.1", "mockai/always-chat"])
+def test_chunks_cover_text(model_tag: str):
+    tokenizer = Totokenizer.from_model(model_tag)
+    rng = random.Random(0)
+    for _ in range(100):
+        text = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 300)))
+        chunk_tokens = rng.randint(4, 30)
+        overlap_tokens = rng.randint(0, chunk_tokens - 1)
+        chunks = list(tokenizer.chunk_text(text, chunk_tokens, overlap_tokens))
+        assert chunks[0].start_char == 0
+        assert chunks[-1].end_char == len(text)
+        for previous, chunk in zip([None] + chunks, chunks):
+            assert chunk.text == text[chunk.start_char : chunk.end_char]
+            assert tokenizer.count_tokens(chunk.text) == chunk.num_tokens <= chunk_tokens
+            if previous is not None:
+                assert previous.start_char <= chunk.start_char <= previous.end_char
+
+
+def test_chunk_overlap_and_batch():
+    tokenizer = Totokenizer.from_model("anthropic/claude-2.1")
+    text = " ".join(f"word{i}" for i in range(5000))
+    chunks = list(tokenizer.chunk_text(text, 512, 64))
+    ids = tokenizer.encode(text)
+    assert [chunk.num_tokens for chunk in chunks[:-1]] == [512] * (len(chunks) - 1)
+    assert tokenizer.encode(chunks[1].text)[:64] == ids[448:512]
+    assert tokenizer.chunk_texts([text, "short"], 512, 64) == [chunks, list(tokenizer.chunk_text("short", 512, 64))]
+    with pytest.raises(ValueError):
+        tokenizer.chunk_text(text, 64, 64)
+
+
+def test_chunk_text_without_split_points(monkeypatch):
+    tokenizer = Totokenizer.from_model("anthropic/claude-2.1")
+    # minified JSON has neither spaces nor newlines
+    text = json.dumps(
+        [{"id": i, "name": f"item{i}", "tags": ["abc", i * 7]} for i in range(20_000)],
+        separators=(",", ":"),
+    )
+    num_tokens = tokenizer.count_tokens(text)
+    lengths = []
+    token_starts = tokenizer._token_starts
+    monkeypatch.setattr(
+        tokenizer, "_token_starts", lambda text: lengths.append(len(text)) or token_starts(text)
+    )
+    chunks = list(tokenizer.chunk_text(text, 64))
+    assert max(lengths) <= 64 * 32
+    assert "".join(chunk.text for chunk in chunks) == text
+    assert all(chunk.num_tokens <= 64 for chunk in chunks)
+    assert sum(chunk.num_tokens for chunk in chunks) == num_tokens
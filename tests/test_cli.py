@@ -0,0 +1,71 @@
+import gzip
+import json
+from pathlib import Path
+
+import pytest
+
+from totokenizers.cli import main
+from totokenizers.factories import Totokenizer
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_count_jsonl(tmp_path: Path, workers: int, example_function_jsonschema: dict):
+    functions = [example_function_jsonschema]
+    tools = [{"type": "function", "function": example_function_jsonschema}]
+    requests = []
+    for i in range(300):
+        messages = [{"role": "user", "content": f"request {i} " * (i % 7)}]
+        request = {"model": "mockai/always-func", "messages": messages}
+        if i % 3 == 1:
+            request["functions"] = functions
+        elif i % 3 == 2:
+            request = {"body": {**request, "tools": tools}}
+        requests.append(request)
+    lines = [json.dumps(request) for request in requests]
+    lines[10] = "{not json"
+    lines.insert(20, "")
+    path = tmp_path / "requests.jsonl.gz"
+    with gzip.open(path, "wt") as file:
+        file.write("\n".join(lines))
+
+    output = tmp_path / "counts.jsonl"
+    summary = tmp_path / "summary.json"
+    argv = ["count", str(path), "-o", str(output), "--summary", str(summary)]
+    exit_code = main(argv + ["--workers", str(workers), "--block-size", "1000"])
+    assert exit_code == 1
+
+    tokenizer = Totokenizer.from_model("mockai/always-func")
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [record["line"] for record in records] == [i for i in range(1, 302) if i != 21]
+    assert "error" in records[10]
+    expected = []
+    for i, request in enumerate(requests):
+        if i != 10:
+            body = request.get("body", request)
+            expected.append(tokenizer.count_chatml_tokens(body["messages"], functions if i % 3 else None))
+    assert [record["num_tokens"] for record in records if "error" not in record] == expected
+    totals = json.loads(summary.read_text())
+    assert totals["lines"] == 300 and totals["errors"] == 1
+    assert totals["num_tokens_by_model"] == {"mockai/always-func": sum(expected)}
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_count_jsonl_model_without_chat(tmp_path: Path, workers: int):
+    messages = [{"role": "user", "content": "hello"}]
+    lines = [
+        json.dumps({"model": "text-embedding-ada-002", "messages": messages}),
+        json.dumps({"model": "gpt-4", "messages": messages}),
+    ]
+    path = tmp_path / "requests.jsonl"
+    path.write_text("\n".join(lines) + "\n")
+    output = tmp_path / "counts.jsonl"
+
+    exit_code = main(["count", str(path), "-o", str(output), "--workers", str(workers)])
+    assert exit_code == 1
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert records[0] == {
+        "line": 1,
+        "error": "TotokenizersError: Model openai/text-embedding-ada-002 does not count chat messages.",
+    }
+    assert records[1]["model"] == "openai/gpt-4" and records[1]["num_tokens"] > 0
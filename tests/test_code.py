@@ -182,3 +182,14 @@ def test_functioncall_message_systemless(model_tag: str, example_function_jsonsc
 
 
 # TODO: function that accepts no parameters {"type": "object", "properties": {}}
+
+
+def test_count_chatml_tokens_many(model_tag: str, example_function_jsonschema: dict):
+    tokenizer = Totokenizer.from_model(model_tag)
+    chats: list[Chat] = [
+        [{"content": "Good bot.", "role": "system"}, {"content": "Hello.", "role": "user"}],
+        [{"content": "Hello.", "role": "user"}],
+    ]
+    assert tokenizer.count_chatml_tokens_many(chats[:1]) == [16]
+    functions = [example_function_jsonschema]
+    assert tokenizer.count_chatml_tokens_many(chats, functions) == [70, 67]
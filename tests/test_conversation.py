@@ -0,0 +1,80 @@
+import pytest
+
+from totokenizers.conversation import ConversationCounter
+from totokenizers.factories import Totokenizer
+from totokenizers.schemas import Chat
+
+
+@pytest.fixture(scope="module")
+def chat() -> Chat:
+    return [
+        {"content": "Good bot.", "role": "system"},
+        {"content": "Hello.", "role": "user"},
+        {"content": "Hi! How can I help?", "role": "assistant"},
+        {"content": "Call the example function.", "name": "joe", "role": "user"},
+    ]
+
+
+def test_openai_matches_count_chatml_tokens(chat: Chat, example_function_jsonschema: dict):
+    tokenizer = Totokenizer.from_model("openai/gpt-3.5-turbo-0613")
+    counter = ConversationCounter(tokenizer, chat[:2], [example_function_jsonschema])
+    assert counter.total == 70
+    counter.pop(0)
+    assert counter.total == 67
+
+
+@pytest.mark.parametrize("model_tag", ["mockai/always-func", "anthropic/claude-2.1"])
+def test_operations_match_full_recount(model_tag: str, chat: Chat, example_function_jsonschema: dict):
+    tokenizer = Totokenizer.from_model(model_tag)
+    functions = [example_function_jsonschema] if model_tag.startswith("mockai") else None
+
+    def expected(messages: Chat) -> int:
+        if functions:
+            return tokenizer.count_chatml_tokens(messages, functions)
+        return tokenizer.count_chatml_tokens(messages)
+
+    counter = ConversationCounter(tokenizer, functions=functions)
+    for i, message in enumerate(chat):
+        counter.append(message)
+        assert counter.total == expected(chat[: i + 1])
+    assert counter.pop() is chat[-1]
+    counter.replace(0, {"content": "Bad bot.", "role": "system"})
+    assert counter.total == expected([{"content": "Bad bot.", "role": "system"}, *chat[1:3]])
+    counter.set_functions(None)
+    assert counter.total == sum(map(tokenizer.count_message_tokens, counter.messages))
+    assert len(counter) == 3
+
+
+def test_anthropic_prompt_tokens(chat: Chat):
+    tokenizer = Totokenizer.from_model("anthropic/claude-2.1")
+    counter = ConversationCounter(tokenizer, chat[1:])
+    assert counter.count_chatml_prompt_tokens() == tokenizer.count_chatml_prompt_tokens(chat[1:])
+    counter.pop()
+    assert counter.count_chatml_prompt_tokens() == tokenizer.count_chatml_prompt_tokens(chat[1:3])
+
+
+class WordTokenizer:
+    """A third-party tokenizer, with only the methods of `protocols.Tokenizer`."""
+
+    model = "words"
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
+    def count_message_tokens(self, message) -> int:
+        return 2 + self.count_tokens(message["content"])
+
+    def count_functions_tokens(self, functions) -> int:
+        return 10 * len(functions)
+
+    def count_chatml_tokens(self, messages, functions=None) -> int:
+        num_tokens = 1 + sum(map(self.count_message_tokens, messages))
+        return num_tokens + (self.count_functions_tokens(functions) if functions else 0)
+
+
+def test_tokenizer_without_chatml_hooks(chat: Chat, example_function_jsonschema: dict):
+    tokenizer = WordTokenizer()
+    counter = ConversationCounter(tokenizer, chat, [example_function_jsonschema])
+    assert counter.total == tokenizer.count_chatml_tokens(chat, [example_function_jsonschema])
+    counter.set_functions(None)
+    assert counter.total == tokenizer.count_chatml_tokens(chat)
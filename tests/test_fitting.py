@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+from totokenizers.errors import TokenLimitExceeded
+from totokenizers.factories import TotoModelInfo, Totokenizer
+from totokenizers.fitting import chat_fits, chat_fits_stats, fit_chat, reset_chat_fits_stats
+from totokenizers.schemas import Chat
+
+
+def random_chat(rng: random.Random, n: int) -> Chat:
+    chat = [{"role": "system", "content": "Be brief. " * rng.randint(1, 5)}]
+    for i in range(n):
+        role = rng.choice(["user", "assistant", "user", "system"])
+        chat.append({"role": role, "content": f"message {i} " * rng.randint(1, 40)})
+    return chat
+
+
+def brute_force(tokenizer, chat: Chat, budget: int, functions, keep_first: bool):
+    pinned = {i for i, m in enumerate(chat) if m["role"] == "system"}
+    droppable = [i for i in range(len(chat)) if i not in pinned]
+    if keep_first and droppable:
+        pinned.add(droppable.pop(0))
+    for start in droppable or [len(chat)]:
+        messages = [m for i, m in enumerate(chat) if i in pinned or i >= start]
+        if hasattr(tokenizer, "count_chatml_prompt_tokens"):
+            num_tokens = tokenizer.count_chatml_prompt_tokens(messages)
+        elif functions:
+            num_tokens = tokenizer.count_chatml_tokens(messages, functions)
+        else:
+            num_tokens = tokenizer.count_chatml_tokens(messages)
+        if num_tokens <= budget:
+            return messages, num_tokens
+    return None
+
+
+@pytest.mark.parametrize("model_tag", ["mockai/always-chat", "anthropic/claude-2.1"])
+@pytest.mark.parametrize("strategy", ["drop_oldest", "keep_first"])
+def test_matches_brute_force(model_tag: str, strategy: str, example_function_jsonschema: dict):
+    tokenizer = Totokenizer.from_model(model_tag)
+    max_tokens = TotoModelInfo.from_model(model_tag).max_tokens
+    functions = [example_function_jsonschema] if model_tag.startswith("mockai") else None
+    rng = random.Random(0)
+    for _ in range(30):
+        chat = random_chat(rng, rng.randint(1, 12))
+        budget = rng.randint(50, 2000)
+        expected = brute_force(tokenizer, chat, budget, functions, strategy == "keep_first")
+        if expected is None:
+            with pytest.raises(TokenLimitExceeded):
+                fit_chat(chat, model_tag, max_tokens - budget, functions, strategy)
+        else:
+            assert fit_chat(chat, model_tag, max_tokens - budget, functions, strategy) == expected
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        fit_chat([{"role": "user", "content": "hi"}], "mockai/always-chat", strategy="random")
+
+
+@pytest.mark.parametrize("model_tag", ["mockai/always-chat", "anthropic/claude-2.1"])
+def test_chat_fits(model_tag: str):
+    tokenizer = Totokenizer.from_model(model_tag)
+    reset_chat_fits_stats()
+    rng = random.Random(0)
+    for _ in range(30):
+        chat = random_chat(rng, rng.randint(1, 12))
+        count = brute_force(tokenizer, chat, 10**9, None, False)[1]
+        for budget in (count - 1, count, 2 * count, 10 * count):
+            assert chat_fits(chat, model_tag, budget) == (count <= budget)
+        assert chat_fits(chat, model_tag)
+    stats = chat_fits_stats()
+    assert stats.checks == 150
+    assert 30 <= stats.skipped < 150
+
+
+def test_upper_bound():
+    tokenizer = Totokenizer.from_model("anthropic/claude-2.1")
+    for text in ["", "hello world", "ﬁ ﷺ \U0001fbf8 東京 🙂", " " * 10]:
+        assert tokenizer.count_tokens(text) <= tokenizer.estimate_upper_bound(text)
@@ -0,0 +1,89 @@
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+from totokenizers.google import FakeBackend, GeminiTokenizer
+
+
+def test_count_tokens_with_fake_backend():
+    backend = FakeBackend(tokens_per_turn=2)
+    tokenizer = GeminiTokenizer("gemini-pro", backend=backend, window=0)
+    assert tokenizer.count_tokens("Hello, world!") == 6
+    assert tokenizer.count_tokens_batch(["a b", "Hello, world!", "a b"]) == [4, 6, 4]
+    # every text was already cached
+    assert backend.num_requests == 2
+
+    chat = [
+        {"role": "system", "content": "Be brief."},
+        {"role": "user", "content": [{"type": "text", "text": "Hi there"}]},
+        {"role": "assistant", "content": "Hello!"},
+    ]
+    assert tokenizer.count_chatml_tokens(chat) == 3 * 2 + 3 + 2 + 2
+    with pytest.raises(ValueError):
+        tokenizer.count_chatml_tokens([{"role": "assistant", "content": None}])
+
+
+def test_concurrent_counts_are_coalesced():
+    backend = FakeBackend(latency=0.05)
+    tokenizer = GeminiTokenizer("gemini-pro", backend=backend, window=0.05, max_batch_size=8)
+    texts = [f"text number {i % 12}" for i in range(24)]
+    results = [None] * len(texts)
+
+    def count(i: int):
+        results[i] = tokenizer.count_tokens(texts[i])
+
+    threads = [threading.Thread(target=count, args=(i,)) for i in range(len(texts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [3] * len(texts)
+    # identical texts are sent once, in calls of at most 8 requests
+    assert backend.num_requests == 12
+    assert backend.num_calls < len(texts) // 2
+
+
+def test_backend_errors_reach_every_caller():
+    class Failing(FakeBackend):
+        def count_tokens_batch(self, requests):
+            raise ConnectionError("unreachable")
+
+    tokenizer = GeminiTokenizer("gemini-pro", backend=Failing(), window=0)
+    with pytest.raises(ConnectionError):
+        tokenizer.count_tokens_batch(["a", "b"])
+    assert tokenizer.client._in_flight == {}
+
+
+def test_interrupted_leader_releases_other_callers():
+    class Interrupt(BaseException):
+        pass
+
+    entered = threading.Event()
+
+    class Interrupted(FakeBackend):
+        def count_tokens_batch(self, requests):
+            entered.set()
+            # give the follower time to join the batch in flight
+            time.sleep(0.05)
+            raise Interrupt()
+
+    tokenizer = GeminiTokenizer("gemini-pro", backend=Interrupted(), window=0)
+    assert tokenizer.model is None and tokenizer.model_name == "gemini-pro"
+    errors = []
+
+    def lead():
+        try:
+            tokenizer.count_tokens("same text")
+        except BaseException as error:
+            errors.append(type(error))
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    assert entered.wait(5)
+    with pytest.raises(CancelledError):
+        tokenizer.count_tokens("same text")
+    leader.join()
+    assert errors == [Interrupt]
+    assert tokenizer.client._in_flight == {} and not tokenizer.client._leader
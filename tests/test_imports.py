@@ -0,0 +1,25 @@
+import subprocess
+import sys
+
+import pytest
+
+
+def _imported_modules(statement: str) -> set[str]:
+    code = f"import sys; {statement}; print('\\n'.join(sys.modules))"
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    return set(output.split())
+
+
+@pytest.mark.parametrize("module", ["tiktoken", "tokenizers", "vertexai"])
+def test_factories_import_is_lazy(module: str):
+    modules = _imported_modules("import totokenizers.factories")
+    assert module not in modules
+    assert "totokenizers.openai_info" not in modules
+
+
+def test_lazy_names_still_importable():
+    modules = _imported_modules(
+        "from totokenizers.factories import ANTHROPIC_MODELS, MockAITokenizer"
+    )
+    assert "tokenizers" not in modules
+    assert "totokenizers.mockai.tokenizer" in modules
@@ -0,0 +1,47 @@
+from totokenizers import instrumentation
+from totokenizers.factories import Totokenizer
+from totokenizers.mockai.tokenizer import MockAITokenizer
+
+
+def test_instrumentation_records_and_restores(example_function_jsonschema: dict):
+    tokenizer = Totokenizer.from_model("mockai/always-func")
+    original = MockAITokenizer.count_tokens
+    histogram = instrumentation.HistogramSink()
+    events = []
+    chat = [{"role": "user", "content": "héllo world"}]
+    with instrumentation.instrumented(histogram, events.append):
+        assert instrumentation.is_enabled()
+        num_tokens = tokenizer.count_chatml_tokens(chat, [example_function_jsonschema])
+        tokenizer.count_tokens_batch(["ab", "cde"])
+    assert not instrumentation.is_enabled()
+    assert MockAITokenizer.count_tokens is original
+    tokenizer.count_tokens("not recorded")
+
+    chatml = [event for event in events if event.method == "count_chatml_tokens"]
+    assert chatml == [
+        instrumentation.CallEvent("count_chatml_tokens", "always-func", chatml[0].seconds, 12, num_tokens)
+    ]
+    assert "to_typescript" in {event.method for event in events}
+    snapshot = histogram.snapshot()
+    batch = snapshot[("count_tokens_batch", "always-func")]
+    assert (batch["calls"], batch["input_bytes"], batch["tokens"]) == (1, 5, 5)
+    assert batch["buckets"][float("inf")] == 1
+    assert snapshot[("count_tokens", "always-func")]["calls"] == sum(
+        event.method == "count_tokens" for event in events
+    )
+
+    text = histogram.prometheus_text()
+    assert '# TYPE totokenizers_call_duration_seconds histogram' in text
+    assert 'totokenizers_calls_total{method="count_tokens_batch",model="always-func"} 1' in text
+    assert 'totokenizers_call_duration_seconds_bucket{method="count_tokens_batch",model="always-func",le="+Inf"} 1' in text
+
+
+def test_instrumentation_measures_keyword_inputs():
+    tokenizer = Totokenizer.from_model("mockai/always-chat")
+    events = []
+    with instrumentation.instrumented(events.append):
+        tokenizer.count_tokens(text="héllo")
+        tokenizer.count_chatml_tokens(messages=[{"role": "user", "content": "héllo world"}])
+    assert events[0].method == "count_tokens" and events[0].input_bytes == 6
+    chatml = [event for event in events if event.method == "count_chatml_tokens"]
+    assert chatml[0].input_bytes == 12
@@ -35,3 +35,47 @@ def test_jsonschema_typescript_tranlation(example_function_jsonschema: dict, exa
 def test_jsonschema_typescript_tranlation2(example_function2_jsonschema: dict, example_function2_typescript: str):
     ts = FunctionJSONSchema([example_function2_jsonschema]).to_typescript()
     assert ts == example_function2_typescript
+
+
+def test_jsonschema_typescript_shared_definitions():
+    point = {"type": "object", "properties": {"x": {"type": "number", "default": 1}}}
+    function = {
+        "name": "draw",
+        "description": "Draws a path",
+        "parameters": {
+            "type": "object",
+            "$defs": {"Point": point},
+            "properties": {
+                "label": {"type": "string", "description": "  Label\n  of the path\n"},
+                "start": {"$ref": "#/$defs/Point"},
+                "end": {"$ref": "#/$defs/Point"},
+                "via": {"type": "array", "items": {"$ref": "#/$defs/Point"}},
+                "shape": {
+                    "type": "object",
+                    "properties": {"center": {"$ref": "#/$defs/Point"}},
+                },
+            },
+            "required": ["start"],
+        },
+    }
+    ts = FunctionJSONSchema([{"type": "function", "function": function}]).to_typescript()
+    assert ts == """// Draws a path
+type draw = (_: {
+// Label
+// of the path
+label?: string,
+start: {
+  x?: number, // default: 1.0
+},
+end?: {
+  x?: number, // default: 1.0
+},
+via?: {
+  x?: number, // default: 1.0
+}[],
+shape?: {
+  center?: {
+    x?: number, // default: 1.0
+  },
+},
+}) => any;\n\n"""
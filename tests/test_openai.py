@@ -1,5 +1,6 @@
 import pytest
 
+from totokenizers.errors import TokenLimitExceeded
 from totokenizers.openai import ChatMLMessage, OpenAITokenizer
 from totokenizers.schemas import (
     ToolCall,
@@ -121,3 +122,28 @@ def test_gpt4_o_tool_call(tool_call_message, tool_call_message_no_args):
 
     count_tokens = tokenizer.count_tools_tokens(tool_call_message_no_args)
     assert count_tokens == 22
+
+
+def test_count_tokens_batch():
+    tokenizer = OpenAITokenizer(model_name="gpt-4o")
+    texts = ["hello world", "", "The quick brown fox jumps over the lazy dog."]
+    assert tokenizer.count_tokens_batch(texts) == [2, 0, 10]
+    assert tokenizer.encode_batch(texts) == [tokenizer.encode(t) for t in texts]
+
+
+def test_encode_batch_ragged():
+    tokenizer = OpenAITokenizer(model_name="gpt-4o")
+    texts = ["hello world", "", "The quick brown fox jumps over the lazy dog."]
+    tokens, offsets = tokenizer.encode_batch_ragged(texts)
+    assert list(offsets) == [0, 2, 2, 12]
+    assert list(tokens[2:12]) == list(tokenizer.encode_to_array(texts[2]))
+
+
+def test_chunk_text_checks_embedding_limit():
+    tokenizer = OpenAITokenizer(model_name="text-embedding-3-small")
+    with pytest.raises(TokenLimitExceeded):
+        tokenizer.chunk_text("hello world", chunk_tokens=10_000)
+    text = " ".join(["hello world"] * 20)
+    chunks = list(tokenizer.chunk_text(text, chunk_tokens=8))
+    assert [chunk.num_tokens for chunk in chunks] == [8, 8, 8, 8, 8]
+    assert "".join(chunk.text for chunk in chunks) == text
@@ -0,0 +1,50 @@
+import multiprocessing
+import pickle
+import threading
+
+import pytest
+
+from totokenizers.factories import Totokenizer
+from totokenizers.parallel import ParallelCounter, default_context
+
+
+@pytest.mark.parametrize("model_tag", ["anthropic/claude-2.1", "mockai/always-chat"])
+def test_tokenizers_pickle_by_model_tag(model_tag: str):
+    tokenizer = Totokenizer.from_model(model_tag)
+    data = pickle.dumps(tokenizer)
+    assert len(data) < 1024
+    assert pickle.loads(data) is tokenizer
+
+
+@pytest.mark.parametrize("model_tag", ["anthropic/claude-2.1", "mockai/always-func"])
+def test_parallel_counts_in_order(model_tag: str, example_function_jsonschema: dict):
+    tokenizer = Totokenizer.from_model(model_tag)
+    chats = [
+        [{"role": "user", "content": f"message {i} " * (i % 13)}] for i in range(500)
+    ]
+    texts = [chat[0]["content"] for chat in chats]
+    with ParallelCounter(model_tag, max_workers=2, chunk_size=16, max_in_flight=3) as counter:
+        assert list(counter.count_tokens(iter(texts))) == list(map(tokenizer.count_tokens, texts))
+        if model_tag.startswith("mockai"):
+            functions = [example_function_jsonschema]
+            expected = [tokenizer.count_chatml_tokens(chat, functions) for chat in chats]
+            assert list(counter.count_chatml_tokens(chats, functions)) == expected
+        else:
+            expected = list(map(tokenizer.count_chatml_tokens, chats))
+            assert list(counter.count_chatml_tokens(chats)) == expected
+        assert list(counter.count_tokens([])) == []
+
+
+def test_default_context_forks_only_single_threaded_processes():
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("no fork on this platform")
+    if threading.active_count() == 1:
+        assert default_context().get_start_method() == "fork"
+    release = threading.Event()
+    thread = threading.Thread(target=release.wait)
+    thread.start()
+    try:
+        assert default_context().get_start_method() != "fork"
+    finally:
+        release.set()
+        thread.join()
@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+
+from totokenizers.factories import Totokenizer
+from totokenizers.registry import REGISTRY, TokenizerRegistry
+
+
+@pytest.fixture(scope="function")
+def registry():
+    return TokenizerRegistry(max_tokenizers=2, max_encoders=1)
+
+
+def test_factory_returns_shared_instances():
+    tokenizer = Totokenizer.from_model("anthropic/claude-2.1")
+    assert Totokenizer.from_model("anthropic/claude-2.1") is tokenizer
+    assert "anthropic/claude-2.1" in REGISTRY
+
+
+def test_encoder_shared_across_models():
+    tokenizer = Totokenizer.from_model("anthropic/claude-2.1")
+    other = Totokenizer.from_model("anthropic/claude-instant-1.2")
+    assert tokenizer is not other
+    assert tokenizer.encoder is other.encoder
+
+
+def test_private_tokenizer():
+    shared = Totokenizer.from_model("anthropic/claude-2.1")
+    private = Totokenizer.from_model("anthropic/claude-2.1", shared=False)
+    assert private is not shared
+    assert private.encoder is shared.encoder
+    assert Totokenizer.from_model("anthropic/claude-2.1") is shared
+
+
+def test_evict_and_clear():
+    tokenizer = Totokenizer.from_model("mockai/always-chat")
+    assert REGISTRY.evict("mockai/always-chat")
+    assert not REGISTRY.evict("mockai/always-chat")
+    assert Totokenizer.from_model("mockai/always-chat") is not tokenizer
+    REGISTRY.clear()
+    assert len(REGISTRY) == 0
+
+
+def test_tokenizer_lru(registry: TokenizerRegistry):
+    registry.get_tokenizer("a", object)
+    registry.get_tokenizer("b", object)
+    registry.get_tokenizer("a", object)
+    registry.get_tokenizer("c", object)
+    assert registry.tokenizers() == ["a", "c"]
+
+
+def test_encoder_eviction_drops_dependents(registry: TokenizerRegistry):
+    registry.get_tokenizer("a", lambda: registry.get_encoder("enc1", object))
+    registry.get_tokenizer("b", lambda: registry.get_encoder("enc2", object))
+    assert registry.encoders() == ["enc2"]
+    assert registry.tokenizers() == ["b"]
+
+
+def test_concurrent_builds_share_one_instance(registry: TokenizerRegistry):
+    results = []
+
+    def build():
+        results.append(registry.get_tokenizer("a", object))
+
+    threads = [threading.Thread(target=build) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(result is results[0] for result in results)
+
+
+def test_slow_build_does_not_block_other_keys(registry: TokenizerRegistry):
+    cached = registry.get_tokenizer("cached", object)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_factory():
+        started.set()
+        release.wait(5)
+        return registry.get_encoder("enc", object)
+
+    results = []
+    slow = threading.Thread(target=lambda: results.append(registry.get_tokenizer("slow", slow_factory)))
+    slow.start()
+    assert started.wait(5)
+    # another thread asking for the same key waits for the build in progress
+    waiter = threading.Thread(target=lambda: results.append(registry.get_tokenizer("slow", object)))
+    waiter.start()
+    assert registry.get_tokenizer("cached", object) is cached
+    assert registry.get_tokenizer("other", object) is not None
+    release.set()
+    slow.join()
+    waiter.join()
+    assert len(results) == 2 and results[0] is results[1]
+    # the tokenizer was tied to the encoder it was built with
+    registry.evict("enc")
+    assert "slow" not in registry
+
+
+def test_failed_build_is_not_cached(registry: TokenizerRegistry):
+    def failing():
+        raise RuntimeError("download failed")
+
+    with pytest.raises(RuntimeError):
+        registry.get_tokenizer("a", failing)
+    assert "a" not in registry
+    assert registry.get_tokenizer("a", object) is not None
@@ -0,0 +1,50 @@
+import asyncio
+
+from totokenizers.factories import Totokenizer
+from totokenizers.server import TokenCountServer
+from totokenizers.server.loadtest import open_connection, request
+
+
+def test_server_batches_concurrent_requests(example_function_jsonschema: dict):
+    tokenizer = Totokenizer.from_model("mockai/always-func")
+    functions = [example_function_jsonschema]
+    chat = [{"role": "user", "content": "Hello there!"}]
+
+    async def main():
+        server = TokenCountServer(window=0.05)
+        listener = await server.start("127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+
+        async def count(payload):
+            reader, writer = await open_connection("127.0.0.1", port, None)
+            try:
+                return await request(reader, writer, "POST", "/count", payload)
+            finally:
+                writer.close()
+
+        async with listener:
+            texts = [f"text {i} " * i for i in range(20)]
+            responses = await asyncio.gather(
+                *(count({"model": "mockai/always-func", "text": text}) for text in texts),
+                count({"model": "mockai/always-func", "texts": texts}),
+                count({"model": "mockai/always-func", "messages": chat, "functions": functions}),
+                count({"model": "mockai/always-func", "messages": chat}),
+            )
+            expected = list(map(tokenizer.count_tokens, texts))
+            assert [body["num_tokens"] for _, body in responses[:20]] == expected
+            assert responses[20] == (200, {"num_tokens": expected})
+            assert responses[21][1]["num_tokens"] == tokenizer.count_chatml_tokens(chat, functions)
+            assert responses[22][1]["num_tokens"] == tokenizer.count_chatml_tokens(chat)
+            assert server.stats.batches < len(responses)
+
+            status, body = await count({"model": "mockai/always-func", "text": 1})
+            assert status == 400
+            status, body = await count({"model": "nope", "text": "x"})
+            assert status == 400 and "BadFormatForModelTag" in body["error"]
+            reader, writer = await open_connection("127.0.0.1", port, None)
+            assert await request(reader, writer, "GET", "/health") == (200, {"status": "ok"})
+            assert (await request(reader, writer, "GET", "/missing"))[0] == 404
+            writer.close()
+        server.close()
+
+    asyncio.run(main())
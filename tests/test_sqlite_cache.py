@@ -0,0 +1,94 @@
+import multiprocessing
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+import totokenizers.cache
+from totokenizers.anthropic import AnthropicTokenizer
+from totokenizers.factories import Totokenizer
+from totokenizers.sqlite_cache import SQLiteTokenCountCache
+
+
+@pytest.fixture(scope="function")
+def db_path(tmp_path: Path) -> Path:
+    return tmp_path / "counts.sqlite3"
+
+
+@pytest.fixture(scope="function")
+def tokenizer() -> AnthropicTokenizer:
+    # a private instance, so the shared one keeps no cache attached
+    return Totokenizer.from_model("anthropic/claude-2.1", shared=False)
+
+
+def _put_range(args):
+    path, start = args
+    cache = SQLiteTokenCountCache(path)
+    for i in range(start, start + 50):
+        cache.put(i.to_bytes(4, "little"), i)
+
+
+def test_counts_survive_restarts(db_path: Path, tokenizer: AnthropicTokenizer):
+    text = "The quick brown fox jumps over the lazy dog. " * 100
+    message = {"content": "hello bot", "role": "user"}
+    expected = tokenizer.count_tokens(text), tokenizer.count_message_tokens(message)
+
+    tokenizer.text_cache = tokenizer.message_cache = SQLiteTokenCountCache(db_path)
+    assert (tokenizer.count_tokens(text), tokenizer.count_message_tokens(message)) == expected
+    assert tokenizer.count_tokens("short") == 1  # below text_cache_min_length
+
+    restarted = SQLiteTokenCountCache(db_path)
+    tokenizer.text_cache = tokenizer.message_cache = restarted
+    assert (tokenizer.count_tokens(text), tokenizer.count_message_tokens(message)) == expected
+    assert (restarted.stats().hits, restarted.stats().misses) == (2, 0)
+
+
+def test_fingerprint_change_invalidates(db_path: Path, tokenizer: AnthropicTokenizer):
+    message = {"content": "hello bot", "role": "user"}
+    tokenizer.message_cache = cache = SQLiteTokenCountCache(db_path)
+    tokenizer.count_message_tokens(message)
+    tokenizer.encoding_fingerprint = "new tokenizer.json"
+    tokenizer.count_message_tokens(message)
+    assert (cache.stats().hits, cache.stats().misses) == (0, 2)
+
+
+def test_accounting_version_change_invalidates(
+    db_path: Path, tokenizer: AnthropicTokenizer, monkeypatch: pytest.MonkeyPatch
+):
+    message = {"content": "hello bot", "role": "user"}
+    tokenizer.message_cache = cache = SQLiteTokenCountCache(db_path)
+    tokenizer.count_message_tokens(message)
+    monkeypatch.setattr(totokenizers.cache, "ACCOUNTING_VERSION", totokenizers.cache.ACCOUNTING_VERSION + 1)
+    tokenizer.count_message_tokens(message)
+    assert (cache.stats().hits, cache.stats().misses) == (0, 2)
+
+
+def test_eviction(db_path: Path):
+    cache = SQLiteTokenCountCache(db_path, max_entries=2, ttl=None, evict_every=1)
+    for i in range(3):
+        cache.put(bytes([i]), i)
+    assert len(cache) == 2
+    assert cache.get(bytes([0])) is None
+
+    cache.ttl = -1  # everything is stale
+    assert cache.get(bytes([2])) is None
+    assert cache.evict() == 2
+    assert len(cache) == 0
+
+
+def test_concurrent_processes(db_path: Path):
+    SQLiteTokenCountCache(db_path)
+    with multiprocessing.Pool(4) as pool:
+        pool.map(_put_range, [(str(db_path), start) for start in range(0, 200, 50)])
+    cache = SQLiteTokenCountCache(db_path)
+    assert len(cache) == 200
+    assert cache.get((123).to_bytes(4, "little")) == 123
+
+
+def test_released_cache_closes_connections(db_path: Path):
+    cache = SQLiteTokenCountCache(db_path)
+    cache.put(b"key", 1)
+    connection = cache._connection()
+    del cache
+    with pytest.raises(sqlite3.ProgrammingError):
+        connection.execute("SELECT 1")
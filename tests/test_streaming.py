@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from totokenizers.factories import Totokenizer
+from totokenizers.segmentation import find_split, iter_splits
+from totokenizers.streaming import StreamingTokenCounter
+
+ALPHABET = list("ab c\n\t  .,!?'s0123456789éü東京🙂") + ["'ll", "\n\n", " ", "<EOT>"]
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    return Totokenizer.from_model("anthropic/claude-2.1")
+
+
+def random_texts(n: int, max_length: int):
+    rng = random.Random(0)
+    for _ in range(n):
+        yield "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, max_length)))
+
+
+def test_splits_preserve_counts(tokenizer):
+    for text in random_texts(500, 80):
+        split = find_split(text)
+        if split != -1:
+            assert 0 < split < len(text)
+            parts = tokenizer.count_tokens(text[:split]) + tokenizer.count_tokens(text[split:])
+            assert parts == tokenizer.count_tokens(text)
+        spans = list(iter_splits(text, 7))
+        assert "".join(text[start:end] for start, end in spans) == text
+        assert sum(tokenizer.count_tokens(text[start:end]) for start, end in spans) == tokenizer.count_tokens(text)
+
+
+def test_streaming_matches_one_shot(tokenizer):
+    rng = random.Random(1)
+    for text in random_texts(50, 600):
+        counter = StreamingTokenCounter.for_completion(tokenizer, window=32)
+        position = 0
+        while position < len(text):
+            delta = text[position : position + rng.randint(1, 12)]
+            position += len(delta)
+            assert counter.feed(delta) == tokenizer.count_completion_tokens(text[:position])
+        assert counter.finish() == tokenizer.count_completion_tokens(text)
+        assert counter.num_chars == len(text)
+    with pytest.raises(ValueError):
+        counter.feed("more")
+
+
+@pytest.mark.parametrize("model_tag", ["anthropic/claude-2.1", "mockai/always-chat"])
+def test_count_tokens_stream_and_file(model_tag: str, tmp_path):
+    tokenizer = Totokenizer.from_model(model_tag)
+    text = "".join(random_texts(200, 100)) + " unsplittable" * 3 + "x" * 300
+    expected = tokenizer.count_tokens(text)
+    data = text.encode("utf-8")
+    byte_chunks = [data[i : i + 7] for i in range(0, len(data), 7)]
+    text_chunks = [text[i : i + 50] for i in range(0, len(text), 50)]
+    assert tokenizer.count_tokens_stream(byte_chunks, window=64) == expected
+    assert tokenizer.count_tokens_stream(text_chunks, window=64, num_threads=1) == expected
+    assert tokenizer.count_tokens_stream([]) == 0
+    path = tmp_path / "text.txt"
+    path.write_bytes(data)
+    assert tokenizer.count_file(path, window=101) == expected
+    (tmp_path / "empty.txt").write_bytes(b"")
+    assert tokenizer.count_file(tmp_path / "empty.txt") == 0
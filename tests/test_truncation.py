@@ -0,0 +1,73 @@
+import json
+import random
+
+import pytest
+
+from totokenizers import truncation
+from totokenizers.factories import Totokenizer
+
+ALPHABET = list("ab c\n\t  .,!?'s0123456789éü東京🙂ﬁ") + ["'ll", "\n\n", " hello"]
+
+
+@pytest.mark.parametrize("model_tag", ["anthropic/claude-2.1", "mockai/always-chat"])
+@pytest.mark.parametrize("side", ["end", "start", "middle"])
+def test_truncate_text_fits(model_tag: str, side: str):
+    tokenizer = Totokenizer.from_model(model_tag)
+    rng = random.Random(0)
+    for _ in range(100):
+        text = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 200)))
+        num_tokens = tokenizer.count_tokens(text)
+        max_tokens = rng.randint(0, num_tokens + 2)
+        truncated = tokenizer.truncate_text(text, max_tokens, side)
+        assert tokenizer.count_tokens(truncated) <= max_tokens
+        if num_tokens <= max_tokens:
+            assert truncated == text
+        if side == "end":
+            assert text.startswith(truncated)
+        elif side == "start":
+            assert text.endswith(truncated)
+
+
+def test_truncate_long_text():
+    tokenizer = Totokenizer.from_model("anthropic/claude-2.1")
+    text = " ".join(f"word{i % 97}" for i in range(200_000))
+    head = tokenizer.truncate_text(text, 1000)
+    assert head == tokenizer.encoder.decode(tokenizer.encode(text)[:1000])
+    tail = tokenizer.truncate_text(text, 1000, side="start")
+    assert tokenizer.count_tokens(tail) == 1000
+    with pytest.raises(ValueError):
+        tokenizer.truncate_text(text, 10, side="both")
+
+
+class RecordingTokenizer:
+    """Records the longest text each tokenizer method is given."""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.longest = 0
+
+    def count_tokens(self, text: str) -> int:
+        self.longest = max(self.longest, len(text))
+        return self.tokenizer.count_tokens(text)
+
+    def _token_starts(self, text: str) -> list[int]:
+        self.longest = max(self.longest, len(text))
+        return self.tokenizer._token_starts(text)
+
+
+@pytest.mark.parametrize("side", ["end", "start", "middle"])
+def test_truncate_text_without_split_points(side: str):
+    tokenizer = Totokenizer.from_model("anthropic/claude-2.1")
+    # minified JSON has neither spaces nor newlines
+    text = json.dumps(
+        [{"id": i, "name": f"item{i}", "tags": ["abc", i * 7]} for i in range(20_000)],
+        separators=(",", ":"),
+    )
+    recorder = RecordingTokenizer(tokenizer)
+    truncated = truncation.truncate_text(recorder, text, 1000, side)
+    assert recorder.longest <= 1000 * 8
+    assert 995 <= tokenizer.count_tokens(truncated) <= 1000
+    if side == "end":
+        assert text.startswith(truncated)
+    elif side == "start":
+        assert text.endswith(truncated)
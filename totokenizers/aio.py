@@ -0,0 +1,144 @@
+"""
+Asyncio counting, for services that must not block their event loop.
+
+Large inputs are counted on a thread pool shared by every tokenizer (tiktoken
+and HuggingFace tokenizers release the GIL while encoding), small ones inline,
+where a thread hop would cost more than the count. At most `max_pending` jobs
+are submitted at a time per event loop; further callers wait their turn, so a
+burst of huge inputs queues up instead of piling onto the pool.
+"""
+
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Mapping, Optional, Sequence, TypeVar
+
+from .parallel import available_cpus
+from .schemas import Chat
+
+T = TypeVar("T")
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_max_workers: Optional[int] = None
+# inputs shorter than this (in characters) are counted on the event loop
+_inline_threshold = 4096
+_max_pending: Optional[int] = None
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def configure(
+    max_workers: Optional[int] = None,
+    inline_threshold: Optional[int] = None,
+    max_pending: Optional[int] = None,
+):
+    """
+    Sets up the shared pool. Arguments left as None keep their current value.
+
+    Args:
+        max_workers: threads of the pool, by default one per available CPU (at most 8).
+        inline_threshold: size (in characters) below which inputs are counted inline.
+        max_pending: jobs submitted at a time per event loop, by default 4 times `max_workers`.
+    """
+    global _executor, _max_workers, _inline_threshold, _max_pending
+    with _lock:
+        if max_workers is not None and max_workers != _max_workers:
+            if max_workers <= 0:
+                raise ValueError("max_workers must be positive.")
+            _max_workers = max_workers
+            if _executor is not None:
+                # running jobs finish on the old pool
+                _executor.shutdown(wait=False)
+                _executor = None
+        if inline_threshold is not None:
+            _inline_threshold = inline_threshold
+        if max_pending is not None:
+            if max_pending <= 0:
+                raise ValueError("max_pending must be positive.")
+            _max_pending = max_pending
+        _semaphores.clear()
+
+
+async def acount_tokens(tokenizer, text: str) -> int:
+    """`tokenizer.count_tokens(text)` without blocking the event loop."""
+    return await _run(len(text), tokenizer.count_tokens, text)
+
+
+async def acount_chatml_tokens(
+    tokenizer, messages: Chat, functions: Optional[Sequence[Mapping]] = None
+) -> int:
+    """`tokenizer.count_chatml_tokens(messages, functions)` without blocking the event loop."""
+    size = sum(map(_message_size, messages))
+    if functions:
+        return await _run(size, tokenizer.count_chatml_tokens, messages, functions)
+    # Anthropic's `count_chatml_tokens` takes no functions
+    return await _run(size, tokenizer.count_chatml_tokens, messages)
+
+
+async def acount_tokens_batch(tokenizer, texts: Sequence[str]) -> list[int]:
+    """
+    `tokenizer.count_tokens_batch(texts)` without blocking the event loop.
+
+    Large batches are split into one job per worker, so they neither hold the
+    pool alone nor start a pool of their own.
+    """
+    texts = list(texts)
+    size = sum(map(len, texts))
+    if size < _inline_threshold:
+        return tokenizer.count_tokens_batch(texts, num_threads=1)
+    num_jobs = min(_num_workers(), len(texts))
+    bounds = [len(texts) * i // num_jobs for i in range(num_jobs + 1)]
+    jobs = [texts[start:end] for start, end in zip(bounds, bounds[1:])]
+    counts = await asyncio.gather(
+        *(_run(sum(map(len, job)), tokenizer.count_tokens_batch, job, 1) for job in jobs)
+    )
+    return [count for job_counts in counts for count in job_counts]
+
+
+async def _run(size: int, func: Callable[..., T], *args) -> T:
+    if size < _inline_threshold:
+        return func(*args)
+    loop = asyncio.get_running_loop()
+    async with _get_semaphore(loop):
+        return await loop.run_in_executor(_get_executor(), functools.partial(func, *args))
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(_num_workers(), thread_name_prefix="totokenizers")
+        return _executor
+
+
+def _get_semaphore(loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+    # asyncio primitives are bound to a single loop
+    with _lock:
+        semaphore = _semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(_max_pending or 4 * _num_workers())
+            _semaphores[loop] = semaphore
+        return semaphore
+
+
+def _num_workers() -> int:
+    return _max_workers or min(8, available_cpus())
+
+
+def _message_size(message: Mapping) -> int:
+    content = message.get("content")
+    if isinstance(content, str):
+        size = len(content)
+    elif isinstance(content, list):
+        size = sum(len(part.get("text", "")) for part in content)
+    else:
+        size = 0
+    if message.get("function_call"):
+        size += len(message["function_call"].get("arguments", ""))
+    for tool_call in message.get("tool_calls") or ():
+        size += len(tool_call["function"].get("arguments", ""))
+    return size
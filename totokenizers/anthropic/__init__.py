@@ -1,2 +1,10 @@
-from .anthropic import AnthropicTokenizer
 from .info import ANTHROPIC_MODELS, ANTHROPIC_CHAT_MODELS
+
+
+def __getattr__(name: str):
+    # importing the tokenizer pulls in HuggingFace `tokenizers`, so defer it
+    if name == "AnthropicTokenizer":
+        from .anthropic import AnthropicTokenizer
+
+        return AnthropicTokenizer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,12 +1,40 @@
+import functools
+import hashlib
+import os
+import unicodedata
 from pathlib import Path
-from typing import Literal, Sequence
+from typing import Iterable, Iterator, Literal, Optional, Sequence
 
+import tokenizers
 from tokenizers import (
     Encoding,
     Tokenizer as HFTokenizer,
 )
 
+from .. import aio, chunking, streaming, truncation
+from ..arrays import TokenArray, ragged_from_lists, uint32_array
+from ..cache import TokenCountCache, message_key, namespace_for, text_key
+from ..chunking import TextChunk
+from ..registry import REGISTRY
 from ..schemas import ChatMLMessage
+from ..truncation import TruncationSide
+
+
+def _load_tokenizer(path: Path) -> HFTokenizer:
+    tokenizer = HFTokenizer.from_file(str(path))
+    # token counts never need padded or truncated encodings
+    tokenizer.no_padding()
+    tokenizer.no_truncation()
+    return tokenizer
+
+
+@functools.cache
+def _file_fingerprint(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(tokenizers.__version__.encode())
+    with open(path, "rb") as fh:
+        digest.update(fh.read())
+    return digest.hexdigest()
 
 
 class AnthropicTokenizer:
@@ -22,6 +50,12 @@ class AnthropicTokenizer:
     The tokenizer is based on HuggingFace's `tokenizers` package:
     https://github.com/huggingface/tokenizers
     """
+    # opt-in, e.g. `tokenizer.message_cache = TokenCountCache()`
+    message_cache: Optional[TokenCountCache] = None
+    # consulted by `count_tokens` for texts of at least `text_cache_min_length` chars
+    text_cache: Optional[TokenCountCache] = None
+    text_cache_min_length = 1024
+
     def __init__(
         self,
         model_name: Literal[
@@ -30,8 +64,24 @@ class AnthropicTokenizer:
         ],
     ):
         self.tokenizer_path = Path(__file__).parent / "tokenizer.json"
-        self.encoder: HFTokenizer = HFTokenizer.from_file(str(self.tokenizer_path))
+        self.encoder: HFTokenizer = REGISTRY.get_encoder(
+            f"hf/{self.tokenizer_path}", lambda: _load_tokenizer(self.tokenizer_path)
+        )
         self.model_name = model_name
+        self.cache_namespace = f"hf/{self.tokenizer_path.parent.name}"
+        # prompts end and completions start with this constant delimiter
+        self._assistant_tokens = self.count_tokens("\n\nassistant:")
+
+    def __reduce__(self):
+        # pickled by model tag instead of the whole `tokenizer.json` state
+        from ..factories import Totokenizer
+
+        return Totokenizer.from_model, (f"anthropic/{self.model_name}",)
+
+    @functools.cached_property
+    def encoding_fingerprint(self) -> str:
+        """Digest of `tokenizer.json`, used to version persistent caches."""
+        return _file_fingerprint(str(self.tokenizer_path))
 
     def encode(self, text: str) -> list[int]:
         encoded: Encoding = self.encoder.encode(text)
@@ -39,7 +89,98 @@ class AnthropicTokenizer:
 
     def count_tokens(self, text: str) -> int:
         """Counts the number of tokens in a given text."""
-        return len(self.encode(text))
+        if self.text_cache is not None and len(text) >= self.text_cache_min_length:
+            return self.text_cache.get_or_compute(
+                text_key(namespace_for(self, self.text_cache), text),
+                lambda: self._count_tokens(text),
+            )
+        return self._count_tokens(text)
+
+    def _count_tokens(self, text: str) -> int:
+        # the "fast" path skips offset tracking and `len` avoids building `ids`
+        return len(self.encoder.encode_batch_fast([text])[0])
+
+    def encode_batch(self, texts: Sequence[str], num_threads: int = 8) -> list[list[int]]:
+        """
+        Encodes many texts at once.
+
+        HuggingFace's `encode_batch` parallelizes on its own Rayon thread pool,
+        sized by the `RAYON_NUM_THREADS` environment variable, so `num_threads`
+        can only switch parallelism off (when set to 1).
+        """
+        if num_threads <= 1:
+            return [self.encode(text) for text in texts]
+        encodings: list[Encoding] = self.encoder.encode_batch(list(texts))
+        return [encoded.ids for encoded in encodings]
+
+    def encode_to_array(self, text: str) -> TokenArray:
+        return uint32_array(self.encode(text))
+
+    def encode_batch_ragged(
+        self, texts: Sequence[str], num_threads: int = 8
+    ) -> tuple[TokenArray, TokenArray]:
+        """Returns all token ids in one flat buffer plus offsets, such that
+        `tokens[offsets[i]:offsets[i + 1]]` are the ids of `texts[i]`."""
+        return ragged_from_lists(self.encode_batch(texts, num_threads=num_threads))
+
+    def count_tokens_batch(self, texts: Sequence[str], num_threads: int = 8) -> list[int]:
+        """Counts the number of tokens in each of the given texts."""
+        if num_threads <= 1:
+            return [self.count_tokens(text) for text in texts]
+        return list(map(len, self.encoder.encode_batch_fast(list(texts))))
+
+    async def acount_tokens(self, text: str) -> int:
+        """Same as `count_tokens`, off the event loop for large texts (see `aio`)."""
+        return await aio.acount_tokens(self, text)
+
+    async def acount_tokens_batch(self, texts: Sequence[str]) -> list[int]:
+        return await aio.acount_tokens_batch(self, texts)
+
+    async def acount_chatml_tokens(self, messages: Sequence[ChatMLMessage]) -> int:
+        return await aio.acount_chatml_tokens(self, messages)
+
+    def count_tokens_stream(
+        self,
+        chunks: Iterable[str | bytes],
+        window: int = 2**18,
+        num_threads: Optional[int] = None,
+    ) -> int:
+        """Counts tokens of a stream of text or UTF-8 chunks in bounded memory."""
+        return streaming.count_tokens_stream(self, chunks, window, num_threads)
+
+    def count_file(
+        self,
+        path: str | os.PathLike,
+        window: int = 2**18,
+        num_threads: Optional[int] = None,
+    ) -> int:
+        """Counts tokens of a UTF-8 file through `mmap` in bounded memory."""
+        return streaming.count_file(self, path, window, num_threads)
+
+    def truncate_text(
+        self, text: str, max_tokens: int, side: TruncationSide = "end"
+    ) -> str:
+        """Cuts `text` to at most `max_tokens` tokens, tokenizing only about that many."""
+        return truncation.truncate_text(self, text, max_tokens, side)
+
+    def chunk_text(
+        self, text: str, chunk_tokens: int = 512, overlap_tokens: int = 0
+    ) -> Iterator[TextChunk]:
+        """Yields `(text, start_char, end_char, num_tokens)` chunks of at most `chunk_tokens`."""
+        return chunking.iter_chunks(self, text, chunk_tokens, overlap_tokens)
+
+    def chunk_texts(
+        self,
+        texts: Sequence[str],
+        chunk_tokens: int = 512,
+        overlap_tokens: int = 0,
+        num_threads: int = 8,
+    ) -> list[list[TextChunk]]:
+        """Same as `chunk_text` for many documents at once."""
+        return chunking.chunk_batch(self, texts, chunk_tokens, overlap_tokens, num_threads)
+
+    def _token_starts(self, text: str) -> list[int]:
+        return [start for start, _ in self.encoder.encode(text).offsets]
 
     def _message_to_string(self, message: ChatMLMessage) -> str:
         if message["role"].lower() == "system":
@@ -47,9 +188,37 @@ class AnthropicTokenizer:
         return f"\n\n{message['role'].lower()}: {message['content']}"
 
     def count_chatml_message_tokens(self, message: ChatMLMessage) -> int:
+        if self.message_cache is not None:
+            return self.message_cache.get_or_compute(
+                message_key(namespace_for(self, self.message_cache), message),
+                lambda: self.count_tokens(self._message_to_string(message)),
+            )
         raw_message = self._message_to_string(message)
         return self.count_tokens(raw_message)
 
+    # same name as the other tokenizers
+    count_message_tokens = count_chatml_message_tokens
+
+    def estimate_upper_bound(self, text: str) -> int:
+        """
+        Cheap bound on `count_tokens(text)`: byte-level BPE yields at most
+        one token per byte of the NFKC-normalized text.
+        """
+        if text.isascii():
+            return len(text)
+        num_bytes = len(text.encode("utf-8", "surrogatepass"))
+        if unicodedata.is_normalized("NFKC", text):
+            return num_bytes
+        # Normalization can expand text (U+FDFA is 18 characters in NFKC), and
+        # HF's Unicode tables may be older than Python's, leaving characters
+        # that Python normalizes untouched. Either way, the sum bounds both.
+        normalized = unicodedata.normalize("NFKC", text)
+        return num_bytes + len(normalized.encode("utf-8", "surrogatepass"))
+
+    def estimate_message_upper_bound(self, message: ChatMLMessage) -> int:
+        """Cheap bound on `count_message_tokens(message)`."""
+        return self.estimate_upper_bound(self._message_to_string(message))
+
     def count_chatml_tokens(self, messages: Sequence[ChatMLMessage]) -> int:
         num_tokens = sum(map(self.count_chatml_message_tokens, messages))
         return num_tokens
@@ -57,9 +226,25 @@ class AnthropicTokenizer:
     def count_chatml_prompt_tokens(self, messages: Sequence[ChatMLMessage]) -> int:
         """Returns a count that matches the "prompt tokens" in the logs."""
         num_tokens = self.count_chatml_tokens(messages)
+        return self._chatml_prompt_total(num_tokens, messages)
+
+    def _chatml_total(
+        self,
+        messages_tokens: int,
+        messages: Sequence[ChatMLMessage],
+        functions_tokens: Optional[int],
+    ) -> int:
+        if functions_tokens is not None:
+            raise TypeError("Anthropic chats do not support functions.")
+        return messages_tokens
+
+    def _chatml_prompt_total(
+        self, messages_tokens: int, messages: Sequence[ChatMLMessage]
+    ) -> int:
+        num_tokens = messages_tokens
         # A message completion prompt always ends in "\n\nassistant:"
         if messages[-1]["role"].lower() != "assistant":
-            num_tokens += self.count_tokens("\n\nassistant:")
+            num_tokens += self._assistant_tokens
         # Also, we are underestimating by 1 token according to the API logs
         num_tokens += 1
         return num_tokens
@@ -67,6 +252,6 @@ class AnthropicTokenizer:
     def count_completion_tokens(self, text: str) -> int:
         """Returns a count that matches the "completion tokens" in the logs."""
         # A completion response always starts with "\n\nassistant:"
-        num_tokens = self.count_tokens("\n\nassistant:")
+        num_tokens = self._assistant_tokens
         num_tokens += self.count_tokens(text)
         return num_tokens
@@ -0,0 +1,83 @@
+"""
+Flat token buffers.
+
+NumPy is an optional extra (`pip install totokenizers[numpy]`). Without it,
+arrays are returned as `array.array`, which also supports the buffer protocol,
+so `np.frombuffer`, `memoryview` or `torch.frombuffer` can wrap them without copies.
+"""
+
+import array
+import functools
+import itertools
+from typing import Any, Iterable, Sequence
+
+# NumPy arrays when available, `array.array` otherwise
+TokenArray = Any
+
+
+@functools.cache
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def uint32_array(ids: Sequence[int]) -> TokenArray:
+    np = _numpy()
+    if np is None:
+        return _uint32(ids)
+    return np.array(ids, dtype=np.uint32)
+
+
+def uint32_from_buffer(buffer) -> TokenArray:
+    """Wraps a native-endian uint32 buffer (such as tiktoken's) without parsing it."""
+    np = _numpy()
+    if np is None:
+        tokens = _uint32()
+        tokens.frombytes(memoryview(buffer).cast("B"))
+        return tokens
+    return np.frombuffer(buffer, dtype=np.uint32)
+
+
+def ragged_from_lists(batch: Sequence[Sequence[int]]) -> tuple[TokenArray, TokenArray]:
+    """Flattens lists of ids into one buffer plus CSR-style offsets (`len(batch) + 1`)."""
+    lengths = list(map(len, batch))
+    offsets = _offsets(lengths)
+    np = _numpy()
+    if np is None:
+        return _uint32(itertools.chain.from_iterable(batch)), offsets
+    tokens = np.fromiter(
+        itertools.chain.from_iterable(batch), dtype=np.uint32, count=offsets[-1]
+    )
+    return tokens, offsets
+
+
+def ragged_from_arrays(batch: Sequence[TokenArray]) -> tuple[TokenArray, TokenArray]:
+    """Same as `ragged_from_lists`, for arrays returned by `uint32_from_buffer`."""
+    offsets = _offsets(map(len, batch))
+    np = _numpy()
+    if np is None:
+        tokens = _uint32()
+        for ids in batch:
+            tokens.extend(ids)
+        return tokens, offsets
+    if not batch:
+        return np.empty(0, dtype=np.uint32), offsets
+    return np.concatenate(batch), offsets
+
+
+def _offsets(lengths: Iterable[int]) -> TokenArray:
+    offsets = itertools.accumulate(lengths, initial=0)
+    np = _numpy()
+    if np is None:
+        return array.array("q", offsets)
+    return np.fromiter(offsets, dtype=np.int64)
+
+
+def _uint32(ids: Iterable[int] = ()) -> array.array:
+    # "I" is 4 bytes wide on every platform CPython supports in practice
+    tokens = array.array("I", ids)
+    assert tokens.itemsize == 4, "array typecode 'I' is not 32 bits wide"
+    return tokens
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Mapping, Optional, Sequence
+
+from .jsonschema_formatter import FunctionJSONSchema
+
+# part of persistent cache keys: bump it with any change to how totokenizers
+# counts (per-message, name, function or tool overhead), so stale counts miss
+ACCOUNTING_VERSION = 1
+# per-entry bookkeeping of the OrderedDict (links, hash slot) on CPython
+_ENTRY_OVERHEAD = 104
+
+
+@dataclass
+class CacheStats:
+    """Snapshot of a cache's counters."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    nbytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class TokenCountCache:
+    """
+    Thread-safe LRU of token counts keyed by content digests.
+
+    Bounded both by number of entries and by (approximate) bytes in memory.
+    Keys come from `message_key`, which includes the tokenizer's
+    `cache_namespace`, so a cache can be shared between tokenizers.
+    """
+
+    def __init__(self, max_entries: int = 100_000, max_bytes: int = 32 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[bytes, int] = OrderedDict()
+        self._nbytes = 0
+        self._stats = CacheStats()
+
+    def get(self, key: bytes) -> Optional[int]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return value
+
+    def put(self, key: bytes, value: int):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = value
+            self._nbytes += _entry_size(key, value)
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._nbytes > self.max_bytes
+            ):
+                old_key, old_value = self._entries.popitem(last=False)
+                self._nbytes -= _entry_size(old_key, old_value)
+                self._stats.evictions += 1
+
+    def get_or_compute(self, key: bytes, compute: Callable[[], int]) -> int:
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                evictions=self._stats.evictions,
+                entries=len(self._entries),
+                nbytes=self._nbytes,
+            )
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = CacheStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class FunctionsCache:
+    """
+    Thread-safe LRU of function lists to their rendered TypeScript and token counts.
+
+    Entries are keyed by `functions_key`, so the same catalog sent with every
+    request is rendered once and encoded once per tokenizer namespace.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> (typescript, {namespace: token count})
+        self._entries: OrderedDict[bytes, tuple[str, dict[str, int]]] = OrderedDict()
+        self._nbytes = 0
+        self._stats = CacheStats()
+
+    def typescript(self, functions: Sequence[Mapping]) -> str:
+        typescript, _ = self._entry(functions_key(functions), functions)
+        return typescript
+
+    def count(
+        self,
+        namespace: str,
+        functions: Sequence[Mapping],
+        count_typescript: Callable[[str], int],
+    ) -> int:
+        typescript, counts = self._entry(functions_key(functions), functions)
+        num_tokens = counts.get(namespace)
+        if num_tokens is None:
+            num_tokens = counts[namespace] = count_typescript(typescript)
+        return num_tokens
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                evictions=self._stats.evictions,
+                entries=len(self._entries),
+                nbytes=self._nbytes,
+            )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _entry(
+        self, key: bytes, functions: Sequence[Mapping]
+    ) -> tuple[str, dict[str, int]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats.hits += 1
+                return entry
+            self._stats.misses += 1
+        # render outside of the lock, a concurrent duplicate render is harmless
+        entry = (FunctionJSONSchema(functions).to_typescript(), {})
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key]
+            self._entries[key] = entry
+            self._nbytes += sys.getsizeof(entry[0]) + _ENTRY_OVERHEAD
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._nbytes > self.max_bytes
+            ):
+                _, (old_typescript, _) = self._entries.popitem(last=False)
+                self._nbytes -= sys.getsizeof(old_typescript) + _ENTRY_OVERHEAD
+                self._stats.evictions += 1
+        return entry
+
+
+def functions_key(functions: Sequence[Mapping]) -> bytes:
+    """
+    128-bit digest of the JSON of a function list.
+
+    Key order is kept: the order of `properties` is the order of the lines of
+    the TypeScript rendering, so differently ordered catalogs are different entries.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    _update(digest, json.dumps(functions, separators=(",", ":"), ensure_ascii=False))
+    return digest.digest()
+
+
+def namespace_for(tokenizer, cache) -> str:
+    """Persistent caches outlive library upgrades, so their keys also include
+    a fingerprint of the encoding data and the `ACCOUNTING_VERSION`."""
+    if getattr(cache, "persistent", False):
+        return (
+            f"{tokenizer.cache_namespace}/{tokenizer.encoding_fingerprint}"
+            f"/{ACCOUNTING_VERSION}"
+        )
+    return tokenizer.cache_namespace
+
+
+def text_key(namespace: str, text: str) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    _update(digest, namespace)
+    _update(digest, text)
+    return digest.digest()
+
+
+def message_key(namespace: str, message: Mapping[str, Any]) -> bytes:
+    """128-bit digest of (namespace, role, name, content) for plain-text messages,
+    or of the canonical JSON of any other message (function/tool calls, content parts)."""
+    digest = hashlib.blake2b(digest_size=16)
+    _update(digest, namespace)
+    role = message.get("role")
+    name = message.get("name")
+    content = message.get("content")
+    plain = isinstance(content, str) and len(message) == 2 + ("name" in message)
+    if plain and isinstance(role, str) and (name is None or isinstance(name, str)):
+        digest.update(b"t")
+        _update(digest, role)
+        _update(digest, name or "")
+        digest.update(b"1" if "name" in message else b"0")
+        _update(digest, content)
+    else:
+        digest.update(b"j")
+        _update(digest, json.dumps(message, sort_keys=True, ensure_ascii=False))
+    return digest.digest()
+
+
+def _update(digest, text: str):
+    data = text.encode("utf-8", "surrogatepass")
+    digest.update(len(data).to_bytes(8, "little"))
+    digest.update(data)
+
+
+def _entry_size(key: bytes, value: int) -> int:
+    return sys.getsizeof(key) + sys.getsizeof(value) + _ENTRY_OVERHEAD
@@ -0,0 +1,129 @@
+"""
+Token-sized chunks of long documents, e.g. for embedding.
+
+Documents are tokenized block by block, cut at split points (see
+`segmentation`), so only a few blocks of token offsets are held at a time.
+Chunks start and end at token boundaries, and since re-tokenizing a cut word
+may change its tokens, each chunk's `num_tokens` is its exact own count.
+"""
+
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, NamedTuple, Sequence
+
+from .segmentation import find_next_split, find_split, iter_splits
+
+# characters tokenized at once, per token of chunk
+_BLOCK_CHARS_PER_TOKEN = 32
+
+
+class TextChunk(NamedTuple):
+    text: str
+    start_char: int
+    end_char: int
+    num_tokens: int
+
+
+def iter_chunks(
+    tokenizer, text: str, chunk_tokens: int = 512, overlap_tokens: int = 0
+) -> Iterator[TextChunk]:
+    """
+    Yields chunks of at most `chunk_tokens` tokens covering `text`, each sharing
+    its first `overlap_tokens` tokens with the end of the previous one.
+    Only a single character that takes more than `chunk_tokens` byte-level
+    tokens (e.g. an emoji with a tiny `chunk_tokens`) can exceed it.
+
+    `tokenizer` must implement `count_tokens` and `_token_starts`.
+    """
+    if chunk_tokens <= 0:
+        raise ValueError("chunk_tokens must be positive.")
+    if not 0 <= overlap_tokens < chunk_tokens:
+        raise ValueError("overlap_tokens must be non-negative and less than chunk_tokens.")
+    return _iter_chunks(tokenizer, text, chunk_tokens, overlap_tokens)
+
+
+def _iter_chunks(
+    tokenizer, text: str, chunk_tokens: int, overlap_tokens: int
+) -> Iterator[TextChunk]:
+    # absolute character offsets of tokens `first_token` and on
+    starts: list[int] = []
+    first_token = 0
+    # text without safe split points is cut at forced ones
+    blocks = iter_splits(text, chunk_tokens * _BLOCK_CHARS_PER_TOKEN, tokenizer=tokenizer)
+    exhausted = False
+    chunk_start = 0  # index of the first token of the next chunk
+    last_start = last_end = -1
+    while True:
+        # token `chunk_start + chunk_tokens` must be known to end the chunk
+        while not exhausted and len(starts) <= chunk_start - first_token + chunk_tokens:
+            block = next(blocks, None)
+            if block is None:
+                exhausted = True
+                break
+            block_start, block_end = block
+            starts.extend(
+                block_start + start
+                for start in tokenizer._token_starts(text[block_start:block_end])
+            )
+        local_start = chunk_start - first_token
+        if local_start >= len(starts):
+            return
+        local_end = min(local_start + chunk_tokens, len(starts))
+        start_char = starts[local_start]
+        end_char = starts[local_end] if local_end < len(starts) else len(text)
+        num_tokens = _span_tokens(tokenizer, text, starts, start_char, end_char)
+        # a cut word may re-tokenize into more tokens, move the end back
+        while num_tokens > chunk_tokens and local_end > local_start + 1:
+            local_end -= 1
+            end_char = starts[local_end]
+            num_tokens = _span_tokens(tokenizer, text, starts, start_char, end_char)
+        # tokens that start inside the same character share its offset,
+        # so a chunk may be empty or contained in the previous one
+        if end_char > start_char and not (start_char >= last_start and end_char <= last_end):
+            yield TextChunk(text[start_char:end_char], start_char, end_char, num_tokens)
+            last_start, last_end = start_char, end_char
+        if end_char == len(text):
+            return
+        next_start = min(local_start + chunk_tokens - overlap_tokens, local_end)
+        chunk_start = first_token + max(next_start, local_start + 1)
+        # drop offsets no longer needed, but never some of the tokens starting
+        # in one character, or `bisect` would miscount them
+        trim = chunk_start - first_token
+        if trim > 4 * chunk_tokens:
+            while trim > 0 and starts[trim - 1] == starts[trim]:
+                trim -= 1
+            del starts[:trim]
+            first_token += trim
+
+
+def chunk_batch(
+    tokenizer,
+    texts: Sequence[str],
+    chunk_tokens: int = 512,
+    overlap_tokens: int = 0,
+    num_threads: int = 8,
+) -> list[list[TextChunk]]:
+    """Chunks many documents in a thread pool (tokenizers release the GIL)."""
+
+    def chunk(text: str) -> list[TextChunk]:
+        return list(iter_chunks(tokenizer, text, chunk_tokens, overlap_tokens))
+
+    if num_threads <= 1 or len(texts) <= 1:
+        return list(map(chunk, texts))
+    with ThreadPoolExecutor(num_threads) as executor:
+        return list(executor.map(chunk, texts))
+
+
+def _span_tokens(tokenizer, text: str, starts: list[int], start: int, end: int) -> int:
+    """Exact count of `text[start:end]`, re-encoding only its edges."""
+    left = find_next_split(text, start - 1, end)
+    right = -1 if left == -1 else find_split(text, end, left)
+    if right == -1:
+        return tokenizer.count_tokens(text[start:end])
+    # tokens between two safe split points are those of the whole text
+    inner = bisect.bisect_left(starts, right) - bisect.bisect_left(starts, left)
+    return (
+        tokenizer.count_tokens(text[start:left])
+        + inner
+        + tokenizer.count_tokens(text[right:end])
+    )
@@ -0,0 +1,182 @@
+"""
+Command line tools.
+
+    totokenizers count [-o counts.jsonl] [--workers N] requests.jsonl[.gz] ...
+
+Counts the prompt tokens of logged chat completion requests, one JSON object
+per line with `model`, `messages` and optionally `functions` or `tools`
+(OpenAI batch files, with the request under `body`, work too). Writes one
+`{"line", "model", "num_tokens"}` (or `{"line", "error"}`) object per input
+line, in order, then a summary with totals and throughput on stderr.
+
+Input is read in blocks of whole lines and parsed and counted by worker
+processes, so reading stays close to disk speed and memory bounded by the
+blocks in flight.
+"""
+
+import argparse
+import gzip
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterator, Optional, Sequence
+
+from .errors import TotokenizersError
+from .factories import Totokenizer
+from .parallel import available_cpus, default_context, map_ordered
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="totokenizers")
+    commands = parser.add_subparsers(dest="command", required=True)
+    count = commands.add_parser("count", help="count tokens of JSONL request logs")
+    count.add_argument("inputs", nargs="+", help='JSONL files, gzipped or not, or "-" for stdin')
+    count.add_argument("-o", "--output", default="-", help="per-line counts (default: stdout)")
+    count.add_argument("--no-lines", action="store_true", help="only print the summary")
+    count.add_argument("--summary", help="also write the summary as JSON to this file")
+    count.add_argument("--model", help="model tag for every line, instead of their `model`")
+    count.add_argument(
+        "--provider", default="openai", help="provider of `model` names without one"
+    )
+    count.add_argument("--workers", type=int, default=available_cpus())
+    count.add_argument("--block-size", type=int, default=2**20, help="bytes per task")
+    args = parser.parse_args(argv)
+    return count_command(args)
+
+
+def count_command(args: argparse.Namespace) -> int:
+    start = time.perf_counter()
+    summary = {
+        "lines": 0,
+        "errors": 0,
+        "bytes": 0,
+        "num_tokens": 0,
+        "num_tokens_by_model": {},
+    }
+    options = (args.model, args.provider, not args.no_lines)
+    output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    executor = None
+    if args.workers > 1:
+        executor = ProcessPoolExecutor(args.workers, mp_context=default_context())
+    try:
+        blocks = _iter_blocks(args.inputs, args.block_size)
+        if executor is None:
+            results = (_count_block(block, options) for block in blocks)
+        else:
+            results = map_ordered(executor, _count_block, blocks, 2 * args.workers, options)
+        for lines, block_summary in results:
+            output.write(lines)
+            for key in ("lines", "errors", "bytes", "num_tokens"):
+                summary[key] += block_summary[key]
+            for model_tag, num_tokens in block_summary["num_tokens_by_model"].items():
+                by_model = summary["num_tokens_by_model"]
+                by_model[model_tag] = by_model.get(model_tag, 0) + num_tokens
+        output.flush()
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if output is not sys.stdout.buffer:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    summary["seconds"] = round(elapsed, 3)
+    summary["lines_per_second"] = round(summary["lines"] / elapsed, 1)
+    summary["megabytes_per_second"] = round(summary["bytes"] / elapsed / 2**20, 2)
+    if args.summary:
+        with open(args.summary, "w") as file:
+            json.dump(summary, file, indent=2)
+    print(
+        f"{summary['lines']} lines ({summary['errors']} errors), "
+        f"{summary['num_tokens']} tokens in {elapsed:.2f} s: "
+        f"{summary['lines_per_second']:.0f} lines/s, {summary['megabytes_per_second']:.1f} MB/s",
+        file=sys.stderr,
+    )
+    for model_tag, num_tokens in sorted(summary["num_tokens_by_model"].items()):
+        print(f"  {model_tag}: {num_tokens} tokens", file=sys.stderr)
+    return 1 if summary["errors"] else 0
+
+
+def _iter_blocks(paths: Sequence[str], block_size: int) -> Iterator[tuple[int, bytes]]:
+    """Yields `(number of the first line, block of whole lines)` from every file."""
+    first_line = 1
+    for path in paths:
+        file = _open(path)
+        try:
+            rest = b""
+            while data := file.read(block_size):
+                data = rest + data
+                end = data.rfind(b"\n") + 1
+                rest = data[end:]
+                if end:
+                    yield first_line, data[:end]
+                    first_line += data.count(b"\n", 0, end)
+            if rest:
+                yield first_line, rest
+                first_line += 1
+        finally:
+            if file is not sys.stdin.buffer:
+                file.close()
+
+
+def _open(path: str) -> BinaryIO:
+    if path == "-":
+        stdin = sys.stdin.buffer
+        return gzip.GzipFile(fileobj=stdin) if stdin.peek(2)[:2] == _GZIP_MAGIC else stdin
+    with open(path, "rb") as file:
+        magic = file.read(2)
+    return gzip.open(path, "rb") if magic == _GZIP_MAGIC else open(path, "rb")
+
+
+def _count_block(block: tuple[int, bytes], options: tuple) -> tuple[bytes, dict]:
+    """Counts a block of lines in a worker, returning its output lines and totals."""
+    first_line, data = block
+    model, provider, write_lines = options
+    out = []
+    summary = {"lines": 0, "errors": 0, "bytes": len(data), "num_tokens": 0}
+    by_model: dict[str, int] = {}
+    for line_number, line in enumerate(data.split(b"\n"), first_line):
+        if not line.strip():
+            continue
+        summary["lines"] += 1
+        try:
+            model_tag, num_tokens = _count_request(json.loads(line), model, provider)
+        except (TotokenizersError, ValueError, KeyError, TypeError, AttributeError) as error:
+            summary["errors"] += 1
+            record = {"line": line_number, "error": f"{type(error).__name__}: {error}"}
+        else:
+            summary["num_tokens"] += num_tokens
+            by_model[model_tag] = by_model.get(model_tag, 0) + num_tokens
+            record = {"line": line_number, "model": model_tag, "num_tokens": num_tokens}
+        if write_lines:
+            out.append(json.dumps(record))
+    summary["num_tokens_by_model"] = by_model
+    return ("\n".join(out) + "\n" if out else "").encode(), summary
+
+
+def _count_request(request: dict, model: Optional[str], provider: str) -> tuple[str, int]:
+    if "body" in request and "messages" not in request:
+        # OpenAI batch API lines wrap the request
+        request = request["body"]
+    model_tag = model or request["model"]
+    if "/" not in model_tag:
+        model_tag = f"{provider}/{model_tag}"
+    tokenizer = Totokenizer.from_model(model_tag)
+    if tokenizer.count_chatml_tokens is NotImplementedError:
+        # completion and embedding models set their chat methods to `NotImplementedError`
+        raise TotokenizersError(f"Model {model_tag} does not count chat messages.")
+    functions = request.get("functions") or [
+        tool["function"] for tool in request.get("tools") or () if tool.get("type") == "function"
+    ]
+    if functions:
+        num_tokens = tokenizer.count_chatml_tokens(request["messages"], functions)
+    else:
+        # Anthropic's `count_chatml_tokens` takes no functions
+        num_tokens = tokenizer.count_chatml_tokens(request["messages"])
+    return model_tag, num_tokens
+
+
+if __name__ == "__main__":
+    sys.exit(main())
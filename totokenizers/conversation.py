@@ -0,0 +1,124 @@
+from typing import Any, Iterable, Mapping, Optional, Sequence
+
+from .schemas import Chat, ChatMLMessage
+
+
+class ConversationCounter:
+    """
+    Running token count of a chat thread.
+
+    Each message is tokenized once, when it is added, so counting a growing
+    thread after every turn costs O(1) encodes per turn instead of O(n).
+    Totals are exactly those of the tokenizer's `count_chatml_tokens` (and
+    `count_chatml_prompt_tokens` for Anthropic), functions adjustments included.
+    Messages must not be mutated in place once added, use `replace` instead.
+    Tokenizers that only implement `protocols.Tokenizer` have no hook to add
+    the chat-level tokens to the message counts, so their totals are counted
+    in full with `count_chatml_tokens`.
+
+    Args:
+        tokenizer: an `OpenAITokenizer`, `AnthropicTokenizer` or `MockAITokenizer`.
+        messages: initial messages of the thread.
+        functions: function definitions sent along with the thread.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        messages: Iterable[Mapping[str, Any]] = (),
+        functions: Optional[Sequence[Mapping]] = None,
+    ):
+        self.tokenizer = tokenizer
+        self._messages: list[Mapping[str, Any]] = []
+        self._counts: list[int] = []
+        self._messages_tokens = 0
+        self._functions: Optional[Sequence[Mapping]] = None
+        self._functions_tokens: Optional[int] = None
+        self.extend(messages)
+        self.set_functions(functions)
+
+    @property
+    def messages(self) -> list[Mapping[str, Any]]:
+        return list(self._messages)
+
+    @property
+    def functions(self) -> Optional[Sequence[Mapping]]:
+        return self._functions
+
+    def message_tokens(self, index: int) -> int:
+        return self._counts[index]
+
+    def append(self, message: ChatMLMessage):
+        num_tokens = self.tokenizer.count_message_tokens(message)
+        self._messages.append(message)
+        self._counts.append(num_tokens)
+        self._messages_tokens += num_tokens
+
+    def extend(self, messages: Iterable[Mapping[str, Any]]):
+        for message in messages:
+            self.append(message)
+
+    def pop(self, index: int = -1) -> Mapping[str, Any]:
+        message = self._messages.pop(index)
+        self._messages_tokens -= self._counts.pop(index)
+        return message
+
+    def replace(self, index: int, message: ChatMLMessage):
+        num_tokens = self.tokenizer.count_message_tokens(message)
+        self._messages_tokens += num_tokens - self._counts[index]
+        self._messages[index] = message
+        self._counts[index] = num_tokens
+
+    def set_functions(self, functions: Optional[Sequence[Mapping]]):
+        self._functions = functions
+        self._functions_tokens = (
+            self.tokenizer.count_functions_tokens(functions) if functions else None
+        )
+
+    def count_chatml_tokens(self) -> int:
+        """Same as `tokenizer.count_chatml_tokens(messages, functions)`."""
+        return chatml_total(
+            self.tokenizer,
+            self._messages_tokens,
+            self._messages,
+            self._functions,
+            self._functions_tokens,
+        )
+
+    def count_chatml_prompt_tokens(self) -> int:
+        """Same as `tokenizer.count_chatml_prompt_tokens(messages)` (Anthropic only)."""
+        return chatml_prompt_total(self.tokenizer, self.count_chatml_tokens(), self._messages)
+
+    @property
+    def total(self) -> int:
+        return self.count_chatml_tokens()
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __getitem__(self, index: int) -> Mapping[str, Any]:
+        return self._messages[index]
+
+
+def chatml_total(
+    tokenizer,
+    messages_tokens: int,
+    messages: Chat,
+    functions: Optional[Sequence[Mapping]],
+    functions_tokens: Optional[int],
+) -> int:
+    """`tokenizer.count_chatml_tokens(messages, functions)`, given the messages' counts."""
+    total = getattr(tokenizer, "_chatml_total", None)
+    if total is None:
+        if functions:
+            return tokenizer.count_chatml_tokens(messages, functions)
+        return tokenizer.count_chatml_tokens(messages)
+    return total(messages_tokens, messages, functions_tokens)
+
+
+def chatml_prompt_total(tokenizer, chatml_tokens: int, messages: Chat) -> int:
+    """`tokenizer.count_chatml_prompt_tokens(messages)`, given `count_chatml_tokens`."""
+    total = getattr(tokenizer, "_chatml_prompt_total", None)
+    if total is None:
+        return tokenizer.count_chatml_prompt_tokens(messages)
+    return total(chatml_tokens, messages)
@@ -1,53 +1,93 @@
-from typing import Literal, overload
+from __future__ import annotations
+
+import importlib
+from typing import TYPE_CHECKING, Literal, overload
 
-from .anthropic import ANTHROPIC_MODELS, AnthropicTokenizer
 from .errors import BadFormatForModelTag, ModelNotFound, ModelProviderNotFound
-from .mockai.info import MODELS as MOCKAI_MODELS
-from .mockai.tokenizer import MockAITokenizer
-from .openai import OpenAITokenizer
-from .openai_info import OPEN_AI_MODELS
+from .registry import REGISTRY
+
+if TYPE_CHECKING:
+    from .anthropic import AnthropicTokenizer
+    from .mockai.tokenizer import MockAITokenizer
+    from .openai import OpenAITokenizer
+
+    TokenizerType = OpenAITokenizer | AnthropicTokenizer | MockAITokenizer
+
+# Provider modules pull in heavy dependencies (tiktoken, HF tokenizers) and
+# build their model tables on import, so they are only loaded on first use.
+_LAZY_ATTRIBUTES = {
+    "ANTHROPIC_MODELS": (".anthropic.info", "ANTHROPIC_MODELS"),
+    "AnthropicTokenizer": (".anthropic.anthropic", "AnthropicTokenizer"),
+    "MOCKAI_MODELS": (".mockai.info", "MODELS"),
+    "MockAITokenizer": (".mockai.tokenizer", "MockAITokenizer"),
+    "OPEN_AI_MODELS": (".openai_info", "OPEN_AI_MODELS"),
+    "OpenAITokenizer": (".openai", "OpenAITokenizer"),
+}
 
-TokenizerType = OpenAITokenizer | AnthropicTokenizer | MockAITokenizer
+
+def __getattr__(name: str):
+    if name == "TokenizerType":
+        value = (
+            __getattr__("OpenAITokenizer")
+            | __getattr__("AnthropicTokenizer")
+            | __getattr__("MockAITokenizer")
+        )
+    elif name in _LAZY_ATTRIBUTES:
+        module_name, attribute = _LAZY_ATTRIBUTES[name]
+        module = importlib.import_module(module_name, __package__)
+        value = getattr(module, attribute)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
 
 
 class Totokenizer:
 
     @classmethod
-    def from_model(cls, model: str) -> TokenizerType:
+    def from_model(cls, model: str, shared: bool = True) -> TokenizerType:
         try:
             provider, model_name = model.split("/", 1)
         except (ValueError, TypeError):
             raise BadFormatForModelTag(model)
-        return cls.from_provider(provider, model_name)
+        return cls.from_provider(provider, model_name, shared)
 
     @overload
     @classmethod
     def from_provider(
-        cls, provider: Literal["openai"], model: str
+        cls, provider: Literal["openai"], model: str, shared: bool = True
     ) -> OpenAITokenizer: ...
     @overload
     @classmethod
     def from_provider(
-        cls, provider: Literal["anthropic"], model: str
+        cls, provider: Literal["anthropic"], model: str, shared: bool = True
     ) -> AnthropicTokenizer: ...
     @overload
     @classmethod
     def from_provider(
-        cls, provider: Literal["mockai"], model: str
+        cls, provider: Literal["mockai"], model: str, shared: bool = True
     ) -> MockAITokenizer: ...
 
     @classmethod
-    def from_provider(cls, provider: str, model: str) -> TokenizerType:
+    def from_provider(cls, provider: str, model: str, shared: bool = True) -> TokenizerType:
+        """
+        Tokenizers are shared process-wide (see `totokenizers.registry`) unless
+        `shared` is false, e.g. to set caches on one without affecting other
+        callers. Private tokenizers still share their encoder.
+        """
         # use pattern matching
         match provider:
             case "anthropic":
-                return AnthropicTokenizer(model)
+                from .anthropic.anthropic import AnthropicTokenizer as factory
             case "openai":
-                return OpenAITokenizer(model)
+                from .openai import OpenAITokenizer as factory
             case "mockai":
-                return MockAITokenizer(model)
+                from .mockai.tokenizer import MockAITokenizer as factory
             case _:
                 raise ModelProviderNotFound(provider)
+        if not shared:
+            return factory(model)
+        return REGISTRY.get_tokenizer(f"{provider}/{model}", lambda: factory(model))
 
     def encode(self, text: str) -> list[int]:
         raise NotImplementedError
@@ -65,14 +105,20 @@ class TotoModelInfo:
         except ValueError:
             raise BadFormatForModelTag(model)
         if provider == "anthropic":
+            from .anthropic.info import ANTHROPIC_MODELS
+
             if model_name not in ANTHROPIC_MODELS:
                 raise ModelNotFound(model_name)
             return ANTHROPIC_MODELS[model_name]
         if provider == "openai":
+            from .openai_info import OPEN_AI_MODELS
+
             if model_name not in OPEN_AI_MODELS:
                 raise ModelNotFound(model_name)
             return OPEN_AI_MODELS[model_name]
         if provider == "mockai":
+            from .mockai.info import MODELS as MOCKAI_MODELS
+
             if model_name not in MOCKAI_MODELS:
                 raise ModelNotFound(model_name)
             return MOCKAI_MODELS[model_name]
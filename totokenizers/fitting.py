@@ -0,0 +1,150 @@
+import threading
+from dataclasses import dataclass
+from typing import Literal, Mapping, Optional, Sequence
+
+from .conversation import chatml_prompt_total, chatml_total
+from .errors import TokenLimitExceeded
+from .factories import TotoModelInfo, Totokenizer
+from .schemas import Chat
+
+FitStrategy = Literal["drop_oldest", "keep_first"]
+
+
+@dataclass
+class FitsStats:
+    """How often `chat_fits` was settled by the upper bound alone."""
+
+    checks: int = 0
+    skipped: int = 0
+
+    @property
+    def skip_rate(self) -> float:
+        return self.skipped / self.checks if self.checks else 0.0
+
+
+_stats = FitsStats()
+_stats_lock = threading.Lock()
+
+
+def fit_chat(
+    chat: Chat,
+    model_tag: str,
+    reserve_output_tokens: int = 0,
+    functions: Optional[Sequence[Mapping]] = None,
+    strategy: FitStrategy = "drop_oldest",
+) -> tuple[Chat, int]:
+    """
+    Drops the oldest messages of a chat until it fits the model's context window.
+
+    Each message is counted once, then the largest suffix of messages that fits
+    `max_tokens - reserve_output_tokens` is found by binary search over suffix sums.
+    System messages are always kept in place, and so is the last message.
+
+    Args:
+        chat: messages, oldest first.
+        model_tag: `<provider>/<model>`, used for both the tokenizer and `max_tokens`.
+        reserve_output_tokens: tokens left for the completion.
+        functions: function definitions, always kept.
+        strategy: "drop_oldest", or "keep_first" to also keep the first
+            non-system message (usually the task) and drop the ones after it.
+
+    Returns:
+        The trimmed chat and its exact count (`count_chatml_tokens`, or
+        `count_chatml_prompt_tokens` for Anthropic).
+
+    Raises:
+        TokenLimitExceeded: if the messages that are always kept do not fit.
+    """
+    if strategy not in ("drop_oldest", "keep_first"):
+        raise ValueError(f"Unknown strategy {strategy!r}.")
+    tokenizer = Totokenizer.from_model(model_tag)
+    budget = TotoModelInfo.from_model(model_tag).max_tokens - reserve_output_tokens
+    counts = [tokenizer.count_message_tokens(message) for message in chat]
+    functions_tokens = tokenizer.count_functions_tokens(functions) if functions else None
+
+    pinned = [message["role"] == "system" for message in chat]
+    if strategy == "keep_first" and not all(pinned):
+        pinned[pinned.index(False)] = True
+    droppable = [i for i, is_pinned in enumerate(pinned) if not is_pinned]
+    pinned_tokens = sum(count for count, is_pinned in zip(counts, pinned) if is_pinned)
+    # suffix_tokens[j]: tokens of the droppable messages from the j-th on
+    suffix_tokens = [0] * (len(droppable) + 1)
+    for j in range(len(droppable) - 1, -1, -1):
+        suffix_tokens[j] = suffix_tokens[j + 1] + counts[droppable[j]]
+
+    def fit(j: int) -> tuple[Chat, int]:
+        start = droppable[j] if j < len(droppable) else len(chat)
+        messages = [m for i, m in enumerate(chat) if pinned[i] or i >= start]
+        num_tokens = _chat_total(
+            tokenizer, pinned_tokens + suffix_tokens[j], messages, functions, functions_tokens
+        )
+        return messages, num_tokens
+
+    # totals decrease as more messages are dropped, find the fewest drops that fit
+    low, high = 0, max(len(droppable) - 1, 0)
+    messages, num_tokens = fit(high)
+    if num_tokens > budget:
+        raise TokenLimitExceeded(budget, model_tag, num_tokens)
+    while low < high:
+        middle = (low + high) // 2
+        candidate = fit(middle)
+        if candidate[1] <= budget:
+            high = middle
+            messages, num_tokens = candidate
+        else:
+            low = middle + 1
+    return messages, num_tokens
+
+
+def chat_fits(
+    chat: Chat,
+    model_tag: str,
+    budget: Optional[int] = None,
+    functions: Optional[Sequence[Mapping]] = None,
+) -> bool:
+    """
+    Whether the chat's count is at most `budget` (by default, the model's `max_tokens`).
+
+    A provable upper bound (the tokenizers' `estimate_message_upper_bound`, about
+    one token per UTF-8 byte plus the exact per-message overheads) settles most
+    chats far below the limit without tokenizing them. Only when the bound
+    exceeds the budget are the messages counted exactly.
+    See `chat_fits_stats` for how often that was skipped.
+    """
+    tokenizer = Totokenizer.from_model(model_tag)
+    if budget is None:
+        budget = TotoModelInfo.from_model(model_tag).max_tokens
+    functions_tokens = tokenizer.count_functions_tokens(functions) if functions else None
+    upper_bound = sum(map(tokenizer.estimate_message_upper_bound, chat))
+    skipped = _chat_total(tokenizer, upper_bound, chat, functions, functions_tokens) <= budget
+    with _stats_lock:
+        _stats.checks += 1
+        _stats.skipped += skipped
+    if skipped:
+        return True
+    messages_tokens = sum(map(tokenizer.count_message_tokens, chat))
+    return _chat_total(tokenizer, messages_tokens, chat, functions, functions_tokens) <= budget
+
+
+def chat_fits_stats() -> FitsStats:
+    with _stats_lock:
+        return FitsStats(checks=_stats.checks, skipped=_stats.skipped)
+
+
+def reset_chat_fits_stats():
+    with _stats_lock:
+        _stats.checks = _stats.skipped = 0
+
+
+def _chat_total(
+    tokenizer,
+    messages_tokens: int,
+    messages: Chat,
+    functions: Optional[Sequence[Mapping]],
+    functions_tokens: Optional[int],
+) -> int:
+    """`count_chatml_tokens`, or `count_chatml_prompt_tokens` for Anthropic."""
+    num_tokens = chatml_total(tokenizer, messages_tokens, messages, functions, functions_tokens)
+    if messages and hasattr(tokenizer, "count_chatml_prompt_tokens"):
+        num_tokens = chatml_prompt_total(tokenizer, num_tokens, messages)
+    return num_tokens
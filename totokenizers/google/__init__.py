@@ -1 +1,12 @@
-from .google import GeminiTokenizer
\ No newline at end of file
+def __getattr__(name: str):
+    # `vertexai` is only imported by the default backend, but keep the
+    # package import as light as the other providers'
+    if name == "GeminiTokenizer":
+        from .google import GeminiTokenizer
+
+        return GeminiTokenizer
+    if name in ("FakeBackend", "VertexAIBackend"):
+        from . import backends
+
+        return getattr(backends, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,84 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional, Protocol, Sequence
+
+# a Vertex AI request: `[{"role": "user" | "model", "parts": [{"text": ...}]}, ...]`
+Contents = list[dict[str, Any]]
+
+_FAKE_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+class CountBackend(Protocol):
+    def count_tokens_batch(self, requests: Sequence[Contents]) -> list[int]:
+        """Returns the `total_tokens` of each request."""
+        ...
+
+
+class VertexAIBackend:
+    """
+    Counts with the Vertex AI SDK (`google-cloud-aiplatform`).
+
+    The API returns a single total per request, so a batch is sent as
+    concurrent requests, at most `max_concurrency` at a time.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        project_id: Optional[str] = None,
+        location: Optional[str] = None,
+        max_concurrency: int = 16,
+    ):
+        import vertexai
+        from vertexai.preview.generative_models import Content, GenerativeModel
+
+        # Initialize the Vertex AI API (gets Google credentials as well)
+        vertexai.init(project=project_id, location=location)
+        self.model = GenerativeModel(model_name)
+        self._content_from_dict = Content.from_dict
+        self._executor = ThreadPoolExecutor(max_concurrency)
+
+    def count_tokens_batch(self, requests: Sequence[Contents]) -> list[int]:
+        return list(self._executor.map(self._count_tokens, requests))
+
+    def _count_tokens(self, contents: Contents) -> int:
+        response = self.model.count_tokens(list(map(self._content_from_dict, contents)))
+        return response.total_tokens
+
+
+class FakeBackend:
+    """
+    In-process stand-in for Vertex AI, for tests and benchmarks.
+
+    Counts words and punctuation marks, plus `tokens_per_turn` per content, and
+    sleeps `latency` seconds per call plus `latency_per_request` per request.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        latency_per_request: float = 0.0,
+        tokens_per_turn: int = 0,
+    ):
+        self.latency = latency
+        self.latency_per_request = latency_per_request
+        self.tokens_per_turn = tokens_per_turn
+        self.num_calls = 0
+        self.num_requests = 0
+        self._lock = threading.Lock()
+
+    def count_tokens_batch(self, requests: Sequence[Contents]) -> list[int]:
+        with self._lock:
+            self.num_calls += 1
+            self.num_requests += len(requests)
+        time.sleep(self.latency + self.latency_per_request * len(requests))
+        return [self._count_tokens(contents) for contents in requests]
+
+    def _count_tokens(self, contents: Contents) -> int:
+        return sum(
+            self.tokens_per_turn
+            + sum(len(_FAKE_TOKEN.findall(part.get("text", ""))) for part in content["parts"])
+            for content in contents
+        )
@@ -0,0 +1,122 @@
+import json
+import threading
+from concurrent.futures import Future
+from typing import Optional, Sequence
+
+from ..cache import TokenCountCache, text_key
+from .backends import Contents, CountBackend
+
+
+class CountClient:
+    """
+    Coalesces concurrent count requests into batched backend calls.
+
+    The first caller of a window waits `window` seconds (or until
+    `max_batch_size` requests are pending), then sends every pending request in
+    one call; callers in the meantime just wait for their result. Identical
+    requests, pending or in flight, are sent once, and results are cached by
+    a digest of the request's canonical JSON.
+
+    Args:
+        backend: see `backends.CountBackend`.
+        namespace: prefix of cache keys, e.g. the model name.
+        window: seconds to wait for other requests before sending a batch.
+        max_batch_size: requests per backend call.
+        cache: token counts by request digest, or None to disable caching.
+    """
+
+    def __init__(
+        self,
+        backend: CountBackend,
+        namespace: str,
+        window: float = 0.005,
+        max_batch_size: int = 64,
+        cache: Optional[TokenCountCache] = None,
+    ):
+        self.backend = backend
+        self.namespace = namespace
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._pending: dict[bytes, tuple[Contents, Future]] = {}
+        self._in_flight: dict[bytes, Future] = {}
+        self._batch_full = threading.Event()
+        self._leader = False
+
+    def count(self, contents: Contents) -> int:
+        return self.count_many([contents])[0]
+
+    def count_many(self, requests: Sequence[Contents]) -> list[int]:
+        results: list[Optional[int]] = [None] * len(requests)
+        futures: dict[int, Future] = {}
+        keys = [self._key(contents) for contents in requests]
+        if self.cache is not None:
+            results = [self.cache.get(key) for key in keys]
+        lead = False
+        with self._lock:
+            for i, (key, contents) in enumerate(zip(keys, requests)):
+                if results[i] is not None:
+                    continue
+                future = self._in_flight.get(key)
+                if future is None and key in self._pending:
+                    future = self._pending[key][1]
+                if future is None:
+                    future = Future()
+                    self._pending[key] = (contents, future)
+                futures[i] = future
+            if self._pending and not self._leader:
+                self._leader = lead = True
+            if len(self._pending) >= self.max_batch_size:
+                self._batch_full.set()
+        if lead:
+            self._lead()
+        for i, future in futures.items():
+            results[i] = future.result()
+        return results
+
+    def _lead(self):
+        items: list[tuple[bytes, tuple[Contents, Future]]] = []
+        try:
+            self._batch_full.wait(self.window)
+            items = self._take_batch()
+            for start in range(0, len(items), self.max_batch_size):
+                self._send(items[start : start + self.max_batch_size])
+        except Exception as exception:
+            # callers get the error from their futures, including this one
+            for _, (_, future) in items:
+                if not future.done():
+                    future.set_exception(exception)
+        except BaseException:
+            # interrupted (e.g. KeyboardInterrupt): other callers must not wait forever
+            if not items:
+                items = self._take_batch()
+            for _, (_, future) in items:
+                future.cancel()
+            raise
+        finally:
+            with self._lock:
+                for key, _ in items:
+                    self._in_flight.pop(key, None)
+
+    def _take_batch(self) -> list[tuple[bytes, tuple[Contents, Future]]]:
+        with self._lock:
+            batch = self._pending
+            self._pending = {}
+            self._batch_full.clear()
+            # later callers start the next window while this batch is sent
+            self._leader = False
+            for key, (_, future) in batch.items():
+                self._in_flight[key] = future
+        return list(batch.items())
+
+    def _send(self, items: list[tuple[bytes, tuple[Contents, Future]]]):
+        counts = self.backend.count_tokens_batch([contents for _, (contents, _) in items])
+        for (key, (_, future)), count in zip(items, counts):
+            if self.cache is not None:
+                self.cache.put(key, count)
+            future.set_result(count)
+
+    def _key(self, contents: Contents) -> bytes:
+        canonical = json.dumps(contents, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return text_key(self.namespace, canonical)
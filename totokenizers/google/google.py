@@ -1,9 +1,9 @@
-from typing import Literal, Sequence
-
-import vertexai
-from vertexai.preview.generative_models import GenerativeModel
+from typing import Literal, Optional, Sequence
 
+from ..cache import TokenCountCache
 from ..schemas import ChatMLMessage
+from .backends import Contents, CountBackend, VertexAIBackend
+from .client import CountClient
 
 
 class GeminiTokenizer:
@@ -15,8 +15,17 @@ class GeminiTokenizer:
     - https://googleapis.dev/python/google-api-core/latest/auth.html
     - https://cloud.google.com/docs/authentication/application-default-credentials
 
+    Counts are round trips to the API, so concurrent requests are coalesced
+    into batches and results are cached (see `CountClient`).
+
     Args:
         model_name (str): The model name of the tokenizer.
+        project_id (str): Google Cloud project, for the default Vertex AI backend.
+        location (str): Google Cloud region, for the default Vertex AI backend.
+        backend: where counts come from, e.g. `FakeBackend` in tests.
+        window (float): seconds to wait for concurrent requests before sending a batch.
+        max_batch_size (int): requests per backend call.
+        cache: token counts by content digest, an in-memory LRU by default.
 
     Reference for token count via SDK and REST API:
     - https://cloud.google.com/vertex-ai/docs/generative-ai/multimodal/get-token-count
@@ -27,22 +36,66 @@ class GeminiTokenizer:
             "gemini-pro",
             "gemini-pro-vision",
         ],
-        project_id: str,
-        location: str,
+        project_id: Optional[str] = None,
+        location: Optional[str] = None,
+        backend: Optional[CountBackend] = None,
+        window: float = 0.005,
+        max_batch_size: int = 64,
+        cache: Optional[TokenCountCache] = None,
     ):
-        # Initialize the Vertex AI API (gets Google credentials as well)
-        vertexai.init(project=project_id, location=location)
-        self.model = GenerativeModel(model_name)
+        if backend is None:
+            backend = VertexAIBackend(model_name, project_id, location)
+        self.model_name = model_name
+        # the Vertex AI `GenerativeModel`, None with other backends
+        self.model = getattr(backend, "model", None)
+        self.client = CountClient(
+            backend,
+            f"gemini/{model_name}",
+            window=window,
+            max_batch_size=max_batch_size,
+            cache=cache if cache is not None else TokenCountCache(),
+        )
 
     def encode(self, text: str) -> list[int]:
         raise NotImplementedError("Method unavailable for Google's Gemini models.")
 
     def count_tokens(self, text: str) -> int:
-        response = self.model.count_tokens(text)
-        return response.total_tokens
+        return self.client.count(_text_contents(text))
+
+    def count_tokens_batch(self, texts: Sequence[str], num_threads: int = 8) -> list[int]:
+        """Counts many texts in as few API calls as `max_batch_size` allows."""
+        return self.client.count_many([_text_contents(text) for text in texts])
 
     def count_chatml_tokens(self, messages: Sequence[ChatMLMessage]) -> int:
-        # Gemini uses "user"/"model" roles
-        # TODO: find out how many tokens each turn in conversation has
-        # We can infer the number of tokens for each turn based on the "count_tokens" method
-        pass
+        """Counts the whole conversation in one request, as it would be sent to Gemini."""
+        return self.client.count(chatml_to_contents(messages))
+
+
+def chatml_to_contents(messages: Sequence[ChatMLMessage]) -> Contents:
+    """
+    Converts ChatML messages to Gemini contents.
+
+    Gemini uses "user"/"model" roles and has no system role, so system
+    messages become user turns. Only text content is supported.
+    """
+    contents = []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            parts = [{"text": content}]
+        elif content is None:
+            raise ValueError("Function and tool calls are not supported for Gemini.")
+        else:
+            parts = []
+            for part in content:
+                if part["type"] != "text":
+                    raise ValueError(f"Unsupported content type {part['type']!r} for Gemini.")
+                parts.append({"text": part["text"]})
+        role = "model" if message["role"] == "assistant" else "user"
+        contents.append({"role": role, "parts": parts})
+    return contents
+
+
+def _text_contents(text: str) -> Contents:
+    # the API counts a bare string as a user turn
+    return [{"role": "user", "parts": [{"text": text}]}]
@@ -0,0 +1,262 @@
+"""
+Opt-in metrics of the tokenizers' hot paths.
+
+`enable(*sinks)` wraps the counting methods of `OpenAITokenizer`,
+`AnthropicTokenizer`, `MockAITokenizer` and `FunctionJSONSchema.to_typescript`
+so that each call emits a `CallEvent` (method, model, seconds, input bytes,
+tokens) to the sinks; `disable()` puts the original methods back, so there is
+no overhead at all while disabled. Times include nested calls, e.g.
+`count_chatml_tokens` includes its `count_message_tokens` calls, which are
+recorded too.
+
+A sink is any callable taking a `CallEvent`: a callback, or a `HistogramSink`,
+which aggregates events in memory and renders them in the Prometheus text format.
+"""
+
+import bisect
+import functools
+import inspect
+import itertools
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, NamedTuple, Sequence
+
+# methods that are wrapped, on the classes that define them
+TOKENIZER_METHODS = (
+    "encode",
+    "encode_batch",
+    "count_tokens",
+    "count_tokens_batch",
+    "count_message_tokens",
+    "count_chatml_message_tokens",
+    "count_chatml_tokens",
+    "count_chatml_tokens_many",
+    "count_chatml_prompt_tokens",
+    "count_completion_tokens",
+    "count_functions_tokens",
+    "count_tools_tokens",
+)
+# upper bounds of the latency buckets, in seconds
+DEFAULT_BUCKETS = (
+    1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 1.0
+)
+
+Sink = Callable[["CallEvent"], None]
+
+
+class CallEvent(NamedTuple):
+    method: str
+    model: str
+    seconds: float
+    input_bytes: int
+    tokens: int
+
+
+_lock = threading.Lock()
+_sinks: list[Sink] = []
+# (class, method name, original function) of the wrapped methods
+_patched: list[tuple[type, str, Callable]] = []
+
+
+def enable(*sinks: Sink):
+    """Starts emitting events to `sinks` (in addition to the current ones)."""
+    with _lock:
+        _sinks.extend(sinks)
+        if not _patched:
+            _patch()
+
+
+def disable():
+    """Restores the original methods and removes every sink."""
+    with _lock:
+        for cls, name, original in reversed(_patched):
+            setattr(cls, name, original)
+        _patched.clear()
+        _sinks.clear()
+
+
+def is_enabled() -> bool:
+    return bool(_patched)
+
+
+class instrumented:
+    """Context manager that enables instrumentation with `sinks`, then disables it."""
+
+    def __init__(self, *sinks: Sink):
+        self.sinks = sinks
+
+    def __enter__(self):
+        enable(*self.sinks)
+        return self
+
+    def __exit__(self, *exc_info):
+        disable()
+
+
+def _patch():
+    # importing the providers is what `enable` costs; it is deferred until then
+    from .anthropic.anthropic import AnthropicTokenizer
+    from .jsonschema_formatter import FunctionJSONSchema
+    from .mockai.tokenizer import MockAITokenizer
+    from .openai import OpenAITokenizer
+
+    for cls in (OpenAITokenizer, AnthropicTokenizer, MockAITokenizer):
+        for name in TOKENIZER_METHODS:
+            original = cls.__dict__.get(name)
+            if original is not None:
+                setattr(cls, name, _wrap(original, name, _tokenizer_model))
+                _patched.append((cls, name, original))
+    original = FunctionJSONSchema.to_typescript
+    FunctionJSONSchema.to_typescript = _wrap(original, "to_typescript", lambda _: "")
+    _patched.append((FunctionJSONSchema, "to_typescript", original))
+
+
+def _wrap(method: Callable, name: str, model_of: Callable[[Any], str]) -> Callable:
+    # the measured input is the first argument after `self`, if any, which may
+    # be passed by keyword, e.g. `count_tokens(text=...)`
+    parameters = list(inspect.signature(method).parameters)
+    input_name = parameters[1] if len(parameters) > 1 else None
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = method(self, *args, **kwargs)
+        seconds = time.perf_counter() - start
+        if _sinks:
+            event = CallEvent(
+                name,
+                model_of(self),
+                seconds,
+                _input_bytes(
+                    args[0] if args else kwargs.get(input_name) if input_name else self
+                ),
+                _tokens(name, result),
+            )
+            for sink in _sinks:
+                sink(event)
+        return result
+
+    return wrapper
+
+
+def _tokenizer_model(tokenizer) -> str:
+    return getattr(tokenizer, "model", None) or getattr(tokenizer, "model_name", "")
+
+
+def _input_bytes(value: Any) -> int:
+    """UTF-8 size of a text, of texts, of the contents of messages, or of functions as JSON."""
+    if isinstance(value, str):
+        return len(value.encode("utf-8", "surrogatepass"))
+    if isinstance(value, dict):
+        content = value.get("content")
+        if "role" in value and (content is None or isinstance(content, str)):
+            size = _input_bytes(content or "")
+            if value.get("function_call"):
+                size += _input_bytes(value["function_call"].get("arguments", ""))
+            for tool_call in value.get("tool_calls") or ():
+                size += _input_bytes(tool_call["function"].get("arguments", ""))
+            return size
+        return _input_bytes(json.dumps(value, ensure_ascii=False))
+    if isinstance(value, (list, tuple)):
+        return sum(map(_input_bytes, value))
+    functions = getattr(value, "functions", None)  # FunctionJSONSchema
+    if functions is not None:
+        return _input_bytes(functions)
+    return 0
+
+
+def _tokens(method: str, result: Any) -> int:
+    """Tokens counted (or produced, for `encode`) by a call."""
+    if method == "encode":
+        return len(result)
+    if method == "encode_batch":
+        return sum(map(len, result))
+    if isinstance(result, list):
+        # `count_tokens_batch` and `count_chatml_tokens_many`
+        return sum(result)
+    return result if isinstance(result, int) else 0
+
+
+@dataclass
+class _Series:
+    calls: int = 0
+    seconds: float = 0.0
+    input_bytes: int = 0
+    tokens: int = 0
+    buckets: list[int] = field(default_factory=list)
+
+
+class HistogramSink:
+    """
+    Aggregates events per (method, model): calls, seconds, input bytes, tokens
+    and a latency histogram. Thread-safe.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series: dict[tuple[str, str], _Series] = {}
+
+    def __call__(self, event: CallEvent):
+        key = (event.method, event.model)
+        index = bisect.bisect_left(self.buckets, event.seconds)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(buckets=[0] * (len(self.buckets) + 1))
+            series.calls += 1
+            series.seconds += event.seconds
+            series.input_bytes += event.input_bytes
+            series.tokens += event.tokens
+            series.buckets[index] += 1
+
+    def snapshot(self) -> dict[tuple[str, str], dict[str, Any]]:
+        """Totals per (method, model), with cumulative bucket counts by upper bound."""
+        bounds = self.buckets + (float("inf"),)
+        with self._lock:
+            return {
+                key: {
+                    "calls": series.calls,
+                    "seconds": series.seconds,
+                    "input_bytes": series.input_bytes,
+                    "tokens": series.tokens,
+                    "buckets": dict(zip(bounds, itertools.accumulate(series.buckets))),
+                }
+                for key, series in self._series.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def prometheus_text(self, prefix: str = "totokenizers") -> str:
+        """The snapshot in the Prometheus text exposition format (version 0.0.4)."""
+        snapshot = sorted(self.snapshot().items())
+        lines = []
+        for metric, kind, help_text, value_of in (
+            ("calls_total", "counter", "Calls per method and model.", lambda s: s["calls"]),
+            ("input_bytes_total", "counter", "UTF-8 bytes of input.", lambda s: s["input_bytes"]),
+            ("tokens_total", "counter", "Tokens counted or produced.", lambda s: s["tokens"]),
+        ):
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} {kind}")
+            for (method, model), series in snapshot:
+                lines.append(f"{prefix}_{metric}{{{_labels(method, model)}}} {value_of(series)}")
+        name = f"{prefix}_call_duration_seconds"
+        lines.append(f"# HELP {name} Time spent per call, including nested calls.")
+        lines.append(f"# TYPE {name} histogram")
+        for (method, model), series in snapshot:
+            labels = _labels(method, model)
+            for bound, count in series["buckets"].items():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {series['seconds']!r}")
+            lines.append(f"{name}_count{{{labels}}} {series['calls']}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(method: str, model: str) -> str:
+    model = model.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'method="{method}",model="{model}"'
@@ -1,76 +1,119 @@
 import json
 import textwrap
 
+_DEFS_PREFIX = "#/$defs/"
+# historically, any other `$ref` is looked up in `definitions` past this many characters
+_DEFINITIONS_PREFIX_LENGTH = len("#/definitions/")
+_MISSING = object()
+
 
 def _format_tool(tool):
     """https://gist.github.com/CGamesPlay/dd4f108f27e2eec145eedf5c717318f5"""
+    try:
+        json_schema = tool["parameters"]
+    except KeyError:
+        tool = tool["function"]
+        json_schema = tool["parameters"]
+    parts = [f"// {tool['description']}\ntype {tool['name']} = ("]
+    formatted = _SchemaRenderer(json_schema).format_object(json_schema, 0)
+    if formatted is not None:
+        parts.append("_: ")
+        parts.append(formatted)
+    parts.append(") => any;\n\n")
+    return "".join(parts)
+
+
+class _SchemaRenderer:
+    """
+    Renders the parameters of one tool.
+
+    `$ref`s are resolved once each, and a shared definition is rendered once
+    per indentation level however many properties refer to it.
+    """
+
+    __slots__ = ("json_schema", "_definitions", "_fragments")
+
+    def __init__(self, json_schema: dict):
+        self.json_schema = json_schema
+        self._definitions: dict[str, dict] = {}
+        self._fragments: dict[tuple[str, int], str | None] = {}
 
-    def resolve_ref(schema):
-        if schema.get("$ref") is not None:
-            ref = schema["$ref"][14:]
-            schema = json_schema["definitions"][ref]
-        return schema
+    def resolve_ref(self, schema: dict) -> dict:
+        ref = schema.get("$ref")
+        if ref is None:
+            return schema
+        return self._definition(ref)
 
-    def format_schema(schema, indent):
-        schema = resolve_ref(schema)
+    def _definition(self, ref: str) -> dict:
+        definition = self._definitions.get(ref)
+        if definition is None:
+            if ref.startswith(_DEFS_PREFIX) and "$defs" in self.json_schema:
+                definition = self.json_schema["$defs"][ref[len(_DEFS_PREFIX) :]]
+            else:
+                definition = self.json_schema["definitions"][ref[_DEFINITIONS_PREFIX_LENGTH:]]
+            self._definitions[ref] = definition
+        return definition
+
+    def format_schema(self, schema: dict, indent: int) -> str | None:
+        schema = self.resolve_ref(schema)
         if "enum" in schema:
-            return _format_enum(schema, indent)
+            return " | ".join([json.dumps(o) for o in schema["enum"]])
         elif schema["type"] == "object":
-            return format_object(schema, indent)
+            return self.format_object(schema, indent)
         elif schema["type"] == "integer":
             return "number"
         elif schema["type"] in ["string", "number"]:
             return schema["type"]
         elif schema["type"] == "array":
-            return format_schema(schema["items"], indent) + "[]"
+            return self.format_schema(schema["items"], indent) + "[]"
         else:
             raise ValueError("unknown schema type " + schema["type"])
 
-    def _format_enum(schema, indent):
-        return " | ".join(json.dumps(o) for o in schema["enum"])
-
-    def format_object(schema, indent):
-        result = "{\n"
+    def format_object(self, schema: dict, indent: int) -> str | None:
         if "properties" not in schema or len(schema["properties"]) == 0:
             if schema.get("additionalProperties", False):
                 return "object"
             return None
+        parts = ["{\n"]
+        padding = "  " * indent
         for key, value in schema["properties"].items():
-            value = resolve_ref(value)
-            value_rendered = format_schema(value, indent + 1)
+            ref = value.get("$ref")
+            if ref is None:
+                value_rendered = self.format_schema(value, indent + 1)
+            else:
+                value = self._definition(ref)
+                value_rendered = self._fragments.get((ref, indent + 1), _MISSING)
+                if value_rendered is _MISSING:
+                    value_rendered = self.format_schema(value, indent + 1)
+                    self._fragments[ref, indent + 1] = value_rendered
             if value_rendered is None:
                 continue
             if "description" in value and indent == 0:
-                for line in textwrap.dedent(value["description"]).strip().split("\n"):
-                    result += f"{'  '*indent}// {line}\n"
+                parts.extend(f"// {line}\n" for line in _description_lines(value["description"]))
             optional = "" if key in schema.get("required", {}) else "?"
             comment = (
                 ""
                 if value.get("default") is None
-                else f" // default: {format_default(value)}"
+                else f" // default: {_format_default(value)}"
             )
-            result += f"{'  '*indent}{key}{optional}: {value_rendered},{comment}\n"
-        result += ("  " * (indent - 1)) + "}"
-        return result
-
-    def format_default(schema):
-        v = schema["default"]
-        if schema["type"] == "number":
-            return f"{v:.1f}" if float(v).is_integer() else str(v)
-        else:
-            return str(v)
+            parts.append(f"{padding}{key}{optional}: {value_rendered},{comment}\n")
+        parts.append(("  " * (indent - 1)) + "}")
+        return "".join(parts)
 
-    try:
-        json_schema = tool["parameters"]
-    except KeyError:
-        tool = tool["function"]
-        json_schema = tool["parameters"]
-    result = f"// {tool['description']}\ntype {tool['name']} = ("
-    formatted = format_object(json_schema, 0)
-    if formatted is not None:
-        result += "_: " + formatted
-    result += ") => any;\n\n"
-    return result
+
+def _description_lines(description: str) -> list[str]:
+    if "\n" not in description:
+        # what dedenting a single line amounts to
+        return [description.strip()]
+    return textwrap.dedent(description).strip().split("\n")
+
+
+def _format_default(schema):
+    v = schema["default"]
+    if schema["type"] == "number":
+        return f"{v:.1f}" if float(v).is_integer() else str(v)
+    else:
+        return str(v)
 
 
 class FunctionJSONSchema:
@@ -1,19 +1,35 @@
 import logging
-from typing import Literal, Optional, Sequence, Mapping
+import os
+from typing import Iterable, Iterator, Literal, Mapping, Optional, Sequence
 
+from .. import aio, chunking, streaming, truncation
+from ..arrays import TokenArray, ragged_from_lists, uint32_array
+from ..cache import FunctionsCache, TokenCountCache, message_key, namespace_for
+from ..chunking import TextChunk
 from ..jsonschema_formatter import FunctionJSONSchema
 from ..schemas import Chat, ChatMLMessage, FunctionCallChatMLMessage, FunctionChatMLMessage
+from ..truncation import TruncationSide
 
 logger = logging.getLogger("totokenizers")
 
 
 class MockAITokenizer:
+    # opt-in, e.g. `tokenizer.message_cache = TokenCountCache()`
+    message_cache: Optional[TokenCountCache] = None
+    functions_cache: Optional[FunctionsCache] = None
 
     def __init__(
         self,
         model_name: Literal["always-func", "always-chat"],
     ):
         self.model = model_name
+        self.cache_namespace = "mockai"
+        self.encoding_fingerprint = "1"
+
+    def __reduce__(self):
+        from ..factories import Totokenizer
+
+        return Totokenizer.from_model, (f"mockai/{self.model}",)
 
     def encode(self, text: str) -> list[int]:
         return [1] * len(text)
@@ -21,15 +37,105 @@ class MockAITokenizer:
     def count_tokens(self, text: str) -> int:
         return len(text)
 
+    def encode_batch(self, texts: Sequence[str], num_threads: int = 8) -> list[list[int]]:
+        return [self.encode(text) for text in texts]
+
+    def encode_to_array(self, text: str) -> TokenArray:
+        return uint32_array(self.encode(text))
+
+    def encode_batch_ragged(
+        self, texts: Sequence[str], num_threads: int = 8
+    ) -> tuple[TokenArray, TokenArray]:
+        return ragged_from_lists(self.encode_batch(texts))
+
+    def count_tokens_batch(self, texts: Sequence[str], num_threads: int = 8) -> list[int]:
+        return [self.count_tokens(text) for text in texts]
+
+    async def acount_tokens(self, text: str) -> int:
+        """Same as `count_tokens`, off the event loop for large texts (see `aio`)."""
+        return await aio.acount_tokens(self, text)
+
+    async def acount_tokens_batch(self, texts: Sequence[str]) -> list[int]:
+        return await aio.acount_tokens_batch(self, texts)
+
+    async def acount_chatml_tokens(
+        self, messages: Chat, functions: Optional[Sequence[Mapping]] = None
+    ) -> int:
+        return await aio.acount_chatml_tokens(self, messages, functions)
+
+    def count_tokens_stream(
+        self,
+        chunks: Iterable[str | bytes],
+        window: int = 2**18,
+        num_threads: Optional[int] = None,
+    ) -> int:
+        """Counts tokens of a stream of text or UTF-8 chunks in bounded memory."""
+        return streaming.count_tokens_stream(self, chunks, window, num_threads)
+
+    def count_file(
+        self,
+        path: str | os.PathLike,
+        window: int = 2**18,
+        num_threads: Optional[int] = None,
+    ) -> int:
+        """Counts tokens of a UTF-8 file through `mmap` in bounded memory."""
+        return streaming.count_file(self, path, window, num_threads)
+
+    def truncate_text(
+        self, text: str, max_tokens: int, side: TruncationSide = "end"
+    ) -> str:
+        """Cuts `text` to at most `max_tokens` tokens, tokenizing only about that many."""
+        return truncation.truncate_text(self, text, max_tokens, side)
+
+    def chunk_text(
+        self, text: str, chunk_tokens: int = 512, overlap_tokens: int = 0
+    ) -> Iterator[TextChunk]:
+        """Yields `(text, start_char, end_char, num_tokens)` chunks of at most `chunk_tokens`."""
+        return chunking.iter_chunks(self, text, chunk_tokens, overlap_tokens)
+
+    def chunk_texts(
+        self,
+        texts: Sequence[str],
+        chunk_tokens: int = 512,
+        overlap_tokens: int = 0,
+        num_threads: int = 8,
+    ) -> list[list[TextChunk]]:
+        """Same as `chunk_text` for many documents at once."""
+        return chunking.chunk_batch(self, texts, chunk_tokens, overlap_tokens, num_threads)
+
+    def _token_starts(self, text: str) -> list[int]:
+        return list(range(len(text)))
+
     def count_chatml_tokens(
         self, messages: Chat, functions: Optional[Sequence[Mapping]] = None
     ) -> int:
         num_tokens = sum(map(self.count_message_tokens, messages))
-        if functions:
-            num_tokens += self.count_functions_tokens(functions)
+        functions_tokens = self.count_functions_tokens(functions) if functions else None
+        return self._chatml_total(num_tokens, messages, functions_tokens)
+
+    def _chatml_total(
+        self, messages_tokens: int, messages: Chat, functions_tokens: Optional[int]
+    ) -> int:
+        num_tokens = messages_tokens
+        if functions_tokens is not None:
+            num_tokens += functions_tokens
         return num_tokens
 
     def count_message_tokens(self, message: ChatMLMessage | FunctionCallChatMLMessage | FunctionChatMLMessage) -> int:
+        if self.message_cache is not None:
+            return self.message_cache.get_or_compute(
+                message_key(namespace_for(self, self.message_cache), message),
+                lambda: self._count_message_tokens(message),
+            )
+        return self._count_message_tokens(message)
+
+    def estimate_upper_bound(self, text: str) -> int:
+        return self.count_tokens(text)
+
+    def estimate_message_upper_bound(self, message: ChatMLMessage | FunctionCallChatMLMessage | FunctionChatMLMessage) -> int:
+        return self._count_message_tokens(message)
+
+    def _count_message_tokens(self, message: ChatMLMessage | FunctionCallChatMLMessage | FunctionChatMLMessage) -> int:
         num_tokens = 0
         if message["role"] == "function":
             num_tokens += (
@@ -53,5 +159,9 @@ class MockAITokenizer:
         return num_tokens
 
     def count_functions_tokens(self, functions: list[dict]) -> int:
+        if self.functions_cache is not None:
+            return self.functions_cache.count(
+                self.cache_namespace, functions, self.count_tokens
+            )
         num_tokens = len(self.encode(FunctionJSONSchema(functions).to_typescript()))
         return num_tokens
@@ -1,10 +1,28 @@
+import functools
+import hashlib
+import itertools
 import logging
-from typing import Mapping, Optional, Sequence
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Mapping, Optional, Sequence
 
 import tiktoken
 
-from .errors import ModelNotFound, ModelNotSupported
+from . import aio, chunking, streaming, truncation
+from .arrays import TokenArray, ragged_from_arrays, uint32_array, uint32_from_buffer
+from .cache import (
+    FunctionsCache,
+    TokenCountCache,
+    message_key,
+    namespace_for,
+    text_key,
+)
+from .chunking import TextChunk
+from .errors import ModelNotFound, ModelNotSupported, TokenLimitExceeded
 from .jsonschema_formatter import FunctionJSONSchema
+from .openai_info import OPEN_AI_EMBEDDING_MODELS
+from .registry import REGISTRY
 from .schemas import (
     Chat,
     ChatImageContent,
@@ -16,9 +34,12 @@ from .schemas import (
     ToolCallMLMessage,
     ToolMLMessage,
 )
+from .truncation import TruncationSide
 
 logger = logging.getLogger("totokenizers")
 
+_UTF8_CONTINUATION_BYTES = bytes(range(0x80, 0xC0))
+
 
 class OpenAITokenizer:
     funcion_header = "\n".join(
@@ -32,6 +53,12 @@ class OpenAITokenizer:
             "} // namespace functions",
         ]
     )
+    # opt-in, e.g. `tokenizer.message_cache = TokenCountCache()`
+    message_cache: Optional[TokenCountCache] = None
+    functions_cache: Optional[FunctionsCache] = None
+    # consulted by `count_tokens` for texts of at least `text_cache_min_length` chars
+    text_cache: Optional[TokenCountCache] = None
+    text_cache_min_length = 1024
 
     def __init__(
         self,
@@ -43,12 +70,35 @@ class OpenAITokenizer:
                 model_name
                 == "ft:gpt-4o-2024-08-06:osf-digital:revenue-cloud-4o:A5s5vXgB"
             ):
-                self.encoder = tiktoken.encoding_for_model("gpt-4o")
+                encoding_name = tiktoken.encoding_name_for_model("gpt-4o")
             else:
-                self.encoder = tiktoken.encoding_for_model(model_name)
+                encoding_name = tiktoken.encoding_name_for_model(model_name)
         except KeyError:
             raise ModelNotFound(model_name)
+        self.encoder = REGISTRY.get_encoder(
+            f"tiktoken/{encoding_name}", lambda: tiktoken.get_encoding(encoding_name)
+        )
+        self._init_count_fast_path()
         self._init_model_params()
+        self._init_tools_params()
+        self._init_constants(encoding_name)
+
+    def __reduce__(self):
+        # pickled by model tag, unpickling gets the process' shared tokenizer
+        from .factories import Totokenizer
+
+        return Totokenizer.from_model, (f"openai/{self.model}",)
+
+    def _init_count_fast_path(self):
+        # tiktoken can encode into a flat uint32 buffer instead of a list of ints,
+        # but that entry point skips the check for disallowed special tokens
+        self._encode_to_buffer = getattr(
+            getattr(self.encoder, "_core_bpe", None), "encode_to_tiktoken_buffer", None
+        )
+        special_tokens = sorted(self.encoder.special_tokens_set, key=len, reverse=True)
+        self._special_tokens_regex = (
+            re.compile("|".join(map(re.escape, special_tokens))) if special_tokens else None
+        )
 
     def _init_model_params(self):
         """https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb"""
@@ -60,6 +110,7 @@ class OpenAITokenizer:
             "gpt-3.5-turbo-instruct",
         ):
             self.count_chatml_tokens = NotImplementedError  # type: ignore
+            self.count_chatml_tokens_many = NotImplementedError  # type: ignore
             self.count_functions_tokens = NotImplementedError  # type: ignore
             self.count_message_tokens = NotImplementedError  # type: ignore
             return
@@ -74,27 +125,249 @@ class OpenAITokenizer:
             self.tokens_per_name = 1
             self.tokens_per_image = 85
 
+    def _init_tools_params(self):
+        model = self.model
+        if model.startswith("openai/"):
+            model = model.split("/")[-1]
+
+        if model in ["gpt-3.5-turbo", "gpt-4"]:
+            self.func_init = 10
+            self.func_end = 12
+        else:
+            self.func_init = 7
+            self.func_end = 12
+
+        try:
+            encoding_name = tiktoken.encoding_name_for_model(model)
+        except KeyError:
+            logger.warning(f"Model {model} not found. Using o200k_base encoding.")
+            encoding_name = "o200k_base"
+        self._tools_encoder = REGISTRY.get_encoder(
+            f"tiktoken/{encoding_name}", lambda: tiktoken.get_encoding(encoding_name)
+        )
+
+    def _init_constants(self, encoding_name: str):
+        """Counts the constant strings of the hot paths once, instead of on every call."""
+        self._role_tokens = {
+            role: self.count_tokens(role)
+            for role in ("system", "user", "assistant", "function", "tool")
+        }
+        self._functions_header_tokens = self.count_tokens(self.funcion_header)
+        # entries are shared by every model with the same encoding and accounting
+        self.cache_namespace = "/".join(
+            str(part)
+            for part in (
+                "tiktoken",
+                encoding_name,
+                getattr(self, "tokens_per_message", None),
+                getattr(self, "tokens_per_name", None),
+                getattr(self, "tokens_per_image", None),
+                self.func_init,
+                self.func_end,
+                self._tools_encoder.name,
+            )
+        )
+
+    @functools.cached_property
+    def encoding_fingerprint(self) -> str:
+        """Digest of the encoding data, used to version persistent caches."""
+        fingerprint = _encoding_fingerprint(self.encoder)
+        if self._tools_encoder is not self.encoder:
+            fingerprint += _encoding_fingerprint(self._tools_encoder)
+        return fingerprint
+
     def encode(self, text: str) -> list[int]:
         return self.encoder.encode(text)
 
+    def _encode_buffer(self, text: str):
+        """Encodes into tiktoken's uint32 buffer, or returns None if `encode` must be used."""
+        if self._encode_to_buffer is None or (
+            self._special_tokens_regex is not None
+            and self._special_tokens_regex.search(text)
+        ):
+            # let tiktoken raise its own error for disallowed special tokens
+            return None
+        try:
+            return self._encode_to_buffer(text, set())
+        except UnicodeEncodeError:
+            # tiktoken fixes up lone surrogates before encoding
+            return None
+
     def count_tokens(self, text: str) -> int:
-        return len(self.encode(text))
+        """Counts tokens without materializing the list of token ids when possible."""
+        if self.text_cache is not None and len(text) >= self.text_cache_min_length:
+            return self.text_cache.get_or_compute(
+                text_key(namespace_for(self, self.text_cache), text),
+                lambda: self._count_tokens(text),
+            )
+        return self._count_tokens(text)
+
+    def _count_tokens(self, text: str) -> int:
+        buffer = self._encode_buffer(text)
+        if buffer is None:
+            return len(self.encoder.encode(text))
+        return memoryview(buffer).nbytes // 4
+
+    def encode_to_array(self, text: str) -> TokenArray:
+        buffer = self._encode_buffer(text)
+        if buffer is None:
+            return uint32_array(self.encoder.encode(text))
+        return uint32_from_buffer(buffer)
+
+    def encode_batch_ragged(
+        self, texts: Sequence[str], num_threads: int = 8
+    ) -> tuple[TokenArray, TokenArray]:
+        """Returns all token ids in one flat buffer plus offsets, such that
+        `tokens[offsets[i]:offsets[i + 1]]` are the ids of `texts[i]`."""
+        arrays = self._map_threads(self.encode_to_array, texts, num_threads)
+        return ragged_from_arrays(arrays)
+
+    def encode_batch(self, texts: Sequence[str], num_threads: int = 8) -> list[list[int]]:
+        return self.encoder.encode_batch(list(texts), num_threads=num_threads)
+
+    def count_tokens_batch(self, texts: Sequence[str], num_threads: int = 8) -> list[int]:
+        """Counts tokens of many texts in a thread pool (tiktoken releases the GIL)."""
+        return self._map_threads(self.count_tokens, texts, num_threads)
+
+    async def acount_tokens(self, text: str) -> int:
+        """Same as `count_tokens`, off the event loop for large texts (see `aio`)."""
+        return await aio.acount_tokens(self, text)
+
+    async def acount_tokens_batch(self, texts: Sequence[str]) -> list[int]:
+        return await aio.acount_tokens_batch(self, texts)
+
+    async def acount_chatml_tokens(
+        self, messages: Chat, functions: Optional[Sequence[Mapping]] = None
+    ) -> int:
+        return await aio.acount_chatml_tokens(self, messages, functions)
+
+    def count_tokens_stream(
+        self,
+        chunks: Iterable[str | bytes],
+        window: int = 2**18,
+        num_threads: Optional[int] = None,
+    ) -> int:
+        """Counts tokens of a stream of text or UTF-8 chunks in bounded memory."""
+        return streaming.count_tokens_stream(self, chunks, window, num_threads)
+
+    def count_file(
+        self,
+        path: str | os.PathLike,
+        window: int = 2**18,
+        num_threads: Optional[int] = None,
+    ) -> int:
+        """Counts tokens of a UTF-8 file through `mmap` in bounded memory."""
+        return streaming.count_file(self, path, window, num_threads)
+
+    def truncate_text(
+        self, text: str, max_tokens: int, side: TruncationSide = "end"
+    ) -> str:
+        """Cuts `text` to at most `max_tokens` tokens, tokenizing only about that many."""
+        return truncation.truncate_text(self, text, max_tokens, side)
+
+    def chunk_text(
+        self, text: str, chunk_tokens: int = 512, overlap_tokens: int = 0
+    ) -> Iterator[TextChunk]:
+        """
+        Yields `(text, start_char, end_char, num_tokens)` chunks of at most `chunk_tokens`.
+
+        Raises TokenLimitExceeded if this is an embedding model and chunks could be too long.
+        """
+        self._check_chunk_tokens(chunk_tokens)
+        return chunking.iter_chunks(self, text, chunk_tokens, overlap_tokens)
+
+    def chunk_texts(
+        self,
+        texts: Sequence[str],
+        chunk_tokens: int = 512,
+        overlap_tokens: int = 0,
+        num_threads: int = 8,
+    ) -> list[list[TextChunk]]:
+        """Same as `chunk_text` for many documents at once."""
+        self._check_chunk_tokens(chunk_tokens)
+        return chunking.chunk_batch(self, texts, chunk_tokens, overlap_tokens, num_threads)
+
+    def _check_chunk_tokens(self, chunk_tokens: int):
+        model_info = OPEN_AI_EMBEDDING_MODELS.get(self.model)
+        if model_info is not None and chunk_tokens > model_info.max_tokens:
+            raise TokenLimitExceeded(model_info.max_tokens, self.model, chunk_tokens)
+
+    def _token_starts(self, text: str) -> list[int]:
+        """Same offsets as tiktoken's `decode_with_offsets`, without decoding text."""
+        token_bytes = self.encoder.decode_tokens_bytes(self.encode(text))
+        if text.isascii():
+            return list(itertools.accumulate(map(len, token_bytes), initial=0))[:-1]
+        starts = []
+        num_chars = 0
+        for data in token_bytes:
+            # tokens starting inside a character get that character's offset
+            starts.append(max(0, num_chars - (0x80 <= data[0] < 0xC0)))
+            num_chars += len(data.translate(None, _UTF8_CONTINUATION_BYTES))
+        return starts
+
+    @staticmethod
+    def _map_threads(func, texts: Sequence[str], num_threads: int) -> list:
+        if num_threads <= 1 or len(texts) <= 1:
+            return list(map(func, texts))
+        with ThreadPoolExecutor(num_threads) as executor:
+            return list(executor.map(func, texts))
 
     def count_chatml_tokens(
         self, messages: Chat, functions: Optional[Sequence[Mapping]] = None
     ) -> int:
         num_tokens = sum(map(self.count_message_tokens, messages))
+        functions_tokens = self.count_functions_tokens(functions) if functions else None
+        return self._chatml_total(num_tokens, messages, functions_tokens)
+
+    def _chatml_total(
+        self, messages_tokens: int, messages: Chat, functions_tokens: Optional[int]
+    ) -> int:
+        """Adds the chat-level tokens to the sum of the message counts."""
+        num_tokens = messages_tokens
         num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
-        if functions:
+        if functions_tokens is not None:
             if messages[0]["role"] == "system":
                 num_tokens -= (
                     1  # I believe a newline gets removed somewhere for somereason
                 )
             else:
                 num_tokens += self.tokens_per_message
-            num_tokens += self.count_functions_tokens(functions)
+            num_tokens += functions_tokens
         return num_tokens
 
+    def count_chatml_tokens_many(
+        self,
+        chats: Sequence[Chat],
+        functions: Optional[Sequence[Mapping]] = None,
+        num_threads: int = 8,
+    ) -> list[int]:
+        """
+        Same as `count_chatml_tokens` for each chat, sharing the same functions.
+
+        The strings of every message are deduplicated and encoded in a single
+        batch, then the per-chat totals are reassembled.
+        Feed very large corpora in chunks, since unique strings are held in memory.
+        """
+        unique_texts: dict[str, int] = {}
+        plans: list[tuple[int, list[int]]] = []
+        functions_tokens = self.count_functions_tokens(functions) if functions else None
+        for messages in chats:
+            num_tokens = 0
+            text_indices = []
+            for message in messages:
+                message_tokens, texts = self._message_token_parts(message)
+                num_tokens += message_tokens
+                for text in texts:
+                    text_indices.append(unique_texts.setdefault(text, len(unique_texts)))
+            num_tokens = self._chatml_total(num_tokens, messages, functions_tokens)
+            plans.append((num_tokens, text_indices))
+
+        text_counts = self.count_tokens_batch(list(unique_texts), num_threads=num_threads)
+        return [
+            num_tokens + sum(text_counts[i] for i in text_indices)
+            for num_tokens, text_indices in plans
+        ]
+
     def count_message_tokens(
         self,
         message: ChatMLMessage
@@ -104,94 +377,172 @@ class OpenAITokenizer:
         | ToolCallMLMessage,
     ) -> int:
         """https://github.com/openai/openai-python/blob/main/chatml.md"""
+        if self.message_cache is not None:
+            return self.message_cache.get_or_compute(
+                message_key(namespace_for(self, self.message_cache), message),
+                lambda: self._count_message_tokens(message),
+            )
+        return self._count_message_tokens(message)
+
+    def _count_message_tokens(
+        self,
+        message: ChatMLMessage
+        | FunctionCallChatMLMessage
+        | FunctionChatMLMessage
+        | ToolMLMessage
+        | ToolCallMLMessage,
+    ) -> int:
+        num_tokens, texts = self._message_token_parts(message)
+        return num_tokens + sum(map(self.count_tokens, texts))
+
+    def estimate_upper_bound(self, text: str) -> int:
+        """Cheap bound on `count_tokens(text)`: byte-level BPE yields at most one token per byte."""
+        if text.isascii():
+            return len(text)
+        # tiktoken replaces lone surrogates with the 3-byte U+FFFD
+        return len(text.encode("utf-8", "surrogatepass"))
+
+    def estimate_message_upper_bound(
+        self,
+        message: ChatMLMessage
+        | FunctionCallChatMLMessage
+        | FunctionChatMLMessage
+        | ToolMLMessage
+        | ToolCallMLMessage,
+    ) -> int:
+        """Cheap bound on `count_message_tokens(message)`."""
+        num_tokens, texts = self._message_token_parts(message)
+        return num_tokens + sum(map(self.estimate_upper_bound, texts))
+
+    def _message_token_parts(
+        self,
+        message: ChatMLMessage
+        | FunctionCallChatMLMessage
+        | FunctionChatMLMessage
+        | ToolMLMessage
+        | ToolCallMLMessage,
+    ) -> tuple[int, list[str]]:
+        """Splits a message count into a constant and the texts that must be encoded."""
         num_tokens = self.tokens_per_message
         if message["role"] == "function":
-            num_tokens += (
-                self.count_tokens(message["content"])
-                + self.count_tokens(message["name"])
-                + self.count_tokens(message["role"])
-                - 1  # omission of a delimiter?
-            )
+            texts = [message["content"], message["name"]]
+            num_tokens += self._role_token_part(message["role"], texts)
+            num_tokens -= 1  # omission of a delimiter?
         elif "function_call" in message:
             # https://github.com/forestwanglin/openai-java/blob/308a3423d34905bd28aca976fd0f2fa030f9a3a1/jtokkit/src/main/java/xyz/felh/openai/jtokkit/utils/TikTokenUtils.java#L202-L205
-            num_tokens += (
-                self.count_tokens(message["function_call"]["name"])
-                + self.count_tokens(
-                    message["function_call"]["arguments"]
-                )  # TODO: what if there are no arguments?
-                + self.count_tokens(message["role"])
-                + 3  # I believe this is due to delimiter tokens being added
-            )
+            texts = [
+                message["function_call"]["name"],
+                message["function_call"]["arguments"],  # TODO: what if there are no arguments?
+            ]
+            num_tokens += self._role_token_part(message["role"], texts)
+            num_tokens += 3  # I believe this is due to delimiter tokens being added
         elif "tool_calls" in message:
-            num_tokens += self.count_tools_tokens([message])
+            tools_tokens, texts, lines = self._tools_token_parts([message])
+            num_tokens += tools_tokens
+            if self._tools_encoder is self.encoder:
+                texts += lines
+            else:
+                num_tokens += sum(len(self._tools_encoder.encode(line)) for line in lines)
         else:
-            num_tokens += self.count_content_tokens(content=message["content"])
-            num_tokens += self.count_tokens(message["role"])
+            content_tokens, texts = self._content_token_parts(message["content"])
+            num_tokens += content_tokens
+            num_tokens += self._role_token_part(message["role"], texts)
             if "name" in message:
-                num_tokens += self.tokens_per_name + self.count_tokens(message["name"])
+                num_tokens += self.tokens_per_name
+                texts.append(message["name"])
+        return num_tokens, texts
+
+    def _role_token_part(self, role: str, texts: list[str]) -> int:
+        """Returns the precomputed count of a known role, else defers it to `texts`."""
+        num_tokens = self._role_tokens.get(role)
+        if num_tokens is None:
+            texts.append(role)
+            return 0
         return num_tokens
 
     def count_content_tokens(
         self, content: str | list[ChatTextContent | ChatImageContent]
     ) -> int:
+        num_tokens, texts = self._content_token_parts(content)
+        return num_tokens + sum(map(self.count_tokens, texts))
+
+    def _content_token_parts(
+        self, content: str | list[ChatTextContent | ChatImageContent]
+    ) -> tuple[int, list[str]]:
         if isinstance(content, str):
-            return self.count_tokens(content)
+            return 0, [content]
 
         num_tokens = 0
+        texts = []
         for item in content:
             match item:
                 case {"type": "text"}:
-                    num_tokens += self.count_tokens(item["text"])
+                    texts.append(item["text"])
                 case {"type": "image_url"}:
                     num_tokens += self.tokens_per_image
                 case _:
                     raise TypeError(f"Unknown content type: {type(item)}")
-        return num_tokens
+        return num_tokens, texts
 
     def count_functions_tokens(self, functions: list[dict]) -> int:
-        num_tokens = len(self.encode(self.funcion_header))
-        num_tokens += len(self.encode(FunctionJSONSchema(functions).to_typescript()))
+        if self.functions_cache is not None:
+            return self.functions_cache.count(
+                self.cache_namespace, functions, self._count_typescript_tokens
+            )
+        return self._count_typescript_tokens(FunctionJSONSchema(functions).to_typescript())
+
+    def _count_typescript_tokens(self, typescript: str) -> int:
+        num_tokens = self._functions_header_tokens
+        num_tokens += self.count_tokens(typescript)
         return num_tokens
 
     def count_tools_tokens(self, tools: Tool) -> int:
         """Calculate the total number of tokens for tools and messages."""
-        model = self.model
-        if model.startswith("openai/"):
-            model = model.split("/")[-1]
-
-        func_init = 0
-        func_end = 0
-
-        if model in ["gpt-3.5-turbo", "gpt-4"]:
-            func_init = 10
-            func_end = 12
+        num_tokens, texts, lines = self._tools_token_parts(tools)
+        num_tokens += sum(map(self.count_tokens, texts))
+        if self._tools_encoder is self.encoder:
+            num_tokens += sum(map(self.count_tokens, lines))
         else:
-            func_init = 7
-            func_end = 12
-
-        try:
-            encoding = tiktoken.encoding_for_model(model)
-        except KeyError:
-            logger.warning(f"Model {model} not found. Using o200k_base encoding.")
-            encoding = tiktoken.get_encoding("o200k_base")
+            num_tokens += sum(len(self._tools_encoder.encode(line)) for line in lines)
+        return num_tokens
 
+    def _tools_token_parts(self, tools: Tool) -> tuple[int, list[str], list[str]]:
+        """Splits a tools count into a constant, texts to encode and
+        function call lines to encode with the tools encoder."""
         func_token_count = 0
+        texts = []
+        lines = []
         for tool in tools:
             if content := tool.get("content"):
                 # Since message has a "content" it will be considered a ToolMLMessage
-                func_token_count += self.count_tokens(content)
+                texts.append(content)
                 if name := tool.get("name"):
-                    func_token_count += self.count_tokens(name)
+                    texts.append(name)
             elif tool_calls := tool.get("tool_calls"):
                 # Since message has a "tool_calls" it will be considered a ToolCallMLMessage
                 for call in tool_calls:
                     # Add tokens for start of each function
-                    func_token_count += func_init
+                    func_token_count += self.func_init
                     function = call["function"]
                     f_name = function["name"]
                     f_args = function["arguments"]
-                    line = f"{f_name}:{f_args}"
+                    lines.append(f"{f_name}:{f_args}")
+
+        return func_token_count + self.func_end, texts, lines
 
-                    func_token_count += len(encoding.encode(line))
 
-        return func_token_count + func_end
+def _encoding_fingerprint(encoding: tiktoken.Encoding) -> str:
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(f"{tiktoken.__version__}\0{encoding.name}\0".encode())
+    digest.update(getattr(encoding, "_pat_str", "").encode())
+    for token, rank in sorted(getattr(encoding, "_special_tokens", {}).items()):
+        digest.update(f"\0{token}\0{rank}".encode())
+    ranks = getattr(encoding, "_mergeable_ranks", None)
+    if ranks is None:
+        digest.update(b"".join(encoding.token_byte_values()))
+    else:
+        digest.update(
+            b"".join(len(token).to_bytes(2, "little") + token for token in ranks)
+        )
+        digest.update(b"".join(rank.to_bytes(4, "little") for rank in ranks.values()))
+    return digest.hexdigest()
@@ -0,0 +1,151 @@
+import collections
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, Mapping, Optional, Sequence, TypeVar
+
+from .factories import Totokenizer
+from .schemas import Chat
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# tokenizer of each worker process, set by `_init_worker`
+_worker_tokenizer = None
+
+
+class ParallelCounter:
+    """
+    Counts tokens of large corpora on a pool of processes.
+
+    Inputs are sent to workers in chunks of `chunk_size` items, with at most
+    `max_in_flight` chunks submitted at a time, and results are streamed back
+    in input order. So memory stays bounded however long the input iterable.
+
+    The tokenizer is loaded in this process before the pool starts, so with
+    the "fork" start method workers share its pages instead of each loading
+    their own; otherwise workers load it once, when they start (see
+    `default_context`). Tokenizers pickle by model tag, so they are cheap to send.
+
+    Args:
+        model_tag: `<provider>/<model>`, as in `Totokenizer.from_model`.
+        max_workers: number of processes, by default one per available CPU.
+        chunk_size: items per task.
+        max_in_flight: tasks submitted ahead of the results, by default twice `max_workers`.
+        mp_context: multiprocessing context, or start method name, by default `default_context()`.
+    """
+
+    def __init__(
+        self,
+        model_tag: str,
+        max_workers: Optional[int] = None,
+        chunk_size: int = 256,
+        max_in_flight: Optional[int] = None,
+        mp_context: Optional[str | multiprocessing.context.BaseContext] = None,
+    ):
+        self.model_tag = model_tag
+        self.tokenizer = Totokenizer.from_model(model_tag)
+        self.max_workers = max_workers or available_cpus()
+        self.chunk_size = chunk_size
+        self.max_in_flight = max_in_flight or 2 * self.max_workers
+        if mp_context is None:
+            mp_context = default_context()
+        elif isinstance(mp_context, str):
+            mp_context = multiprocessing.get_context(mp_context)
+        self._executor = ProcessPoolExecutor(
+            self.max_workers,
+            mp_context=mp_context,
+            initializer=_init_worker,
+            initargs=(model_tag,),
+        )
+
+    def count_tokens(self, texts: Iterable[str]) -> Iterator[int]:
+        """Yields `count_tokens` of each text, in order."""
+        return self._map(_count_tokens, texts)
+
+    def count_chatml_tokens(
+        self, chats: Iterable[Chat], functions: Optional[Sequence[Mapping]] = None
+    ) -> Iterator[int]:
+        """Yields `count_chatml_tokens` of each chat (with the same functions), in order."""
+        return self._map(_count_chatml_tokens, chats, functions)
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "ParallelCounter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _map(self, func: Callable[..., list[int]], items: Iterable[T], *args) -> Iterator[int]:
+        iterator = iter(items)
+        chunks = iter(lambda: list(itertools.islice(iterator, self.chunk_size)), [])
+        for counts in map_ordered(self._executor, func, chunks, self.max_in_flight, *args):
+            yield from counts
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on, the default for thread and process counts."""
+    # threads beyond the CPUs we may run on only contend for them
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def default_context() -> multiprocessing.context.BaseContext:
+    """
+    "fork" while this process runs no other thread: workers start instantly and
+    share the tokenizers already loaded here. Forking a process with other
+    threads (e.g. the `aio` pool or the sidecar server's) can deadlock workers on
+    locks those threads held, so then "forkserver" (or the platform default)
+    is used, and each worker loads its tokenizer once, when it starts.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    if "fork" in methods and threading.active_count() == 1:
+        return multiprocessing.get_context("fork")
+    if "forkserver" in methods:
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context()
+
+
+def map_ordered(
+    executor: Executor, func: Callable[..., R], tasks: Iterable, max_in_flight: int, *args
+) -> Iterator[R]:
+    """
+    Yields `func(task, *args)` for each task, in order, computed on `executor`
+    with at most `max_in_flight` tasks submitted ahead of the results.
+    """
+    iterator = iter(tasks)
+    pending: collections.deque[Future] = collections.deque()
+    try:
+        while True:
+            for task in itertools.islice(iterator, max_in_flight - len(pending)):
+                pending.append(executor.submit(func, task, *args))
+            if not pending:
+                return
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _init_worker(model_tag: str):
+    global _worker_tokenizer
+    # a no-op lookup in the shared registry when the worker was forked
+    _worker_tokenizer = Totokenizer.from_model(model_tag)
+
+
+def _count_tokens(texts: list[str]) -> list[int]:
+    return [_worker_tokenizer.count_tokens(text) for text in texts]
+
+
+def _count_chatml_tokens(
+    chats: list[Chat], functions: Optional[Sequence[Mapping]]
+) -> list[int]:
+    if functions:
+        return [_worker_tokenizer.count_chatml_tokens(chat, functions) for chat in chats]
+    # Anthropic's `count_chatml_tokens` takes no functions
+    return [_worker_tokenizer.count_chatml_tokens(chat) for chat in chats]
@@ -1,4 +1,5 @@
-from typing import Any, Optional, Protocol, Union
+import os
+from typing import Any, Iterable, Optional, Protocol, Sequence, Union
 
 from .schemas import (
     Chat,
@@ -18,6 +19,39 @@ class Tokenizer(Protocol):
     def count_tokens(self, text: str) -> int:
         ...
 
+    def encode_batch(self, texts: Sequence[str], num_threads: int = 8) -> list[list[int]]:
+        ...
+
+    def count_tokens_batch(self, texts: Sequence[str], num_threads: int = 8) -> list[int]:
+        ...
+
+    async def acount_tokens(self, text: str) -> int:
+        ...
+
+    async def acount_tokens_batch(self, texts: Sequence[str]) -> list[int]:
+        ...
+
+    async def acount_chatml_tokens(
+        self, messages: Chat, functions: Optional[list[dict[str, Any]]] = None
+    ) -> int:
+        ...
+
+    def count_tokens_stream(
+        self,
+        chunks: Iterable[str | bytes],
+        window: int = 2**18,
+        num_threads: Optional[int] = None,
+    ) -> int:
+        ...
+
+    def count_file(
+        self,
+        path: str | os.PathLike,
+        window: int = 2**18,
+        num_threads: Optional[int] = None,
+    ) -> int:
+        ...
+
     def count_chatml_tokens(
         self, messages: Chat, functions: Optional[list[dict[str, Any]]] = None
     ) -> int:
@@ -0,0 +1,177 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class TokenizerRegistry:
+    """
+    Thread-safe, process-wide store of shared tokenizers and encoders.
+
+    Tokenizers are keyed by model tag (e.g. "openai/gpt-4o") and encoders by
+    their identity (e.g. "tiktoken/o200k_base"), so every model that maps to
+    the same encoding shares a single encoder object.
+
+    Both stores are LRUs bounded by number of entries. Encoders hold nearly all
+    of the memory (tens of MB each, mostly outside the Python heap, where it
+    can't be measured cheaply), so `max_encoders` is what bounds memory, and
+    evicting an encoder also evicts the tokenizers that were built on top of it.
+
+    Tokenizers and encoders are built outside of the registry's lock, so a slow
+    build (e.g. downloading an encoding) only blocks the threads that need that
+    same key; concurrent requests for it wait for the one build.
+
+    Note: tiktoken keeps its own module-level cache of the built-in encodings,
+    so evicting a tiktoken encoder only drops this registry's reference.
+    """
+
+    def __init__(self, max_tokenizers: int = 64, max_encoders: int = 8):
+        self.max_tokenizers = max_tokenizers
+        self.max_encoders = max_encoders
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # ("tokenizer" or "encoder", key) -> result of the build in progress
+        self._pending: dict[tuple[str, str], Future] = {}
+        self._tokenizers: OrderedDict[str, Any] = OrderedDict()
+        self._encoders: OrderedDict[str, Any] = OrderedDict()
+        # encoder key -> model tags of the tokenizers built on top of it
+        self._dependents: dict[str, set[str]] = {}
+
+    def get_tokenizer(self, model_tag: str, factory: Callable[[], T]) -> T:
+        with self._lock:
+            if model_tag in self._tokenizers:
+                self._tokenizers.move_to_end(model_tag)
+                return self._tokenizers[model_tag]
+            future, owner = self._claim(("tokenizer", model_tag))
+        if not owner:
+            return future.result()
+        building = getattr(self._local, "building", None)
+        # encoder keys used by `factory`, recorded by `get_encoder`
+        self._local.building = used = set()
+        try:
+            tokenizer = factory()
+        except BaseException as error:
+            self._fail(("tokenizer", model_tag), future, error)
+            raise
+        finally:
+            self._local.building = building
+        with self._lock:
+            self._tokenizers[model_tag] = tokenizer
+            for key in used:
+                if key in self._dependents:
+                    self._dependents[key].add(model_tag)
+            while len(self._tokenizers) > self.max_tokenizers:
+                self._drop_tokenizer(next(iter(self._tokenizers)))
+            del self._pending["tokenizer", model_tag]
+        future.set_result(tokenizer)
+        return tokenizer
+
+    def get_encoder(self, key: str, loader: Callable[[], T]) -> T:
+        with self._lock:
+            if key in self._encoders:
+                self._encoders.move_to_end(key)
+                encoder = self._encoders[key]
+                future = None
+            else:
+                future, owner = self._claim(("encoder", key))
+        if future is not None:
+            if owner:
+                encoder = self._load_encoder(key, loader, future)
+            else:
+                encoder = future.result()
+        building = getattr(self._local, "building", None)
+        if building is not None:
+            building.add(key)
+        return encoder
+
+    def _load_encoder(self, key: str, loader: Callable[[], T], future: Future) -> T:
+        try:
+            encoder = loader()
+        except BaseException as error:
+            self._fail(("encoder", key), future, error)
+            raise
+        with self._lock:
+            self._encoders[key] = encoder
+            self._dependents[key] = set()
+            while len(self._encoders) > self.max_encoders:
+                self._drop_encoder(next(iter(self._encoders)))
+            del self._pending["encoder", key]
+        future.set_result(encoder)
+        return encoder
+
+    def _claim(self, key: tuple[str, str]) -> tuple[Future, bool]:
+        """The future of the build of `key`, and whether the caller must build it.
+        Call with the lock held."""
+        future = self._pending.get(key)
+        if future is not None:
+            return future, False
+        future = self._pending[key] = Future()
+        return future, True
+
+    def _fail(self, key: tuple[str, str], future: Future, error: BaseException):
+        with self._lock:
+            del self._pending[key]
+        future.set_exception(error)
+
+    def evict(self, model_tag: str) -> bool:
+        """Drop a tokenizer (or an encoder, given its key). Returns whether it was present."""
+        with self._lock:
+            if model_tag in self._tokenizers:
+                self._drop_tokenizer(model_tag)
+                return True
+            if model_tag in self._encoders:
+                self._drop_encoder(model_tag)
+                return True
+            return False
+
+    def clear(self):
+        with self._lock:
+            self._tokenizers.clear()
+            self._encoders.clear()
+            self._dependents.clear()
+
+    def resize(
+        self,
+        max_tokenizers: Optional[int] = None,
+        max_encoders: Optional[int] = None,
+    ):
+        with self._lock:
+            if max_tokenizers is not None:
+                self.max_tokenizers = max_tokenizers
+            if max_encoders is not None:
+                self.max_encoders = max_encoders
+            while len(self._encoders) > self.max_encoders:
+                self._drop_encoder(next(iter(self._encoders)))
+            while len(self._tokenizers) > self.max_tokenizers:
+                self._drop_tokenizer(next(iter(self._tokenizers)))
+
+    def tokenizers(self) -> list[str]:
+        with self._lock:
+            return list(self._tokenizers)
+
+    def encoders(self) -> list[str]:
+        with self._lock:
+            return list(self._encoders)
+
+    def __contains__(self, model_tag: str) -> bool:
+        with self._lock:
+            return model_tag in self._tokenizers
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._tokenizers)
+
+    def _drop_tokenizer(self, model_tag: str):
+        del self._tokenizers[model_tag]
+        for dependents in self._dependents.values():
+            dependents.discard(model_tag)
+
+    def _drop_encoder(self, key: str):
+        del self._encoders[key]
+        for model_tag in self._dependents.pop(key, ()):
+            self._tokenizers.pop(model_tag, None)
+
+
+REGISTRY = TokenizerRegistry()
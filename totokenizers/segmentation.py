@@ -0,0 +1,148 @@
+"""
+Split points that don't change tokenization.
+
+BPE tokenizers (tiktoken and HuggingFace's byte-level BPE alike) first split
+text with a pretokenization regex and never merge across those pieces. In
+every pattern we ship, a piece can start with a single space or follow a
+single newline, but never spans non-whitespace followed by either of them.
+Hence, at the split points below, `count(text) == count(text[:i]) + count(text[i:])`:
+
+- before a single space that sits between two non-whitespace characters;
+- after a single newline preceded and followed by non-whitespace characters.
+
+Text without such points (minified JSON, base64, long URLs) is split at a
+token boundary instead, checked by re-encoding a bounded neighbourhood of it
+(see `force_split`).
+"""
+
+import re
+from typing import Iterator, Optional
+
+# same points as `find_split`, searched forwards
+_SPLIT = re.compile(r"(?<=\S) (?=\S)|(?<=\S\n)(?=\S)")
+# characters re-encoded on each side of a forced split
+_FORCE_RADIUS = 256
+# token boundaries tried by `force_split` before giving up
+_FORCE_TRIES = 4
+# how far `split_before` and `split_after` look for a safe split point
+_SPLIT_REACH = 1024
+
+
+def find_split(text: str, end: Optional[int] = None, start: int = 0) -> int:
+    """
+    Returns the last safe split index `i` with `start < i <= end`, or -1.
+
+    The character right after the split must already be known, so `end`
+    is capped at `len(text) - 1`.
+    """
+    end = len(text) - 1 if end is None else min(end, len(text) - 1)
+    if end <= start:
+        return -1
+    return max(_last_space_split(text, start, end), _last_newline_split(text, start, end))
+
+
+def find_next_split(text: str, start: int = 0, end: Optional[int] = None) -> int:
+    """Returns the first safe split index `i` with `start < i < end`, or -1."""
+    match = _SPLIT.search(text, start + 1, len(text) if end is None else end)
+    return -1 if match is None else match.start()
+
+
+def force_split(
+    tokenizer, text: str, pos: int, start: int = 0, end: Optional[int] = None
+) -> int:
+    """
+    Returns a split index `i` near `pos` with `start < i < end`, for text
+    without safe split points, or -1.
+
+    Candidates are the token boundaries of the neighbourhood
+    `text[pos - _FORCE_RADIUS : pos + _FORCE_RADIUS]` nearest to `pos`; the
+    first one at which the neighbourhood's two halves encode to as many tokens
+    as the whole is taken. Pretokenized pieces and their merges are local, so
+    this holds for the whole text too unless a single piece outgrows the
+    neighbourhood.
+
+    `tokenizer` must implement `count_tokens` and `_token_starts`.
+    """
+    end = len(text) if end is None else min(end, len(text))
+    lo = max(pos - _FORCE_RADIUS, 0)
+    neighbourhood = text[lo : pos + _FORCE_RADIUS]
+    starts = tokenizer._token_starts(neighbourhood)
+    candidates = sorted(
+        {
+            lo + offset
+            for offset in starts
+            if start < lo + offset < end and abs(lo + offset - pos) <= _FORCE_RADIUS // 2
+        },
+        key=lambda i: abs(i - pos),
+    )
+    for i in candidates[:_FORCE_TRIES]:
+        left = tokenizer.count_tokens(neighbourhood[: i - lo])
+        if left + tokenizer.count_tokens(neighbourhood[i - lo :]) == len(starts):
+            return i
+    return -1
+
+
+def split_before(tokenizer, text: str, end: int) -> int:
+    """
+    Returns a split index shortly before `end` (or at it), or -1: the last
+    safe split point within reach, else a forced one (see `force_split`).
+    """
+    split = find_split(text, end, max(end - _SPLIT_REACH, 0))
+    if split == -1:
+        split = force_split(tokenizer, text, end, end=end + 1)
+    return split
+
+
+def split_after(tokenizer, text: str, start: int) -> int:
+    """Returns a split index shortly after `start` (or at it), or -1; see `split_before`."""
+    split = find_next_split(text, start - 1, start + _SPLIT_REACH)
+    if split == -1:
+        split = force_split(tokenizer, text, start, start=start - 1)
+    return split
+
+
+def iter_splits(
+    text: str, size: int, start: int = 0, tokenizer=None
+) -> Iterator[tuple[int, int]]:
+    """
+    Yields consecutive `(start, end)` spans covering `text[start:]`, each
+    split at a safe point and at most `size` characters long when possible.
+
+    Spans without any safe point within `size` are cut at a forced split
+    point when a `tokenizer` is given (see `force_split`), and otherwise grow
+    until the next safe one.
+    """
+    length = len(text)
+    while length - start > size:
+        end = find_split(text, start + size, start)
+        if end == -1 and tokenizer is not None:
+            end = force_split(tokenizer, text, start + size, start, start + size + 1)
+        if end == -1:
+            # no safe point within the window, take the first one after it
+            end = find_next_split(text, start + size)
+            if end == -1:
+                break
+        yield start, end
+        start = end
+    if start < length:
+        yield start, length
+
+
+def _last_space_split(text: str, start: int, end: int) -> int:
+    # the character after the space must be known too
+    i = text.rfind(" ", start + 1, min(end + 1, len(text) - 1))
+    while i > start:
+        if not text[i - 1].isspace() and not text[i + 1].isspace():
+            return i
+        i = text.rfind(" ", start + 1, i)
+    return -1
+
+
+def _last_newline_split(text: str, start: int, end: int) -> int:
+    # a split right after the newline at `i`
+    i = text.rfind("\n", start + 1, end)
+    while i > start:
+        if not text[i - 1].isspace() and not text[i + 1].isspace():
+            return i + 1
+        i = text.rfind("\n", start + 1, i)
+    return -1
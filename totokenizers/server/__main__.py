@@ -0,0 +1,46 @@
+"""
+Usage: python -m totokenizers.server [--unix PATH | --host HOST --port PORT] [--window-ms 2] [--preload TAG ...]
+"""
+
+import argparse
+import asyncio
+import logging
+
+from .server import TokenCountServer
+
+
+async def serve(args: argparse.Namespace):
+    server = TokenCountServer(
+        window=args.window_ms / 1000,
+        max_batch_size=args.max_batch_size,
+        max_workers=args.workers,
+        batch_threads=args.batch_threads,
+    )
+    await server.preload(args.preload)
+    listener = await server.start(args.host, args.port, args.unix)
+    address = args.unix or f"http://{args.host}:{args.port}"
+    logging.getLogger("totokenizers").info(f"Counting tokens on {address}.")
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m totokenizers.server", description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--window-ms", type=float, default=2.0, help="micro-batching window")
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, help="threads counting batches")
+    parser.add_argument("--batch-threads", type=int, default=1, help="threads per batch")
+    parser.add_argument("--preload", nargs="*", default=[], metavar="MODEL_TAG")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Load test for the token-counting sidecar.
+
+Usage: python -m totokenizers.server.loadtest [--unix PATH | --host HOST --port PORT]
+    [--model anthropic/claude-2.1] [--kind text|chat] [--concurrency 64] [--requests 5000]
+
+Each of `concurrency` clients keeps one connection open and sends requests back
+to back. Reports throughput and p50/p99 latencies.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from typing import Any, Optional
+
+from .protocol import encode_request, read_message
+
+WORDS = "the quick brown fox jumps over a lazy dog , . 2024 ünïcödé 東京 \n".split(" ")
+
+
+def make_payload(model_tag: str, kind: str, size: int, rng: random.Random) -> dict[str, Any]:
+    text = " ".join(rng.choice(WORDS) for _ in range(size // 5))
+    if kind == "text":
+        return {"model": model_tag, "text": text}
+    return {
+        "model": model_tag,
+        "messages": [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": text},
+        ],
+    }
+
+
+async def open_connection(host: str, port: int, unix_path: Optional[str]):
+    if unix_path is not None:
+        return await asyncio.open_unix_connection(unix_path)
+    return await asyncio.open_connection(host, port)
+
+
+async def request(reader, writer, method: str, path: str, payload: Any = None) -> tuple[int, Any]:
+    writer.write(encode_request(method, path, payload))
+    await writer.drain()
+    response = await read_message(reader)
+    if response is None:
+        raise ConnectionError("Connection closed by the server.")
+    status = int(response.start_line.split(" ")[1])
+    return status, json.loads(response.body)
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    rng = random.Random(0)
+    payloads = [make_payload(args.model, args.kind, args.size, rng) for _ in range(256)]
+    latencies: list[float] = []
+    errors = 0
+    remaining = args.requests
+
+    async def client():
+        nonlocal remaining, errors
+        reader, writer = await open_connection(args.host, args.port, args.unix)
+        try:
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                status, _ = await request(reader, writer, "POST", "/count", rng.choice(payloads))
+                latencies.append(time.perf_counter() - start)
+                errors += status != 200
+        finally:
+            writer.close()
+
+    # warm up the model's tokenizer before timing
+    reader, writer = await open_connection(args.host, args.port, args.unix)
+    await request(reader, writer, "POST", "/count", payloads[0])
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    _, stats = await request(reader, writer, "GET", "/stats")
+    writer.close()
+
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "model": args.model,
+        "kind": args.kind,
+        "concurrency": args.concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": quantiles[49] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+        "server_mean_batch_size": stats["mean_batch_size"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m totokenizers.server.loadtest")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="connect to this Unix socket instead of TCP")
+    parser.add_argument("--model", default="anthropic/claude-2.1")
+    parser.add_argument("--kind", choices=["text", "chat"], default="text")
+    parser.add_argument("--size", type=int, default=512, help="characters per text")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(
+        f"{report['requests']} requests ({report['errors']} errors) from "
+        f"{report['concurrency']} clients: {report['requests_per_second']:.0f} req/s, "
+        f"p50 {report['p50_ms']:.2f} ms, p99 {report['p99_ms']:.2f} ms, "
+        f"mean batch size {report['server_mean_batch_size']:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Just enough HTTP/1.1 for the sidecar and its load-test client (keep-alive, Content-Length bodies)."""
+
+import asyncio
+import json
+from typing import Any, NamedTuple, Optional
+
+MAX_HEADER_LINES = 64
+MAX_BODY_BYTES = 64 * 2**20
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class Message(NamedTuple):
+    start_line: str
+    headers: dict[str, str]
+    body: bytes
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+
+class ProtocolError(Exception):
+    def __init__(self, status: int, detail: str):
+        self.status = status
+        super().__init__(detail)
+
+
+async def read_message(reader: asyncio.StreamReader) -> Optional[Message]:
+    """Reads a request or a response, or returns None if the peer closed the connection."""
+    start_line = await reader.readline()
+    if not start_line:
+        return None
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise ProtocolError(400, "Too many headers.")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise ProtocolError(400, "Invalid Content-Length.") from None
+    if length > MAX_BODY_BYTES:
+        raise ProtocolError(413, f"Body larger than {MAX_BODY_BYTES} bytes.")
+    body = await reader.readexactly(length) if length else b""
+    return Message(start_line.decode("latin-1").rstrip("\r\n"), headers, body)
+
+
+def encode_response(status: int, payload: Any, keep_alive: bool = True) -> bytes:
+    body = json.dumps(payload).encode()
+    head = (
+        f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode() + body
+
+
+def encode_request(method: str, path: str, payload: Any = None) -> bytes:
+    body = b"" if payload is None else json.dumps(payload).encode()
+    head = (
+        f"{method} {path} HTTP/1.1\r\n"
+        "Host: localhost\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n"
+    )
+    return head.encode() + body
@@ -0,0 +1,280 @@
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Mapping, NamedTuple, Optional, Sequence
+
+from ..errors import TotokenizersError
+from ..factories import Totokenizer
+from ..parallel import available_cpus
+from ..schemas import Chat
+from .protocol import ProtocolError, encode_response, read_message
+
+logger = logging.getLogger("totokenizers")
+
+# request errors reported to the client rather than logged
+_CLIENT_ERRORS = (TotokenizersError, ValueError, KeyError, TypeError)
+
+
+class _Job(NamedTuple):
+    texts: Optional[list[str]]
+    messages: Optional[Chat]
+    functions: Optional[Sequence[Mapping]]
+
+
+@dataclass
+class ServerStats:
+    requests: int = 0
+    batches: int = 0
+    batched_jobs: int = 0
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.batched_jobs / self.batches if self.batches else 0.0
+
+
+class TokenCountServer:
+    """
+    Token counting over HTTP/1.1 (TCP or Unix socket), for services outside Python.
+
+    `POST /count` takes `{"model": <model tag>}` plus one of `"text"`, `"texts"`
+    or `"messages"` (with optional `"functions"`), and returns `{"num_tokens": ...}`,
+    a list for `"texts"`. `GET /health` and `GET /stats` are also served.
+
+    Requests for the same model that arrive within `window` seconds are counted
+    together, in one `count_tokens_batch` call for texts and one
+    `count_chatml_tokens_many` call (where available) per distinct functions.
+    Tokenizers come from the shared registry, so they stay warm across requests.
+
+    Args:
+        window: seconds to wait for more requests before counting a batch.
+        max_batch_size: requests that trigger a batch before the window ends.
+        max_workers: threads counting batches.
+        batch_threads: threads per batch, for tokenizers that parallelize it.
+    """
+
+    def __init__(
+        self,
+        window: float = 0.002,
+        max_batch_size: int = 256,
+        max_workers: Optional[int] = None,
+        batch_threads: int = 1,
+    ):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.batch_threads = batch_threads
+        self.executor = ThreadPoolExecutor(
+            max_workers or min(8, available_cpus()), thread_name_prefix="totokenizers"
+        )
+        self.stats = ServerStats()
+        self._batchers: dict[str, _MicroBatcher] = {}
+        self._loading: dict[str, asyncio.Future] = {}
+
+    async def preload(self, model_tags: Sequence[str]):
+        for model_tag in model_tags:
+            await self._batcher(model_tag)
+
+    async def start(
+        self, host: str = "127.0.0.1", port: int = 8765, unix_path: Optional[str] = None
+    ) -> asyncio.AbstractServer:
+        if unix_path is not None:
+            if os.path.exists(unix_path):
+                os.unlink(unix_path)
+            return await asyncio.start_unix_server(self.handle_connection, unix_path)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            while True:
+                try:
+                    request = await read_message(reader)
+                except ProtocolError as error:
+                    writer.write(encode_response(error.status, {"error": str(error)}, False))
+                    break
+                if request is None:
+                    break
+                status, payload = await self._route(request.start_line, request.body)
+                writer.write(encode_response(status, payload, request.keep_alive))
+                await writer.drain()
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def count(self, request: Mapping[str, Any]) -> int | list[int]:
+        """Counts one decoded `/count` request."""
+        model_tag = request.get("model")
+        if not isinstance(model_tag, str):
+            raise ValueError('"model" must be a model tag, e.g. "openai/gpt-4o".')
+        fields = [field for field in ("text", "texts", "messages") if field in request]
+        if len(fields) != 1:
+            raise ValueError('Send exactly one of "text", "texts" or "messages".')
+        if fields[0] == "text":
+            job = _Job([_check_text(request["text"])], None, None)
+        elif fields[0] == "texts":
+            if not isinstance(request["texts"], list):
+                raise TypeError('"texts" must be a list of strings.')
+            job = _Job(list(map(_check_text, request["texts"])), None, None)
+        else:
+            if not isinstance(request["messages"], list):
+                raise TypeError('"messages" must be a list of messages.')
+            job = _Job(None, request["messages"], request.get("functions") or None)
+        batcher = await self._batcher(model_tag)
+        result = await batcher.submit(job)
+        return result[0] if fields[0] == "text" else result
+
+    async def _route(self, start_line: str, body: bytes) -> tuple[int, Any]:
+        method, _, path = start_line.partition(" ")
+        path = path.rsplit(" ", 1)[0]
+        self.stats.requests += 1
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        if method == "GET" and path == "/stats":
+            return 200, {
+                "requests": self.stats.requests,
+                "batches": self.stats.batches,
+                "mean_batch_size": self.stats.mean_batch_size,
+            }
+        if method != "POST" or path != "/count":
+            return 404, {"error": f"No route for {method} {path}."}
+        try:
+            request = json.loads(body)
+            if not isinstance(request, dict):
+                raise TypeError("Expected a JSON object.")
+            return 200, {"num_tokens": await self.count(request)}
+        except _CLIENT_ERRORS as error:
+            return 400, {"error": f"{type(error).__name__}: {error}"}
+        except Exception as error:
+            logger.exception("Failed to count request.")
+            return 500, {"error": f"{type(error).__name__}: {error}"}
+
+    async def _batcher(self, model_tag: str) -> "_MicroBatcher":
+        batcher = self._batchers.get(model_tag)
+        if batcher is not None:
+            return batcher
+        # loading may download encodings, keep it off the event loop and do it once
+        loading = self._loading.get(model_tag)
+        if loading is None:
+            loop = asyncio.get_running_loop()
+            loading = loop.run_in_executor(self.executor, Totokenizer.from_model, model_tag)
+            self._loading[model_tag] = loading
+        try:
+            tokenizer = await loading
+        finally:
+            self._loading.pop(model_tag, None)
+        if model_tag not in self._batchers:
+            self._batchers[model_tag] = _MicroBatcher(self, tokenizer)
+            logger.info(f"Loaded tokenizer for {model_tag}.")
+        return self._batchers[model_tag]
+
+
+class _MicroBatcher:
+    def __init__(self, server: TokenCountServer, tokenizer):
+        self.server = server
+        self.tokenizer = tokenizer
+        self._jobs: list[tuple[_Job, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def submit(self, job: _Job) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._jobs.append((job, future))
+        if len(self._jobs) >= self.server.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.server.window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        jobs, self._jobs = self._jobs, []
+        self.server.stats.batches += 1
+        self.server.stats.batched_jobs += len(jobs)
+        task = asyncio.get_running_loop().create_task(self._run(jobs))
+        # the loop only keeps weak references to tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, jobs: list[tuple[_Job, asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                self.server.executor,
+                _count_jobs,
+                self.tokenizer,
+                [job for job, _ in jobs],
+                self.server.batch_threads,
+            )
+        except Exception as error:
+            results = [error] * len(jobs)
+        for (_, future), result in zip(jobs, results):
+            if future.cancelled():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+def _count_jobs(tokenizer, jobs: list[_Job], num_threads: int) -> list:
+    """Returns each job's counts, or its exception."""
+    try:
+        return _count_batch(tokenizer, jobs, num_threads)
+    except Exception:
+        # count one by one, so only the failing requests get the error
+        results = []
+        for job in jobs:
+            try:
+                results.append(_count_batch(tokenizer, [job], num_threads)[0])
+            except Exception as error:
+                results.append(error)
+        return results
+
+
+def _count_batch(tokenizer, jobs: list[_Job], num_threads: int) -> list:
+    texts = [text for job in jobs if job.texts is not None for text in job.texts]
+    text_counts = iter(tokenizer.count_tokens_batch(texts, num_threads=num_threads))
+    # chats sharing the same functions are counted together
+    chat_groups: dict[str, list[int]] = {}
+    for i, job in enumerate(jobs):
+        if job.messages is not None:
+            key = json.dumps(job.functions, sort_keys=True)
+            chat_groups.setdefault(key, []).append(i)
+    chat_counts = {}
+    for indices in chat_groups.values():
+        functions = jobs[indices[0]].functions
+        chats = [jobs[i].messages for i in indices]
+        chat_counts.update(zip(indices, _count_chats(tokenizer, chats, functions, num_threads)))
+    return [
+        [next(text_counts) for _ in job.texts] if job.texts is not None else chat_counts[i]
+        for i, job in enumerate(jobs)
+    ]
+
+
+def _count_chats(
+    tokenizer, chats: list[Chat], functions: Optional[Sequence[Mapping]], num_threads: int
+) -> list[int]:
+    if hasattr(tokenizer, "count_chatml_tokens_many"):
+        return tokenizer.count_chatml_tokens_many(chats, functions, num_threads=num_threads)
+    if functions:
+        return [tokenizer.count_chatml_tokens(chat, functions) for chat in chats]
+    # Anthropic's `count_chatml_tokens` takes no functions
+    return [tokenizer.count_chatml_tokens(chat) for chat in chats]
+
+
+def _check_text(text: Any) -> str:
+    if not isinstance(text, str):
+        raise TypeError("Texts must be strings.")
+    return text
@@ -0,0 +1,216 @@
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Callable, Optional
+
+from .cache import CacheStats
+
+_SCHEMA_VERSION = "1"
+
+
+class SQLiteTokenCountCache:
+    """
+    Persistent token count cache shared by every process on a host.
+
+    Drop-in replacement for `TokenCountCache` (as a tokenizer's `message_cache`
+    or `text_cache`) backed by a SQLite database in WAL mode, so concurrent
+    readers never block and writers from many processes are serialized by SQLite.
+
+    Tokenizers key persistent caches with their `encoding_fingerprint` and
+    `cache.ACCOUNTING_VERSION`, so entries are invalidated when `tokenizer.json`,
+    a tiktoken encoding or the way totokenizers counts messages changes.
+
+    Connections are closed when the cache is released (or by `close`). SQLite
+    doesn't support forking while a connection to the database is open, so
+    close the cache before starting worker processes that use the same file,
+    or create the cache in the workers.
+
+    Args:
+        path: database file, created if missing.
+        max_entries: least recently used entries beyond this are evicted.
+        ttl: seconds after which an entry is stale, `None` to keep entries forever.
+        evict_every: number of writes (per process) between eviction passes.
+    """
+
+    persistent = True
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_entries: int = 1_000_000,
+        ttl: Optional[float] = 30 * 24 * 3600,
+        evict_every: int = 1000,
+        timeout: float = 30.0,
+    ):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evict_every = evict_every
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+        self._writes = 0
+        # (pid, connection) of every thread's connection; in CPython 3.11 a
+        # connection is in a reference cycle, so it would only close on a GC pass
+        self._connections: list[tuple[int, sqlite3.Connection]] = []
+        weakref.finalize(self, _close_connections, self._connections, self._lock)
+        self._init_schema()
+
+    def get(self, key: bytes) -> Optional[int]:
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT value, created, accessed FROM counts WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (self.ttl is not None and row[1] < now - self.ttl):
+            with self._lock:
+                self._stats.misses += 1
+            return None
+        value, _, accessed = row
+        # refreshing recency on every hit would turn reads into writes
+        if now - accessed > 60:
+            self._execute("UPDATE counts SET accessed = ? WHERE key = ?", (now, key))
+        with self._lock:
+            self._stats.hits += 1
+        return value
+
+    def put(self, key: bytes, value: int):
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO counts (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+            (key, value, now, now),
+        )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.evict_every == 0
+        if evict:
+            self.evict()
+
+    def get_or_compute(self, key: bytes, compute: Callable[[], int]) -> int:
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def evict(self) -> int:
+        """Deletes stale entries and the least recently used ones beyond `max_entries`."""
+        connection = self._connection()
+        evicted = 0
+        if self.ttl is not None:
+            cursor = self._execute(
+                "DELETE FROM counts WHERE created < ?", (time.time() - self.ttl,)
+            )
+            evicted += max(cursor.rowcount, 0)
+        (entries,) = connection.execute("SELECT COUNT(*) FROM counts").fetchone()
+        if entries > self.max_entries:
+            cursor = self._execute(
+                "DELETE FROM counts WHERE key IN "
+                "(SELECT key FROM counts ORDER BY accessed LIMIT ?)",
+                (entries - self.max_entries,),
+            )
+            evicted += max(cursor.rowcount, 0)
+        with self._lock:
+            self._stats.evictions += evicted
+        return evicted
+
+    def clear(self):
+        self._execute("DELETE FROM counts")
+
+    def stats(self) -> CacheStats:
+        """Hits, misses and evictions of this process; entries and bytes of the database."""
+        connection = self._connection()
+        (entries,) = connection.execute("SELECT COUNT(*) FROM counts").fetchone()
+        (page_count,) = connection.execute("PRAGMA page_count").fetchone()
+        (page_size,) = connection.execute("PRAGMA page_size").fetchone()
+        with self._lock:
+            return CacheStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                evictions=self._stats.evictions,
+                entries=entries,
+                nbytes=page_count * page_size,
+            )
+
+    def close(self):
+        """Closes this thread's connection; the others close when the cache is released."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            with self._lock:
+                self._connections[:] = [
+                    (pid, other) for pid, other in self._connections if other is not connection
+                ]
+            connection.close()
+            self._local.connection = None
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM counts").fetchone()[0]
+
+    def _init_schema(self):
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode = WAL")
+        with _transaction(connection):
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            row = connection.execute(
+                "SELECT value FROM meta WHERE name = 'schema_version'"
+            ).fetchone()
+            if row is not None and row[0] != _SCHEMA_VERSION:
+                connection.execute("DROP TABLE IF EXISTS counts")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS counts ("
+                "key BLOB PRIMARY KEY, value INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS counts_accessed ON counts (accessed)"
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('schema_version', ?)",
+                (_SCHEMA_VERSION,),
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # one connection per thread, and never reuse one inherited through fork
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            # only this thread uses it, but `close` may close it from another one
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA synchronous = NORMAL")
+            with self._lock:
+                self._connections.append((os.getpid(), connection))
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> sqlite3.Cursor:
+        return self._connection().execute(sql, parameters)
+
+
+def _close_connections(connections: list, lock: threading.Lock):
+    # connections inherited through fork belong to the parent, leave them alone
+    pid = os.getpid()
+    with lock:
+        own = [connection for owner, connection in connections if owner == pid]
+        connections[:] = [(owner, c) for owner, c in connections if owner != pid]
+    for connection in own:
+        connection.close()
+
+
+@contextlib.contextmanager
+def _transaction(connection: sqlite3.Connection):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
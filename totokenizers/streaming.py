@@ -0,0 +1,144 @@
+import codecs
+import mmap
+import os
+from typing import Iterable, Optional
+
+from .parallel import available_cpus
+from .segmentation import find_split
+
+
+class StreamingTokenCounter:
+    """
+    Running token count of a streamed completion.
+
+    Text before the last safe split point (see `segmentation`) is counted once
+    and never again; only the tail after it is re-tokenized when a delta arrives.
+    Since tokens never cross those points, `count` is always the exact count of
+    the text received so far, and `finish()` matches the one-shot count.
+
+    Args:
+        tokenizer: any tokenizer with a `count_tokens` method.
+        initial_tokens: constant added to the count, e.g. a completion header.
+        window: tail length (in characters) above which it is split and committed.
+    """
+
+    def __init__(self, tokenizer, initial_tokens: int = 0, window: int = 256):
+        self.tokenizer = tokenizer
+        self.window = window
+        self._committed_tokens = initial_tokens
+        self._tail = ""
+        self._tail_tokens = 0
+        self._length = 0
+        self._finished = False
+
+    @classmethod
+    def for_completion(cls, tokenizer, **kwargs) -> "StreamingTokenCounter":
+        """Counter that matches `tokenizer.count_completion_tokens` (Anthropic)."""
+        return cls(tokenizer, initial_tokens=tokenizer.count_completion_tokens(""), **kwargs)
+
+    def feed(self, delta: str) -> int:
+        """Adds a text delta and returns the updated count."""
+        if self._finished:
+            raise ValueError("Cannot feed a finished counter.")
+        if not delta:
+            return self.count
+        self._length += len(delta)
+        tail = self._tail + delta
+        if len(tail) > self.window:
+            split = find_split(tail, len(tail) - 1)
+            if split != -1:
+                self._committed_tokens += self.tokenizer.count_tokens(tail[:split])
+                tail = tail[split:]
+        self._tail = tail
+        self._tail_tokens = self.tokenizer.count_tokens(tail)
+        return self.count
+
+    def finish(self) -> int:
+        """Returns the final count; no more deltas are accepted afterwards."""
+        self._finished = True
+        return self.count
+
+    @property
+    def count(self) -> int:
+        return self._committed_tokens + self._tail_tokens
+
+    @property
+    def num_chars(self) -> int:
+        """Number of characters received so far."""
+        return self._length
+
+
+def count_tokens_stream(
+    tokenizer,
+    chunks: Iterable[str | bytes],
+    window: int = 2**18,
+    num_threads: Optional[int] = None,
+    encoding: str = "utf-8",
+    errors: str = "strict",
+) -> int:
+    """
+    Counts tokens of the concatenation of `chunks` in bounded memory.
+
+    Bytes chunks are decoded incrementally, so they may split characters.
+    Text is cut at safe split points into segments of about `window`
+    characters, which are counted `num_threads` at a time (by default, one
+    per available CPU up to 8). The result equals
+    `tokenizer.count_tokens("".join(chunks))`. Text without any safe split
+    point (no single spaces or newlines between words) is buffered whole.
+    """
+    if num_threads is None:
+        num_threads = min(8, available_cpus())
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    num_tokens = 0
+    segments: list[str] = []
+    parts: list[str] = []
+    length = 0
+    # no safe split point before this index in the buffered text
+    searched = 0
+    for chunk in chunks:
+        if not isinstance(chunk, str):
+            chunk = decoder.decode(chunk)
+        parts.append(chunk)
+        length += len(chunk)
+        if length <= window:
+            continue
+        text = "".join(parts)
+        split = find_split(text, start=searched)
+        if split == -1:
+            parts = [text]
+            searched = max(len(text) - 2, 0)
+            continue
+        segments.append(text[:split])
+        parts = [text[split:]]
+        length = len(text) - split
+        searched = 0
+        if len(segments) >= num_threads:
+            num_tokens += sum(tokenizer.count_tokens_batch(segments, num_threads))
+            segments = []
+    parts.append(decoder.decode(b"", final=True))
+    segments.append("".join(parts))
+    num_tokens += sum(tokenizer.count_tokens_batch(segments, num_threads))
+    return num_tokens
+
+
+def count_file(
+    tokenizer,
+    path: str | os.PathLike,
+    window: int = 2**18,
+    num_threads: Optional[int] = None,
+    encoding: str = "utf-8",
+    errors: str = "strict",
+) -> int:
+    """
+    Counts tokens of a text file through `mmap`, see `count_tokens_stream`.
+
+    Newlines are not translated, the result is that of
+    `count_tokens(open(path, encoding=encoding, newline="").read())`.
+    """
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return count_tokens_stream(tokenizer, (), window, num_threads, encoding, errors)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            chunks = (mapped[i : i + window] for i in range(0, size, window))
+            return count_tokens_stream(tokenizer, chunks, window, num_threads, encoding, errors)
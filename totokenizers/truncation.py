@@ -0,0 +1,167 @@
+"""
+Token-exact truncation of long texts.
+
+Only a window of about `max_tokens` worth of text is tokenized, cut at a split
+point (see `segmentation`), so the tokens inside it are those of the full text.
+The window doubles until it holds `max_tokens` tokens or the whole text.
+"""
+
+import bisect
+from typing import Literal
+
+from .segmentation import find_next_split, find_split, split_after, split_before
+
+TruncationSide = Literal["end", "start", "middle"]
+
+# first window guess, most text averages 3 to 5 characters per token
+_CHARS_PER_TOKEN = 4
+
+
+def truncate_text(
+    tokenizer, text: str, max_tokens: int, side: TruncationSide = "end"
+) -> str:
+    """
+    Cuts `text` down to at most `max_tokens` tokens.
+
+    `side` is the side that is cut: "end" keeps the beginning, "start" keeps
+    the end, and "middle" keeps both, about half of the tokens each.
+    Texts that already fit are returned unchanged.
+
+    `tokenizer` must implement `count_tokens` and `_token_starts`.
+    """
+    if max_tokens <= 0:
+        return ""
+    if side == "end":
+        return text[: _keep_start(tokenizer, text, max_tokens)]
+    if side == "start":
+        return text[_keep_end(tokenizer, text, max_tokens) :]
+    if side != "middle":
+        raise ValueError(f"Unknown side {side!r}.")
+    return _keep_both(tokenizer, text, max_tokens)
+
+
+def _keep_both(tokenizer, text: str, max_tokens: int) -> str:
+    """Returns the head and tail of `text` that fit together, sharing one tokenization of each."""
+    starts, end = _prefix_starts(tokenizer, text, max_tokens)
+    if end == len(text) and len(starts) <= max_tokens:
+        return text
+    head_end = _cut_prefix(tokenizer, text, starts, end, max_tokens - max_tokens // 2)
+    tail_tokens = max_tokens // 2
+    tail_starts, begin = _suffix_starts(tokenizer, text, tail_tokens)
+    suffix = text[begin:]
+    head = text[:head_end]
+    # tokens may merge across the junction, which is re-encoded from the last
+    # split point of the head to the first one of the tail
+    base = max(split_before(tokenizer, head, len(head)), 0)
+    head_base_tokens = bisect.bisect_left(starts, base)
+    while True:
+        tail_start = begin + _cut_suffix(tokenizer, suffix, tail_starts, tail_tokens)
+        tail = text[max(tail_start, head_end) :]
+        stop = split_after(tokenizer, tail, 1)
+        if stop == -1:
+            stop = len(tail)
+        num_tokens = (
+            head_base_tokens
+            + tokenizer.count_tokens(head[base:] + tail[:stop])
+            + len(tail_starts)
+            - bisect.bisect_left(tail_starts, len(text) - len(tail) + stop - begin)
+        )
+        if tail_tokens == 0 or num_tokens <= max_tokens:
+            return head + tail
+        tail_tokens = max(tail_tokens - (num_tokens - max_tokens), 0)
+
+
+def _keep_start(tokenizer, text: str, max_tokens: int) -> int:
+    """Returns the largest token boundary `cut` such that `text[:cut]` fits."""
+    if max_tokens <= 0:
+        return 0
+    starts, end = _prefix_starts(tokenizer, text, max_tokens)
+    return _cut_prefix(tokenizer, text, starts, end, max_tokens)
+
+
+def _keep_end(tokenizer, text: str, max_tokens: int) -> int:
+    """Returns the smallest token boundary `begin` such that `text[begin:]` fits."""
+    if max_tokens <= 0:
+        return len(text)
+    starts, begin = _suffix_starts(tokenizer, text, max_tokens)
+    return begin + _cut_suffix(tokenizer, text[begin:], starts, max_tokens)
+
+
+def _prefix_starts(tokenizer, text: str, max_tokens: int) -> tuple[list[int], int]:
+    """Token starts of `text[:end]`, the whole text or at least `max_tokens` tokens."""
+    window = max_tokens * _CHARS_PER_TOKEN
+    while True:
+        end = len(text)
+        if window < len(text):
+            end = split_before(tokenizer, text, window)
+            if end == -1:
+                end = find_next_split(text, window)
+            if end == -1:
+                end = len(text)
+        starts = tokenizer._token_starts(text[:end])
+        if end == len(text) or len(starts) >= max_tokens:
+            return starts, end
+        window = 2 * max(window, end)
+
+
+def _suffix_starts(tokenizer, text: str, max_tokens: int) -> tuple[list[int], int]:
+    """Token starts of `text[begin:]`, the whole text or at least `max_tokens` tokens."""
+    window = max_tokens * _CHARS_PER_TOKEN
+    while True:
+        begin = 0
+        if window < len(text):
+            begin = split_after(tokenizer, text, len(text) - window)
+            if begin == -1:
+                begin = max(find_split(text, len(text) - window), 0)
+        starts = tokenizer._token_starts(text[begin:])
+        if begin == 0 or len(starts) >= max_tokens:
+            return starts, begin
+        window = 2 * max(window, len(text) - begin)
+
+
+def _cut_prefix(tokenizer, text: str, starts: list[int], end: int, max_tokens: int) -> int:
+    if len(starts) > max_tokens:
+        return _fit_prefix(tokenizer, text, starts, max_tokens)
+    return end
+
+
+def _cut_suffix(tokenizer, text: str, starts: list[int], max_tokens: int) -> int:
+    if max_tokens <= 0:
+        return len(text)
+    if len(starts) > max_tokens:
+        return _fit_suffix(tokenizer, text, starts, max_tokens)
+    return 0
+
+
+def _fit_prefix(tokenizer, text: str, starts: list[int], max_tokens: int) -> int:
+    # Cutting inside a pretokenized word may tokenize it differently, so the
+    # count is checked, re-encoding only from the last split point.
+    cut = starts[max_tokens]
+    base = cut + 1
+    while cut > 0:
+        if base > cut:
+            base = max(split_before(tokenizer, text, cut), 0)
+        num_tokens = bisect.bisect_left(starts, base)
+        num_tokens += tokenizer.count_tokens(text[base:cut])
+        if num_tokens <= max_tokens:
+            return cut
+        cut = starts[bisect.bisect_left(starts, cut) - 1]
+    return 0
+
+
+def _fit_suffix(tokenizer, text: str, starts: list[int], max_tokens: int) -> int:
+    # same as `_fit_prefix`, re-encoding up to the next split point
+    cut = starts[len(starts) - max_tokens]
+    end = cut - 1
+    while cut < len(text):
+        if end < cut:
+            end = split_after(tokenizer, text, cut)
+            if end == -1:
+                end = len(text)
+        num_tokens = len(starts) - bisect.bisect_left(starts, end)
+        num_tokens += tokenizer.count_tokens(text[cut:end])
+        if num_tokens <= max_tokens:
+            return cut
+        following = bisect.bisect_right(starts, cut)
+        cut = starts[following] if following < len(starts) else len(text)
+    return len(text)